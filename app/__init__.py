@@ -1,8 +1,12 @@
+import os
 from flask import Flask, Blueprint
 
 
 def create_app():
   app = Flask(__name__)
+
+  # Base64 images inflate uploads by a third, leave room for that plus the JSON
+  app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH", str(20 * 1024 * 1024)))
   
 
 
@@ -21,6 +25,23 @@ def create_app():
   from app.routes.machine_learning_route import ml_route
   app.register_blueprint(ml_route)
 
+  from app.routes.analytics import analytics_route
+  app.register_blueprint(analytics_route)
+
+  @app.cli.command("rebuild-threshold-index")
+  def rebuild_threshold_index_command():
+    """Rebuild threshold_index from every aquarium's thresholds."""
+    from app.services.firebase import rebuild_threshold_index
+    index = rebuild_threshold_index()
+    print(f"Indexed {len(index)} aquariums")
+
+  @app.cli.command("migrate-schedule-keys")
+  def migrate_schedule_keys_command():
+    """Re-key auto_feeder schedules from push ids to HH:MM times."""
+    from app.services.firebase import migrate_all_schedule_keys
+    moved = migrate_all_schedule_keys()
+    print(f"Moved {sum(moved.values())} schedules across {len(moved)} aquariums")
+
 
   
 
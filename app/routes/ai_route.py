@@ -1,21 +1,86 @@
-from flask import Blueprint, request, jsonify
-from app.services.ai import ask_gemini
+import json
+from flask import Blueprint, Response, request, jsonify
+from app.services.ai import ask_gemini, ask_gemini_stream
+from app.services.chat_storage import is_valid_session_id
+from app.services.image_pipeline import MAX_IMAGE_BYTES
 
 ai_bp = Blueprint('ai', __name__, url_prefix='/')
 
-@ai_bp.route("/ask", methods=["POST"])
-def ask_gemini_route():
-    data = request.json
+def read_ask_request():
+    """Parse an /ask body. Returns (text, image, session_id, error response)."""
+    if request.mimetype == "multipart/form-data":
+        # Raw upload, skips the base64 inflation of JSON bodies
+        data = request.form
+        upload = request.files.get("image")
+        image = upload.read(MAX_IMAGE_BYTES + 1) if upload else None
+        if image and len(image) > MAX_IMAGE_BYTES:
+            return None, None, None, (jsonify({"Error": f"Image is larger than {MAX_IMAGE_BYTES} bytes"}), 413)
+    else:
+        data = request.get_json(silent=True) or {}
+        image = data.get("image")
+
     text = data.get("question")
-    image = data.get("image")
+    session_id = data.get("session_id")
 
     if not text and not image:
-        return jsonify({"Error": "At least give a question or an image"}), 400
+        return None, None, None, (jsonify({"Error": "At least give a question or an image"}), 400)
+
+    if session_id is not None and not is_valid_session_id(session_id):
+        return None, None, None, (jsonify({"Error": "session_id may only contain letters, digits, '-' and '_' (max 64)"}), 400)
+
+    return text, image, session_id, None
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@ai_bp.route("/ask", methods=["POST"])
+def ask_gemini_route():
+    text, image, session_id, error = read_ask_request()
+    if error:
+        return error
 
     # Call the service function
     response, status_code = ask_gemini(
         text=text,
-        image=image
+        image=image,
+        session_id=session_id
     )
     
-    return jsonify(response), status_code
\ No newline at end of file
+    return jsonify(response), status_code
+
+@ai_bp.route("/ask/stream", methods=["POST"])
+def ask_gemini_stream_route():
+    text, image, session_id, error = read_ask_request()
+    if error:
+        return error
+
+    response, status_code = ask_gemini_stream(
+        text=text,
+        image=image,
+        session_id=session_id
+    )
+    if status_code != 200:
+        return jsonify(response), status_code
+
+    chunks = response["chunks"]
+
+    def events():
+        try:
+            yield sse_event("session", {"session_id": response["session_id"]})
+            for piece in chunks:
+                yield sse_event("chunk", {"text": piece})
+        except Exception as e:
+            yield sse_event("error", {"Error": f"Gemini API error: {str(e)}"})
+            return
+        finally:
+            # Runs on client disconnect too, which stores the partial answer
+            chunks.close()
+        yield sse_event("done", {})
+
+    stream = Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    # A generator closed before its first event skips its finally block
+    stream.call_on_close(chunks.close)
+    return stream
@@ -0,0 +1,37 @@
+from flask import Blueprint, request, jsonify
+import logging
+from app.services.analytics import fleet_rollups, PERIODS
+
+analytics_route = Blueprint("analytics", __name__)
+logger = logging.getLogger(__name__)
+
+
+@analytics_route.route("/analytics/rollups", methods=["GET"])
+def get_rollups():
+    """
+    Weekly or monthly rollups of daily averages across the fleet.
+
+    Query Params:
+        - period (str): "week" (default) or "month"
+        - aquarium_ids (str, optional): Comma separated ids, defaults to all aquariums
+
+    Returns:
+        JSON: Per-aquarium mean/min/max per sensor and fleet percentiles.
+    """
+    period = request.args.get("period", "week")
+    if period not in PERIODS:
+        return jsonify({"error": f"period must be one of {list(PERIODS)}"}), 400
+
+    aquarium_ids = None
+    raw_ids = request.args.get("aquarium_ids")
+    if raw_ids:
+        try:
+            aquarium_ids = [int(i) for i in raw_ids.split(",") if i.strip()]
+        except ValueError:
+            return jsonify({"error": "aquarium_ids must be comma separated integers"}), 400
+
+    try:
+        return jsonify(fleet_rollups(period, aquarium_ids)), 200
+    except Exception as e:
+        logger.exception("Failed to compute rollups")
+        return jsonify({"error": str(e)}), 500
@@ -14,9 +14,11 @@ def ml_result():
         if not firebase_thresholds:
             return jsonify({"error": "No Firebase thresholds found"}), 500
 
-        compare_ml_firebase(data, firebase_thresholds)
+        # ?cache=false forces fresh Gemini suggestions
+        use_cache = request.args.get("cache", "true").lower() not in ["false", "0", "no"]
+        result = compare_ml_firebase(data, firebase_thresholds, use_cache=use_cache)
 
-        return jsonify({"message": "ML comparison completed successfully"}), 200
+        return jsonify({"message": "ML comparison completed successfully", **result}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
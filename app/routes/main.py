@@ -1,4 +1,9 @@
-from flask import Blueprint, request, render_template
+from flask import Blueprint, request, render_template, jsonify
+from app.services import firebase
+from app.services.ai import answer_cache, gemini
+from app.services.notification import dispatcher
+from app.services.tank_pi import tank_pi
+from app.services.firestore import outbox, due_tasks
 
 main_bp = Blueprint("main",__name__)
 
@@ -6,3 +11,20 @@ main_bp = Blueprint("main",__name__)
 def index():
   return render_template("index.html")
 
+
+@main_bp.route('/metrics')
+def metrics():
+  """Expose in-process cache and worker counters as JSON."""
+  metrics = {
+    "config_cache": firebase.config_cache.stats(),
+    "notifications": dispatcher.stats(),
+    "ml_suggestion_cache": firebase.suggestion_cache.stats(),
+    "ai_answer_cache": answer_cache.stats(),
+    "gemini": gemini.stats(),
+    "tank_pi": tank_pi.stats(),
+    "tank_pi_outbox": outbox.stats(),
+    "due_tasks": due_tasks.stats()
+  }
+  if firebase.sensor_buffer:
+    metrics["sensor_buffer"] = firebase.sensor_buffer.stats()
+  return jsonify(metrics), 200
@@ -10,9 +10,9 @@ from app.services.firebase import (
 )
 from app.services.firestore import (
     create_schedule,
-    send_schedule_raspi,
+    create_schedules_bulk,
     delete_schedule_by_id,
-    set_complete_task, send_deletion_raspi, get_scheduler_aquarium
+    set_complete_task, get_scheduler_aquarium, PENDING_PAGE_SIZE
 )
 
 schedule_route = Blueprint("schedule", __name__)
@@ -44,6 +44,8 @@ def add_schedule(aquarium_id):
         result = add_schedule_firebase(aquarium_id, schedule_data)
         logger.info(f"Added new feeding schedule for Aquarium ID {aquarium_id}: {schedule_data}")
         return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.exception(f"Failed to add feeding schedule for Aquarium ID {aquarium_id}")
         return jsonify({"error": str(e)}), 500
@@ -65,6 +67,8 @@ def delete_schedule(aquarium_id, time):
         result = delete_schedule_firebase(aquarium_id, time)
         logger.info(f"Deleted feeding schedule for Aquarium ID {aquarium_id} at {time}")
         return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.exception(f"Failed to delete schedule for Aquarium ID {aquarium_id} at {time}")
         return jsonify({"error": str(e)}), 500
@@ -87,6 +91,8 @@ def update_cycle(aquarium_id, time, cycle):
         result = change_cycle_schedule_firebase(aquarium_id, time, cycle)
         logger.info(f"Updated feeding cycle for Aquarium ID {aquarium_id} at {time} to {cycle}")
         return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.exception(f"Failed to update feeding cycle for Aquarium ID {aquarium_id}")
         return jsonify({"error": str(e)}), 500
@@ -110,6 +116,8 @@ def update_schedule_switch(aquarium_id, time, switch):
         result = set_on_off_schedule_firebase(aquarium_id, switch_value, time)
         logger.info(f"Updated switch for Aquarium ID {aquarium_id} at {time} to {switch_value}")
         return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.exception(f"Failed to update schedule switch for Aquarium ID {aquarium_id}")
         return jsonify({"error": str(e)}), 500
@@ -139,7 +147,10 @@ def get_schedules(aquarium_id):
 @schedule_route.route("/task/<int:aquarium_id>", methods=["POST"])
 def add_task(aquarium_id):
     """
-    Add a scheduled feeding task to Firestore and send it to Raspberry Pi.
+    Add a scheduled feeding task to Firestore and queue it for the Raspberry Pi.
+
+    Returns once the task and its outbox command are committed. Delivery
+    state shows up as `delivery` on the task document.
 
     JSON Body:
         - schedule_time (str): The scheduled feeding time (e.g. '2025-10-20 15:30:00')
@@ -158,26 +169,65 @@ def add_task(aquarium_id):
         food = json_req.get("food")
         job_id = f"{aquarium_id}_schedule_at_{schedule_time}"
 
-        create_schedule(
+        result = create_schedule(
             aquarium_id=aquarium_id,
             cycle=json_req["cycle"],
             schedule_time=schedule_time,
             job_id=job_id,
             food=food
         )
-        send_schedule_raspi(aquarium_id, json_req["cycle"], schedule_time, food, job_id)
+        if isinstance(result, Exception):
+            raise result
 
-        logger.info(f"Created and sent schedule for Aquarium ID {aquarium_id} at {schedule_time}")
+        logger.info(f"Created and queued schedule for Aquarium ID {aquarium_id} at {schedule_time}")
         return jsonify({"message": "Successfully added the schedule"}), 200
     except Exception as e:
         logger.exception(f"Failed to create schedule for Aquarium ID {aquarium_id}")
         return jsonify({"error": str(e)}), 500
 
 
+MAX_BULK_TASKS = 2000
+
+
+@schedule_route.route("/task/bulk/<int:aquarium_id>", methods=["POST"])
+def add_tasks_bulk(aquarium_id):
+    """
+    Add many scheduled feeding tasks at once and queue them for the Raspberry Pi.
+
+    Safe to retry: tasks that already exist are reported instead of created again.
+
+    JSON Body:
+        - tasks (list): Items with schedule_time ('2025-10-20 15:30:00'), cycle (int) and food (str)
+
+    Args:
+        aquarium_id (int): The aquarium ID.
+
+    Returns:
+        JSON: Per-task outcomes in request order, or error details.
+    """
+    try:
+        json_req = request.get_json(silent=True) or {}
+        tasks = json_req.get("tasks")
+
+        if not isinstance(tasks, list) or not tasks:
+            return jsonify({"error": "Expected a non-empty 'tasks' list"}), 400
+        if len(tasks) > MAX_BULK_TASKS:
+            return jsonify({"error": f"At most {MAX_BULK_TASKS} tasks per request"}), 413
+
+        results = create_schedules_bulk(aquarium_id, tasks)
+        created = sum(result["status"] == "created" for result in results)
+
+        logger.info(f"Bulk added {created} of {len(tasks)} schedules for Aquarium ID {aquarium_id}")
+        return jsonify({"message": "Bulk tasks processed", "created": created, "results": results}), 200
+    except Exception as e:
+        logger.exception(f"Failed to bulk create schedules for Aquarium ID {aquarium_id}")
+        return jsonify({"error": str(e)}), 500
+
+
 @schedule_route.route("/task/delete/<int:aquarium_id>", methods=["POST"])
 def delete_task(aquarium_id):
     """
-    Delete a scheduled feeding task from Firestore.
+    Delete a scheduled feeding task from Firestore and queue its removal on the Raspberry Pi.
 
     JSON Body:
         - document_id (str): The Firestore document ID of the schedule to delete.
@@ -197,7 +247,6 @@ def delete_task(aquarium_id):
             return jsonify({"error": "Missing required field 'document_id'"}), 400
 
         delete_schedule_by_id(aquarium_id=aquarium_id, document_id=document_id)
-        send_deletion_raspi(aquarium_id=aquarium_id, document_id=document_id)
 
         logger.info(f"Deleted schedule for Aquarium ID {aquarium_id}, Document ID: {document_id}")
         return jsonify({"message": "Successfully removed the schedule"}), 200
@@ -228,28 +277,38 @@ def task_complete(document_id):
 
 @schedule_route.route("/get_pending/<int:aquarium_id>")
 def get_pending_jobs(aquarium_id):
-  """List pending one-time schedules for an aquarium.
+  """List pending one-time schedules for an aquarium, one page at a time.
 
   Retrieves pending Firestore-backed schedules that may need re-scheduling
-  or dispatch after a restart.
+  or dispatch after a restart, ordered by schedule_time.
+
+  Query Params:
+    - page_size (int): Tasks per page, default 50, max 500.
+    - start_after (str): `next_cursor` of the previous page.
+    - fields (str): Comma-separated columns to return, default "cycle,food,schedule_time".
 
   Args:
     aquarium_id (int): The aquarium identifier.
 
   Returns:
-    Response: JSON with a list of pending schedule documents.
+    Response: JSON with a (possibly empty) list of pending schedules and the
+    cursor of the next page, or null on the last page.
   """
 
   try:
-    pending = get_scheduler_aquarium(aquarium_id)
+    page_size = request.args.get("page_size", type=int) or PENDING_PAGE_SIZE
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()] or None
+    page = get_scheduler_aquarium(
+      aquarium_id,
+      page_size=page_size,
+      start_after=request.args.get("start_after"),
+      fields=fields
+    )
     logger.info("Sucessfully Get the pending aquariums schedules")
-    return jsonify({"pending_aquariums" : pending}), 200
-
+    return jsonify({"pending_aquariums" : page["tasks"], "next_cursor": page["next_cursor"]}), 200
 
+  except ValueError as e:
+      return jsonify({"error": str(e)}), 400
   except Exception as e:
       logger.error(f"Error: {e}")
       return jsonify({"error": str(e)}), 500
-  
-
-    
-    
\ No newline at end of file
@@ -1,25 +1,58 @@
 from flask import jsonify, Blueprint, request
-from app.services import db, save_sensors, initialize_data_firebase, save_hourly, check_threshold
+from app.services import firebase
+from app.services.firebase import (
+    FirebaseReference,
+    initialize_data_firebase,
+    ingest_sensors,
+    ingest_sensors_batch,
+    save_hourly,
+    check_threshold
+)
 
 
 sensors_bp = Blueprint("sensor", __name__)
 
+MAX_BATCH_SIZE = 500
+
 @sensors_bp.route("/<int:aquarium_id>/sensors", methods=["GET", "POST"])
 def sensors(aquarium_id):
     if request.method == "POST":
         data = request.json
-        initialize_data_firebase(aquarium_id)
-        save_sensors(aquarium_id, data)
-        check_threshold(aquarium_id, data)
+        ingest_sensors(aquarium_id, data)
         return jsonify({"Message": "Successfully received", "Data": data}), 200
 
     elif request.method == "GET":
+        buffered = firebase.sensor_buffer.latest(aquarium_id, "sensors") if firebase.sensor_buffer else None
+        if buffered:
+            return jsonify({"Message": "Success", "Data": buffered}), 200
+
         ref = FirebaseReference(aquarium_id)
         sensors_data = ref.get_ref("sensors").get()  # Fetch the latest sensor readings
         if not sensors_data:
             return jsonify({"Message": "No sensor data found"}), 404
         return jsonify({"Message": "Success", "Data": sensors_data}), 200
 
+@sensors_bp.route("/sensors/batch", methods=["POST"])
+def sensors_batch():
+    """Ingest readings for many aquariums in one request.
+
+    JSON Body:
+        - readings (list): Items with aquarium_id, ph, temperature and turbidity.
+
+    Returns:
+        JSON: Per-item results in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    readings = data.get("readings") if isinstance(data, dict) else None
+
+    if not isinstance(readings, list) or not readings:
+        return jsonify({"Message": "Missing 'readings' list"}), 400
+    if len(readings) > MAX_BATCH_SIZE:
+        return jsonify({"Message": f"At most {MAX_BATCH_SIZE} readings per batch"}), 413
+
+    results = ingest_sensors_batch(readings)
+    return jsonify({"Message": "Batch processed", "Results": results}), 200
+
 @sensors_bp.route("/<int:aquarium_id>/hourly_log", methods = ["POST"])
 def hourly_log(aquarium_id):
   data = request.json
@@ -28,8 +61,3 @@ def hourly_log(aquarium_id):
   check_threshold(aquarium_id, data)
 
   return jsonify({"Message" : "Sucessful"}), 200
-
-
-
-  
-
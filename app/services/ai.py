@@ -1,12 +1,15 @@
 
 import os
+import re
 import json
-import base64
-import io
-from PIL import Image
+import time
+import unicodedata
 import google.generativeai as genai
 from dotenv import load_dotenv
-from .chat_storage import  store_ai_chat, load_message
+from .chat_storage import  store_ai_chat, load_message, new_session_id
+from .image_pipeline import ImageRejected, decode_base64_payload, prepare_image
+from .text_cache import TextCache
+from .gemini_client import GeminiClient, GeminiUnavailable, gemini_settings
 
 load_dotenv()
 
@@ -35,25 +38,93 @@ def initialize_gemini():
 
 model = initialize_gemini()
 
-def decode_base64_image(base64_str):
-    try:
-        if "," in base64_str:
-            base64_str = base64_str.split(",", 1)[1]
-        image_bytes = base64.b64decode(base64_str)
-        return Image.open(io.BytesIO(image_bytes))
-    except Exception as e:
-        print(f"Error decoding image: {e}")
+# Every Gemini call goes through this budget so AI slowness stays contained
+gemini = GeminiClient(**gemini_settings())
+
+# Answers to stateless text-only questions, keyed by the normalized question
+answer_cache = TextCache(
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+    path=os.getenv("ANSWER_CACHE_PATH") or None
+)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "true").lower() in ["true", "1", "yes"]
+ANSWER_CACHE_STEM = os.getenv("ANSWER_CACHE_STEM", "false").lower() in ["true", "1", "yes"]
+
+# Words that make a question lean on earlier turns ("what about them?")
+FOLLOW_UP_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their",
+    "he", "she", "him", "her", "above", "previous", "earlier", "again",
+    "same", "else", "instead", "more", "also"
+}
+
+STEM_SUFFIXES = ("ing", "ies", "ed", "es", "ly", "s")
+
+def stem_word(word):
+    """Strip one common English suffix, keeping at least three letters."""
+    for suffix in STEM_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+def normalize_question(text, stem=None):
+    """Fold case, unicode forms, punctuation and whitespace of a question.
+
+    With `stem` (default ANSWER_CACHE_STEM) a light suffix stemmer is applied,
+    so "guppies" and "guppy" share an entry.
+    """
+    stem = ANSWER_CACHE_STEM if stem is None else stem
+    folded = unicodedata.normalize("NFKC", text).casefold()
+    words = re.findall(r"[^\W_]+", folded)
+    if stem:
+        words = [stem_word(word) for word in words]
+    return " ".join(words)
+
+def answer_cache_key(text, chat_history):
+    """Return the cache key of a text-only question, or None to bypass the cache.
+
+    A question opening a conversation is always cacheable. Later in a
+    conversation the answer skips the greeting, so it is cached separately,
+    and only if the question does not refer back to earlier turns.
+    """
+    if not ANSWER_CACHE_ENABLED:
         return None
-def ask_gemini(text=None, image=None):
-    if not model:
-        return {"Error": "Gemini AI not properly initialized. Check API key configuration."}, 500
 
-    if not text and not image:
-        return {"Error": "At least give a question or an image"}, 400
+    words = normalize_question(text, stem=False).split()
+    if not words:
+        return None
+
+    if not chat_history:
+        return "new:" + normalize_question(text)
+    if FOLLOW_UP_WORDS.isdisjoint(words):
+        return "followup:" + normalize_question(text)
+    return None
 
-    # Load recent conversation (last 10 messages)
-    chat_history = load_message(limit=10)
+def load_image(image):
+    """Turn a base64 string or raw upload bytes into a compact Gemini image part."""
+    image_bytes = decode_base64_payload(image) if isinstance(image, str) else image
+    return prepare_image(image_bytes)
 
+def prepare_turn(text=None, image=None, session_id=None):
+    """Load what one /ask turn of a session needs.
+
+    Returns:
+        tuple: (Gemini contents, answer cache key or None)
+
+    Raises:
+        ImageRejected: If the image cannot be decoded or exceeds the limits.
+    """
+    # Reject unusable images before touching the chat history
+    image_data = load_image(image) if image else None
+
+    # Load recent conversation of this session (last 10 messages)
+    chat_history = load_message(session_id, limit=10)
+
+    contents = build_contents(text, image_data, chat_history)
+    cache_key = answer_cache_key(text, chat_history) if text and not image else None
+    return contents, cache_key
+
+def build_contents(text, image_data, chat_history):
+    """Build the Gemini request for one /ask turn from the session history."""
     # Prepare messages for Gemini, keeping your instructions intact
     prompts = []
     for msg in chat_history:
@@ -66,9 +137,8 @@ def ask_gemini(text=None, image=None):
     if text:
         prompts.append("User: " + text)
 
-    
     # Text only
-    if text and not image:
+    if text and not image_data:
         instruction = (
             "Your name is Aquabot. If a question is not related to aquatic life or aquarium and fish, "
             "please respond like 'Oops, I can only answer questions about aquatic life and the wonders of the water world. "
@@ -79,21 +149,10 @@ def ask_gemini(text=None, image=None):
             "Provide the response in a simple plain text paragraph. "
             "User: "
         )
-        modified_question = instruction + text
-        try:
-            response = model.generate_content(prompts + [modified_question])
-            
-            # Store messages in Firebase
-            if text:
-                store_ai_chat("user", text)
-            store_ai_chat("ai", response.text)
-            
-            return {"AI_Response": response.text}, 200
-        except Exception as e:
-            return {"Error": f"Gemini API error: {str(e)}"}, 500
+        return prompts + [instruction + text]
 
     # Image only
-    elif image and not text:
+    elif image_data and not text:
         detection_prompt = (
             "You are Aquabot, an expert in aquatic life. "
             "Please examine the image of a fish and describe what species it is, and then tell me the ideal water parameters "
@@ -105,20 +164,7 @@ def ask_gemini(text=None, image=None):
             "Do not return JSON. Just explain it clearly as Aquabot would.\n"
             "Avoid using bold text. Start with: 'Hi, I'm Aquabot, happy to serve you!'"
         )
-
-        image_data = decode_base64_image(image)
-        if not image_data:
-            return {"Error": "Failed to decode image"}, 400
-
-        try:
-            response = model.generate_content(prompts + [detection_prompt, image_data])
-            
-            # Store AI message
-            store_ai_chat("ai", response.text)
-            
-            return {"AI_Response": response.text}, 200
-        except Exception as e:
-            return {"Error": f"Gemini API failed: {str(e)}"}, 500
+        return prompts + [detection_prompt, image_data]
 
     # Text + Image
     else:
@@ -130,23 +176,133 @@ def ask_gemini(text=None, image=None):
             "Do not use bold text. "
             "User: "
         )
-        modified_question = instruction + text
-        image_data = decode_base64_image(image)
-        if not image_data:
-            return {"Error": "Failed to decode image"}, 400
+        return prompts + [instruction + text, image_data]
+
+def ask_gemini(text=None, image=None, session_id=None):
+    if not model:
+        return {"Error": "Gemini AI not properly initialized. Check API key configuration."}, 500
 
+    if not text and not image:
+        return {"Error": "At least give a question or an image"}, 400
+
+    session_id = session_id or new_session_id()
+
+    try:
+        contents, cache_key = prepare_turn(text, image, session_id)
+    except ImageRejected as e:
+        return {"Error": f"Failed to decode image: {e}"}, 400
+
+    answer = answer_cache.get(cache_key) if cache_key else None
+
+    try:
+        if answer is None:
+            start = time.perf_counter()
+            answer = gemini.generate(model, contents).text
+            if cache_key:
+                answer_cache.put(cache_key, answer, cost_ms=(time.perf_counter() - start) * 1000)
+
+        # Store messages in Firebase
+        if text:
+            store_ai_chat("user", text, session_id)
+        store_ai_chat("ai", answer, session_id)
+
+        return {"AI_Response": answer, "session_id": session_id}, 200
+    except GeminiUnavailable as e:
+        return {"Error": str(e)}, 503
+    except Exception as e:
+        return {"Error": f"Gemini API error: {str(e)}"}, 500
+
+def ask_gemini_stream(text=None, image=None, session_id=None):
+    """Start a streamed /ask answer.
+
+    Validation and image errors are returned before anything is streamed.
+
+    Returns:
+        tuple: ({"chunks": RelayStream of text pieces, "session_id": ...}, 200)
+            or ({"Error": ...}, status).
+    """
+    if not model:
+        return {"Error": "Gemini AI not properly initialized. Check API key configuration."}, 500
+
+    if not text and not image:
+        return {"Error": "At least give a question or an image"}, 400
+
+    session_id = session_id or new_session_id()
+
+    try:
+        contents, cache_key = prepare_turn(text, image, session_id)
+    except ImageRejected as e:
+        return {"Error": f"Failed to decode image: {e}"}, 400
+
+    answer = answer_cache.get(cache_key) if cache_key else None
+    if answer is not None:
+        # A cached answer goes out as a single chunk
+        response = [answer]
+        cache_key = None
+    else:
         try:
-            response = model.generate_content(prompts + [modified_question, image_data])
-            
-            # Store both messages
-            if text:
-                store_ai_chat("user", text)
-            store_ai_chat("ai", response.text)
-            
-            return {"AI_Response": response.text}, 200
+            response = gemini.generate(model, contents, stream=True)
+        except GeminiUnavailable as e:
+            return {"Error": str(e)}, 503
         except Exception as e:
             return {"Error": f"Gemini API error: {str(e)}"}, 500
-        
+
+    return {"chunks": RelayStream(response, text, session_id, cache_key), "session_id": session_id}, 200
+
+class RelayStream:
+    """Iterator of the text of each streamed chunk that stores the turn when done.
+
+    The turn is stored once the answer ends, fails mid-answer or `close()` is
+    called, e.g. on client disconnect, so a partial answer is persisted too.
+    Unlike a generator, `close()` also works before the first chunk was read,
+    and it always closes the upstream response. Only complete answers are
+    put in the answer cache.
+    """
+
+    def __init__(self, response, text, session_id, cache_key=None):
+        self.response = response
+        self.text = text
+        self.session_id = session_id
+        self.cache_key = cache_key
+        self.parts = []
+        self._iterator = iter(response)
+        self._start = time.perf_counter()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self._closed:
+            try:
+                chunk = next(self._iterator)
+            except StopIteration:
+                if self.cache_key and self.parts:
+                    answer_cache.put(self.cache_key, "".join(self.parts), cost_ms=(time.perf_counter() - self._start) * 1000)
+                self.close()
+                raise
+            except Exception:
+                self.close()
+                raise
+            piece = chunk if isinstance(chunk, str) else chunk.text
+            if piece:
+                self.parts.append(piece)
+                return piece
+        raise StopIteration
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if hasattr(self.response, "close"):
+                self.response.close()
+        finally:
+            if self.text:
+                store_ai_chat("user", self.text, self.session_id)
+            if self.parts:
+                store_ai_chat("ai", "".join(self.parts), self.session_id)
+
 def ask_gemini_suggestions_ml(text: str):
     """
     Sends the given ML prediction and threshold data to Gemini
@@ -167,5 +323,6 @@ def ask_gemini_suggestions_ml(text: str):
     )
     
 
-    response = model.generate_content([instruction, text])
+    # Runs on the ML suggestion pool, so it may queue up to the full deadline
+    response = gemini.generate(model, [instruction, text], wait=gemini.timeout)
     return response.text
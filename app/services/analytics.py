@@ -0,0 +1,156 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+
+from . import db
+from .firebase import FirebaseReference, SENSOR_LABELS, DAILY_SLOTS, children, list_aquarium_ids, local_today
+
+logger = logging.getLogger(__name__)
+
+SENSORS = list(SENSOR_LABELS)
+PERIODS = {"week": 7, "month": 30}
+FLEET_PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def read_average_window(aquarium_id) -> list:
+    """Read the `average` ring of an aquarium, oldest day first."""
+    ref = FirebaseReference(aquarium_id)
+    window = children(ref.get_ref("average").get())
+
+    index = window.get("index") or 0
+    days = []
+    # The slot after `index` is the oldest entry once the ring has wrapped
+    for offset in range(1, DAILY_SLOTS + 1):
+        slot = str((index + offset - 1) % DAILY_SLOTS + 1)
+        if isinstance(window.get(slot), dict):
+            days.append(window[slot])
+    return days
+
+
+def load_average_windows(aquarium_ids, max_workers: int = 8, today=None) -> np.ndarray:
+    """Load daily averages of many aquariums into one columnar array.
+
+    Reads run concurrently. Each record is placed by its "date", so the last
+    column is always `today` (local) and a day without a record stays NaN.
+    Records older than DAILY_SLOTS days, and undated records written before
+    records carried a date, are left out. Several records on one date are
+    averaged.
+
+    Returns:
+        np.ndarray: Shape (len(aquarium_ids), len(SENSORS), DAILY_SLOTS), days
+        last so every reduction runs over contiguous memory.
+    """
+    values = np.full((len(aquarium_ids), len(SENSORS), DAILY_SLOTS), np.nan)
+    if not aquarium_ids:
+        return values
+    today = today or local_today()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        windows = list(pool.map(read_average_window, aquarium_ids))
+
+    totals = np.zeros(values.shape)
+    counts = np.zeros(values.shape)
+    for row, days in enumerate(windows):
+        for day in days:
+            try:
+                age = (today - date.fromisoformat(day["date"])).days
+            except (KeyError, TypeError, ValueError):
+                continue
+            if not 0 <= age < DAILY_SLOTS:
+                continue
+            column = DAILY_SLOTS - 1 - age
+            for s, sensor in enumerate(SENSORS):
+                value = day.get(sensor)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[row, s, column] += value
+                    counts[row, s, column] += 1
+
+    np.divide(totals, counts, out=values, where=counts > 0)
+    return values
+
+
+def compute_rollups(values: np.ndarray, days: int) -> dict:
+    """Vectorized rollup over the last `days` columns (calendar days) of `values`.
+
+    Returns:
+        dict: Arrays of shape (aquariums, sensors) for "mean", "min", "max"
+        and "count", plus "fleet" percentiles of the per-aquarium means with
+        shape (len(FLEET_PERCENTILES), sensors).
+    """
+    window = values[:, :, -days:]
+    missing = np.isnan(window)
+    count = window.shape[2] - missing.sum(axis=2)
+    has_data = count > 0
+
+    # Masked reductions are several times faster than np.nanmean and friends
+    total = np.where(missing, 0.0, window).sum(axis=2)
+    mean = np.divide(total, count, out=np.full(total.shape, np.nan), where=has_data)
+    low = np.where(has_data, np.where(missing, np.inf, window).min(axis=2), np.nan)
+    high = np.where(has_data, np.where(missing, -np.inf, window).max(axis=2), np.nan)
+
+    fleet = np.full((len(FLEET_PERCENTILES), values.shape[1]), np.nan)
+    for s in range(values.shape[1]):
+        column = mean[:, s]
+        column = column[has_data[:, s]]
+        if column.size:
+            fleet[:, s] = np.percentile(column, FLEET_PERCENTILES)
+
+    return {"mean": mean, "min": low, "max": high, "count": count, "fleet": fleet}
+
+
+def _clean(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
+
+
+def format_rollups(aquarium_ids, rollups: dict, period: str) -> dict:
+    """Turn rollup arrays into a JSON-friendly dict."""
+    aquariums = {}
+    for row, aquarium_id in enumerate(aquarium_ids):
+        aquariums[str(aquarium_id)] = {
+            sensor: {
+                "mean": _clean(rollups["mean"][row, s]),
+                "min": _clean(rollups["min"][row, s]),
+                "max": _clean(rollups["max"][row, s]),
+                "days": int(rollups["count"][row, s])
+            }
+            for s, sensor in enumerate(SENSORS)
+        }
+
+    fleet = {
+        sensor: {f"p{p}": _clean(rollups["fleet"][i, s]) for i, p in enumerate(FLEET_PERCENTILES)}
+        for s, sensor in enumerate(SENSORS)
+    }
+
+    return {"period": period, "days": PERIODS[period], "aquariums": aquariums, "fleet": fleet}
+
+
+def fleet_rollups(period: str = "week", aquarium_ids=None) -> dict:
+    """Compute weekly or monthly rollups for the given (or all) aquariums."""
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}', expected one of {list(PERIODS)}")
+
+    if aquarium_ids is None:
+        aquarium_ids = list_aquarium_ids()
+
+    values = load_average_windows(aquarium_ids)
+    rollups = compute_rollups(values, PERIODS[period])
+    return format_rollups(aquarium_ids, rollups, period)
+
+
+def run_rollup_job():
+    """Scheduled job: store weekly and monthly rollups under `analytics`."""
+    aquarium_ids = list_aquarium_ids()
+    values = load_average_windows(aquarium_ids)
+    generated_at = datetime.now().isoformat()
+
+    updates = {}
+    for period, days in PERIODS.items():
+        result = format_rollups(aquarium_ids, compute_rollups(values, days), period)
+        result["generated_at"] = generated_at
+        updates[f"rollups/{period}"] = result
+
+    db.reference("analytics").update(updates)
+    logger.info(f"Stored fleet rollups for {len(aquarium_ids)} aquariums")
@@ -1,27 +1,156 @@
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+from collections import deque, OrderedDict
 from datetime import datetime
 from . import db
 
+logger = logging.getLogger(__name__)
 
-def store_ai_chat(role: str, message: str):
-    ref = db.reference("chats")
-    
+# Recent messages kept in memory per session so history reads rarely hit the database
+TAIL_SIZE = 50
+MAX_CACHED_SESSIONS = int(os.getenv("CHAT_CACHED_SESSIONS", "1000"))
+
+# Sessions idle this long are trimmed to their last CHAT_COMPACT_KEEP messages
+SESSION_IDLE_SECONDS = float(os.getenv("CHAT_SESSION_IDLE_HOURS", "6")) * 3600
+SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_DAYS", "30")) * 86400
+COMPACT_KEEP = int(os.getenv("CHAT_COMPACT_KEEP", "20"))
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# session_id -> deque of recent messages, or absent if not loaded yet
+_tails = OrderedDict()
+_tail_lock = threading.Lock()
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id) -> bool:
+    """Session ids become RTDB keys, so only URL-safe characters are allowed."""
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+def session_path(session_id: str) -> str:
+    return f"chat_sessions/{session_id}"
+
+
+def store_ai_chat(role: str, message: str, session_id: str):
     # Safe timestamp for Firebase keys
     timestamp = datetime.now().isoformat().replace(":", "-").replace(".", "-")
-    
-    ref.child(timestamp).set({
-        "role": role,
-        "message": message
+
+    # Message, activity marker and compaction marker go out in one multi-location update
+    now = time.time()
+    db.reference().update({
+        f"{session_path(session_id)}/messages/{timestamp}": {
+            "role": role,
+            "message": message
+        },
+        f"chat_session_index/{session_id}": now,
+        f"chat_compact_queue/{session_id}": now
     })
 
+    with _tail_lock:
+        tail = _tails.get(session_id)
+        if tail is not None:
+            tail.append({"role": role, "message": message})
+            _tails.move_to_end(session_id)
 
-def load_message(limit: int =10):
-    ref = db.reference("chats")
-    data = ref.get() or {}
 
-    sorted_items = sorted(data.items())
+def load_message(session_id: str, limit: int =10):
+    """Return the last `limit` messages of a session, oldest first.
+
+    Served from the session's in-memory tail once it has been loaded. The
+    first call per session fetches the tail with a bounded key-ordered query.
+    """
+    if limit > TAIL_SIZE:
+        return _query_recent(session_id, limit)
 
-    recent = sorted_items[-limit:]
+    with _tail_lock:
+        tail = _tails.get(session_id)
+        if tail is not None:
+            _tails.move_to_end(session_id)
+            return list(tail)[-limit:]
 
-    messages = [{"role": v["role"], "message": v["message"]} for _, v in recent]
+    recent = _query_recent(session_id, TAIL_SIZE)
+
+    with _tail_lock:
+        tail = _tails.get(session_id)
+        if tail is None:
+            tail = deque(recent, maxlen=TAIL_SIZE)
+            _tails[session_id] = tail
+            while len(_tails) > MAX_CACHED_SESSIONS:
+                _tails.popitem(last=False)
+        return list(tail)[-limit:]
+
+
+def _query_recent(session_id: str, limit: int):
+    ref = db.reference(f"{session_path(session_id)}/messages")
+    data = ref.order_by_key().limit_to_last(limit).get() or {}
+
+    sorted_items = sorted(data.items())
+
+    messages = [{"role": v["role"], "message": v["message"]} for _, v in sorted_items]
     return messages
 
+
+def compact_sessions(now: float = None, batch: int = 500) -> dict:
+    """Expire old chat sessions and trim idle ones that have not been trimmed yet.
+
+    Sessions idle longer than SESSION_TTL_SECONDS are deleted. Sessions idle
+    longer than SESSION_IDLE_SECONDS keep only their last COMPACT_KEEP
+    messages. `chat_compact_queue` holds the sessions with messages since
+    their last trim, so a run only reads sessions it still has to trim. Both
+    queries are paged `batch` at a time until nothing matches, so a missed
+    run or a backlog is caught up on the next one.
+
+    Returns:
+        dict: Number of "expired" and "compacted" sessions.
+    """
+    now = now or time.time()
+
+    expired = 0
+    index_ref = db.reference("chat_session_index")
+    while True:
+        page = index_ref.order_by_value().end_at(now - SESSION_TTL_SECONDS).limit_to_first(batch).get() or {}
+        if not page:
+            break
+        updates = {}
+        for session_id in page:
+            updates[session_path(session_id)] = None
+            updates[f"chat_session_index/{session_id}"] = None
+            updates[f"chat_compact_queue/{session_id}"] = None
+        db.reference().update(updates)
+        expired += len(page)
+
+        with _tail_lock:
+            for session_id in page:
+                _tails.pop(session_id, None)
+        if len(page) < batch:
+            break
+
+    compacted = 0
+    queue_ref = db.reference("chat_compact_queue")
+    while True:
+        page = queue_ref.order_by_value().end_at(now - SESSION_IDLE_SECONDS).limit_to_first(batch).get() or {}
+        for session_id, last_active in page.items():
+            messages_ref = db.reference(f"{session_path(session_id)}/messages")
+            keys = sorted(messages_ref.get(shallow=True) or {})
+            stale = keys[:-COMPACT_KEEP] if COMPACT_KEEP else keys
+            if stale:
+                messages_ref.update({key: None for key in stale})
+                compacted += 1
+
+            # Keep the marker if a message arrived since the page was read
+            queue_ref.child(session_id).transaction(
+                lambda current, last_active=last_active: {} if current in (None, last_active) else current
+            )
+        if len(page) < batch:
+            break
+
+    logger.info(f"Chat sessions: {expired} expired, {compacted} compacted")
+    return {"expired": expired, "compacted": compacted}
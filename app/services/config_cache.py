@@ -0,0 +1,188 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class AquariumConfigCache:
+    """Per-process LRU cache of each aquarium's notification/threshold config.
+
+    Entries are loaded on a miss through `loader(aquarium_id)` and expire
+    after `ttl` seconds. When `subscribe` is given it is called on insert as
+    `subscribe(aquarium_id, on_change)` and must return objects with a
+    `close()` method (e.g. RTDB ListenerRegistration). Those listeners keep the
+    entry fresh and are closed when the entry is evicted.
+
+    `on_update(aquarium_id, config)` is called after a listener changes a
+    cached config, since such changes never go through `loader`. A partial
+    change is then reloaded right away rather than on the next access.
+    """
+
+    def __init__(self, loader, maxsize=256, ttl=60.0, subscribe=None, on_update=None):
+        self.loader = loader
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.subscribe = subscribe
+        self.on_update = on_update
+
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, aquarium_id):
+        key = str(aquarium_id)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not entry["stale"] and (entry["listeners"] or now - entry["loaded_at"] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["config"]
+            self.misses += 1
+
+        config = self.loader(aquarium_id) or {}
+        if config:
+            self.put(aquarium_id, config)
+        return config
+
+    def put(self, aquarium_id, config):
+        key = str(aquarium_id)
+        evicted = []
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry["config"] = config
+                entry["loaded_at"] = time.monotonic()
+                entry["stale"] = False
+                self._entries.move_to_end(key)
+                return
+
+            self._entries[key] = {"config": config, "loaded_at": time.monotonic(), "stale": False, "listeners": []}
+            while len(self._entries) > self.maxsize:
+                evicted.append(self._entries.popitem(last=False)[1])
+                self.evictions += 1
+
+        for entry in evicted:
+            self._close(entry)
+
+        if self.subscribe:
+            self._attach(key)
+
+    def refresh(self, aquarium_id, config):
+        """Replace the config of an already cached aquarium, never inserts."""
+        with self._lock:
+            entry = self._entries.get(str(aquarium_id))
+            if not entry:
+                return
+            entry["config"] = config
+            entry["loaded_at"] = time.monotonic()
+            entry["stale"] = False
+
+    def update_flags(self, aquarium_id, flag_updates):
+        """Write-through of state_flag changes made by this process."""
+        if not flag_updates:
+            return
+        with self._lock:
+            entry = self._entries.get(str(aquarium_id))
+            if not entry:
+                return
+            notification = entry["config"].setdefault("notification", {})
+            notification.setdefault("state_flag", {}).update(flag_updates)
+
+    def invalidate(self, aquarium_id):
+        with self._lock:
+            entry = self._entries.pop(str(aquarium_id), None)
+            if entry:
+                self.invalidations += 1
+        if entry:
+            self._close(entry)
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._close(entry)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _attach(self, key):
+        def on_change(node, event):
+            self._on_change(key, node, event)
+
+        try:
+            listeners = self.subscribe(key, on_change)
+        except Exception as e:
+            logger.warning(f"Config listener for aquarium {key} failed, falling back to TTL: {e}")
+            return
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Evicted while we were subscribing
+                self._close({"listeners": listeners})
+                return
+            entry["listeners"] = listeners
+
+    def _on_change(self, key, node, event):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return
+            if event.event_type == "put" and event.path == "/":
+                entry["config"][node] = event.data
+                entry["loaded_at"] = time.monotonic()
+                config = entry["config"]
+            else:
+                # Partial change, reload on the next access but keep listening
+                entry["stale"] = True
+                self.invalidations += 1
+                config = None
+
+        if not self.on_update:
+            return
+        try:
+            if config is None:
+                config = self.loader(key) or {}
+                self.refresh(key, config)
+            self.on_update(key, config)
+        except Exception as e:
+            logger.warning(f"Config update hook for aquarium {key} failed: {e}")
+
+    @staticmethod
+    def _close(entry):
+        for listener in entry.get("listeners", []):
+            try:
+                listener.close()
+            except Exception as e:
+                logger.debug(f"Failed to close config listener: {e}")
+
+
+def cache_settings():
+    """Read cache settings from the environment."""
+    return {
+        "maxsize": int(os.getenv("CONFIG_CACHE_SIZE", "256")),
+        "ttl": float(os.getenv("CONFIG_CACHE_TTL", "60")),
+        "listen": os.getenv("CONFIG_CACHE_LISTEN", "false").lower() in ["true", "1", "yes"],
+    }
@@ -0,0 +1,210 @@
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+TASK_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class DueTaskScheduler:
+    """Min-heap of pending task due times, fed by a Firestore listener.
+
+    `start(query)` attaches `on_snapshot` to the query of pending tasks and
+    returns at once. The listener's first snapshot delivers every matching
+    document on its own thread and is heapified in one pass, so startup does
+    not wait on the backlog. Later snapshots only carry changed documents. A
+    single timer thread sleeps until the earliest due time and then calls
+    `on_due(task_id, data, superseded)`, so waiting for a due time issues no
+    queries.
+
+    A task found more than `grace` seconds late, e.g. after downtime, is
+    fired together with every other overdue task of its aquarium. Only the
+    latest one is passed as `task_id`. The older ones are passed in
+    `superseded` as (task_id, data) pairs, so one aquarium is not fed N times
+    in a row.
+
+    Edits and removals do not touch the heap. Each entry carries a version
+    and stale entries are skipped when they reach the top.
+    """
+
+    def __init__(self, on_due, timezone="Asia/Manila", grace=60.0):
+        self.on_due = on_due
+        self.timezone = ZoneInfo(timezone)
+        self.grace = grace
+
+        self._heap = []
+        self._tasks = {}
+        self._versions = {}
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._watch = None
+        self._started_at = None
+
+        self.fired = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.snapshots = 0
+        self.max_lateness_ms = 0.0
+        self.loaded_in_ms = None
+
+    def due_timestamp(self, schedule_time):
+        """Epoch seconds of a 'YYYY-MM-DD HH:MM:SS' time in the task timezone."""
+        local = datetime.strptime(schedule_time, TASK_TIME_FORMAT).replace(tzinfo=self.timezone)
+        return local.timestamp()
+
+    def start(self, query):
+        self._started_at = time.perf_counter()
+        self._ensure_started()
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def stop(self):
+        self._stopped.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    def upsert(self, task_id, data):
+        """Schedule `task_id` at its schedule_time, replacing any earlier entry."""
+        self.apply_changes([(task_id, data)])
+
+    def remove(self, task_id):
+        self.apply_changes([(task_id, None)])
+
+    def apply_changes(self, changes):
+        """Apply snapshot changes, or (task_id, data) pairs with None for a removal."""
+        updates = []
+        for change in changes:
+            if isinstance(change, tuple):
+                updates.append(change)
+            elif change.type.name == "REMOVED":
+                updates.append((change.document.id, None))
+            else:
+                updates.append((change.document.id, change.document.to_dict()))
+
+        entries = []
+        with self._condition:
+            earliest = self._heap[0][0] if self._heap else None
+            for task_id, data in updates:
+                version = self._versions.get(task_id, 0) + 1
+                self._versions[task_id] = version
+                self._tasks.pop(task_id, None)
+                if data is None:
+                    continue
+                try:
+                    due = self.due_timestamp(data["schedule_time"])
+                except (KeyError, TypeError, ValueError):
+                    logger.warning(f"Task {task_id} has no valid schedule_time, not scheduled")
+                    continue
+                self._tasks[task_id] = (due, data)
+                entries.append((due, task_id, version))
+
+            if len(entries) > 64:
+                # A full snapshot, e.g. at startup, is cheaper to heapify at once
+                self._heap.extend(entries)
+                heapq.heapify(self._heap)
+            else:
+                for entry in entries:
+                    heapq.heappush(self._heap, entry)
+
+            # Only wake the timer if the earliest due time moved up
+            if entries and (earliest is None or self._heap[0][0] < earliest):
+                self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            next_due = self._next_due()
+            return {
+                "pending": len(self._tasks),
+                "heap_size": len(self._heap),
+                "next_due_in_s": round(next_due - time.time(), 1) if next_due is not None else None,
+                "ready": self.loaded_in_ms is not None,
+                "loaded_in_ms": self.loaded_in_ms,
+                "fired": self.fired,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "snapshots": self.snapshots,
+                "max_lateness_ms": self.max_lateness_ms,
+            }
+
+    def _on_snapshot(self, docs, changes, read_time):
+        self.apply_changes(changes)
+        self.snapshots += 1
+        if self.loaded_in_ms is None and self._started_at is not None:
+            self.loaded_in_ms = round((time.perf_counter() - self._started_at) * 1000, 2)
+            logger.info(f"Loaded {len(self._tasks)} pending tasks in {self.loaded_in_ms} ms")
+
+    def _next_due(self):
+        """Drop stale heap entries and return the earliest live due time."""
+        while self._heap:
+            due, task_id, version = self._heap[0]
+            if self._versions.get(task_id) == version and task_id in self._tasks:
+                return due
+            heapq.heappop(self._heap)
+        if not self._tasks:
+            self._versions.clear()
+        return None
+
+    def _take_due(self):
+        """Block until a task is due, then pop it. Returns None once stopped.
+
+        Returns:
+            tuple: (task_id, data, superseded) for the task to fire.
+        """
+        with self._condition:
+            while not self._stopped.is_set():
+                due = self._next_due()
+                now = time.time()
+                if due is not None and due <= now:
+                    _, task_id, _ = heapq.heappop(self._heap)
+                    _, data = self._tasks.pop(task_id)
+                    if now - due <= self.grace:
+                        self.max_lateness_ms = max(self.max_lateness_ms, round((now - due) * 1000, 2))
+                        return task_id, data, []
+                    return self._coalesce(task_id, data, now)
+                self._condition.wait(None if due is None else due - now)
+        return None
+
+    def _coalesce(self, task_id, data, now):
+        """Gather every overdue task of the aquarium and keep the latest one."""
+        aquarium_id = data.get("aquarium_id")
+        overdue = [(self.due_timestamp(data["schedule_time"]), task_id, data)]
+        for other_id, (due, other) in list(self._tasks.items()):
+            if due < now - self.grace and other.get("aquarium_id") == aquarium_id:
+                del self._tasks[other_id]
+                overdue.append((due, other_id, other))
+
+        # Their heap entries are now stale and get dropped when they surface
+        overdue.sort(key=lambda item: item[0])
+        _, latest_id, latest = overdue[-1]
+        superseded = [(other_id, other) for _, other_id, other in overdue[:-1]]
+        if superseded:
+            self.coalesced += len(superseded)
+            logger.warning(f"Aquarium {aquarium_id} has {len(overdue)} overdue tasks, firing only {latest_id}")
+        return latest_id, latest, superseded
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="due-task-scheduler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._take_due()
+            if item is None:
+                return
+            task_id, data, superseded = item
+            try:
+                self.on_due(task_id, data, superseded)
+                self.fired += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Due task {task_id} failed: {e}")
@@ -1,7 +1,26 @@
+import os
+import re
+import math
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from . import db
 from app.services.notification import send_fcm_notification, send_aquanotifier_notification
 from datetime import datetime
+from zoneinfo import ZoneInfo
 from .ai import ask_gemini_suggestions_ml
+from .config_cache import AquariumConfigCache, cache_settings
+from .write_behind import SensorWriteBuffer, write_behind_settings
+from .text_cache import TextCache
+
+
+# Sensor keys in RTDB mapped to the label used in alerts
+SENSOR_LABELS = {
+    "ph": "pH",
+    "temperature": "Temperature",
+    "turbidity": "Turbidity",
+}
 
 
 class FirebaseReference:
@@ -18,11 +37,9 @@ def save_sensors(aquarium_id, data):
     ref.get_ref("sensors").set(data)
 
 
-def initialize_data_firebase(aquarium_id):
-    ref = FirebaseReference(aquarium_id)
-    root = ref.get_ref()
-
-    init = {
+def default_aquarium(aquarium_id):
+    """Return the default structure of a newly created aquarium."""
+    return {
         "sensors": {
             "ph": 0,
             "temperature": 0,
@@ -50,100 +67,201 @@ def initialize_data_firebase(aquarium_id):
         "auto_feeder" : { "schedule" : {}} 
     }
 
-    if not root.get():
-        root.set(init)
 
+# Aquariums this process has already seen initialized
+_initialized = set()
+_initialized_lock = threading.Lock()
+
+
+def claim_aquarium(aquarium_id):
+    """Atomically create the `aquarium_id` marker of an aquarium.
+
+    The marker is the only key read for the existence check, so this costs
+    O(1) bytes no matter how much history the aquarium holds.
 
-def delete_logs(aquarium_id, action):
+    Returns:
+        bool: True if this call created the marker, False if it already existed.
+    """
     ref = FirebaseReference(aquarium_id)
+    marker_ref = ref.get_ref("aquarium_id")
 
-    if action == 'hourly':
-        base_ref = ref.get_ref("hourly_log")
-        index_ref = ref.get_ref("hourly_log/index")
+    if marker_ref.get() is not None:
+        return False
 
-        logs = base_ref.get()
-        index = index_ref.get()
+    state = {"created": False}
 
-        if not logs:
-            return
+    def create_if_absent(current):
+        state["created"] = current is None
+        return aquarium_id if current is None else current
 
-        if index is not None and index >= 24:
-            for key in logs:
-                if key.isdigit():
-                    base_ref.child(key).delete()
+    marker_ref.transaction(create_if_absent)
+    return state["created"]
 
-            index_ref.set(0)
 
-    elif action == 'day':
-        base_ref = ref.get_ref("average")
-        index_ref = ref.get_ref("average/index")
+def initial_updates(aquarium_id):
+    """Default children written after a successful claim_aquarium."""
+    # The marker is owned by the transaction, and an empty schedule would
+    # delete any existing one, so both are left out.
+    return {
+        key: value for key, value in default_aquarium(aquarium_id).items()
+        if key not in ("aquarium_id", "auto_feeder")
+    }
 
-        average = base_ref.get()
-        index = index_ref.get()
 
-        if not average:
-            return
+def mark_initialized(aquarium_id):
+    with _initialized_lock:
+        _initialized.add(str(aquarium_id))
 
-        if index is not None and index >= 30:
-            for key in average:
-                if key.isdigit():
-                    base_ref.child(key).delete()
 
-            index_ref.set(0)
+def initialize_data_firebase(aquarium_id):
+    """Create the default aquarium structure if it does not exist yet."""
+    if str(aquarium_id) in _initialized:
+        return
 
+    if claim_aquarium(aquarium_id):
+        ref = FirebaseReference(aquarium_id)
+        ref.get_ref().update(initial_updates(aquarium_id))
 
-def save_hourly(aquarium_id, data):
-    ref = FirebaseReference(aquarium_id)
+    mark_initialized(aquarium_id)
 
-    hourly_ref = ref.get_ref("hourly_log")
-    hourly_index = ref.get_ref("hourly_log/index")
 
-    get_index = hourly_index.get()
+class LogRing:
+    """Fixed-capacity ring of numbered slots under an aquarium node.
 
-    current_index = 1 if get_index is None else get_index + 1
+    Slots are keyed "1".."capacity" and `index` holds the last written slot.
+    A slot is allocated with a transaction on `index` and then overwritten in
+    place, so overlapping posts never share a slot and retention never needs
+    per-slot deletes: the ring always holds the latest `capacity` entries.
+    """
+
+    def __init__(self, aquarium_id, node, capacity):
+        self.ref = FirebaseReference(aquarium_id)
+        self.node = node
+        self.capacity = capacity
+
+    def allocate(self):
+        """Reserve the next slot and return its number."""
+        def next_slot(current):
+            return (current or 0) % self.capacity + 1
+
+        return self.ref.get_ref(f"{self.node}/index").transaction(next_slot)
+
+    def write(self, slot, data):
+        self.ref.get_ref(self.node).update({str(slot): data})
+
+    def entries(self):
+        """Return the stored entries, skipping the index key."""
+        values = children(self.ref.get_ref(self.node).get())
+        return [v for k, v in values.items() if k.isdigit()]
+
+
+HOURLY_SLOTS = 24
+DAILY_SLOTS = 30
+# Daily records are dated in the same zone as one-time tasks
+LOCAL_TIMEZONE = ZoneInfo(os.getenv("TASK_TIMEZONE", "Asia/Manila"))
 
-    hourly_ref.child(str(current_index)).set(data)
-    hourly_index.set(current_index)
 
-    if current_index >= 24:
-        average(aquarium_id)
-        delete_logs(aquarium_id, "hourly")
+def local_today():
+    return datetime.now(LOCAL_TIMEZONE).date()
 
 
-def average(aquarium_id):
+def fold_reading(stats, data):
+    """Add a reading to running per-sensor aggregates and return them."""
+    stats = dict(stats or {})
+    for sensor in SENSOR_LABELS:
+        value = data[sensor]
+        current = stats.get(sensor)
+        if not current:
+            stats[sensor] = {"count": 1, "sum": value, "sum_sq": value * value, "min": value, "max": value}
+            continue
+        stats[sensor] = {
+            "count": current["count"] + 1,
+            "sum": current["sum"] + value,
+            "sum_sq": current["sum_sq"] + value * value,
+            "min": min(current["min"], value),
+            "max": max(current["max"], value),
+        }
+    return stats
+
+
+def update_hourly_stats(aquarium_id, data):
+    """Fold a reading into `hourly_stats` and close the day when it is full.
+
+    The fold and the reset happen in the same transaction, so every reading
+    is counted in exactly one day even when posts overlap.
+
+    Returns:
+        dict: The aggregates of the day that just closed, or None.
+    """
     ref = FirebaseReference(aquarium_id)
+    closed = {"stats": None}
 
-    logs_per_hour = ref.get_ref("hourly_log")
-    get_logs = logs_per_hour.get()
+    def fold(current):
+        stats = fold_reading(current, data)
+        counts = [stats[sensor]["count"] for sensor in SENSOR_LABELS]
+        if min(counts) >= HOURLY_SLOTS:
+            closed["stats"] = stats
+            # RTDB stores an empty object as no data. None would make transaction() raise
+            return {}
+        closed["stats"] = None
+        return stats
 
-    average_ref = ref.get_ref("average")
-    index_ref = ref.get_ref("average/index")
-    get_index = index_ref.get()
+    ref.get_ref("hourly_stats").transaction(fold)
+    return closed["stats"]
 
-    ph, temperature, turbidity = [], [], []
 
-    for key, value in get_logs.items():
-        if key.isdigit():
-            ph.append(value['ph'])
-            temperature.append(value['temperature'])
-            turbidity.append(value['turbidity'])
+def save_hourly(aquarium_id, data):
+    ring = LogRing(aquarium_id, "hourly_log", HOURLY_SLOTS)
 
-    ph_avg = sum(ph) / len(ph)
-    temp_avg = sum(temperature) / len(temperature)
-    turb_avg = sum(turbidity) / len(turbidity)
+    slot = ring.allocate()
+    ring.write(slot, data)
 
-    average_dict = {
-        "ph": ph_avg,
-        "temperature": temp_avg,
-        "turbidity": turb_avg
-    }
+    day_stats = update_hourly_stats(aquarium_id, data)
+    if day_stats:
+        average(aquarium_id, day_stats)
+
+
+def summarize(stats, day=None):
+    """Turn running aggregates into the daily average record.
+
+    The top-level sensor keys keep the mean, "stats" adds count, min, max
+    and population standard deviation per sensor. "date" is the local day
+    the record was closed on (YYYY-MM-DD), so readers can tell its age.
+    """
+    average_dict = {"stats": {}, "date": (day or local_today()).isoformat()}
+
+    for sensor in SENSOR_LABELS:
+        sensor_stats = stats[sensor]
+        count = sensor_stats["count"]
+        mean = sensor_stats["sum"] / count
+        variance = max(sensor_stats["sum_sq"] / count - mean * mean, 0)
+
+        average_dict[sensor] = mean
+        average_dict["stats"][sensor] = {
+            "count": count,
+            "min": sensor_stats["min"],
+            "max": sensor_stats["max"],
+            "std": math.sqrt(variance)
+        }
+
+    return average_dict
 
-    latest_index = 1 if get_index is None else get_index + 1
 
-    average_ref.child(str(latest_index)).set(average_dict)
-    index_ref.set(latest_index)
+def average(aquarium_id, stats=None):
+    """Write the daily average of an aquarium into the `average` ring.
 
-    delete_logs(aquarium_id, "day")
+    With `stats` from update_hourly_stats this is O(1). Without it the
+    aggregates are rebuilt from the hourly ring, e.g. for a manual recompute.
+    """
+    if stats is None:
+        ring = LogRing(aquarium_id, "hourly_log", HOURLY_SLOTS)
+        for value in ring.entries():
+            stats = fold_reading(stats, value)
+        if not stats:
+            return
+
+    daily = LogRing(aquarium_id, "average", DAILY_SLOTS)
+    daily.write(daily.allocate(), summarize(stats))
 
 
 def notification_checker(aquarium_id, sensor):
@@ -151,61 +269,262 @@ def notification_checker(aquarium_id, sensor):
     return ref.get_ref(f"notification/{sensor}").get()
 
 
-def check_threshold(aquarium_id, data):
-    ph_notification = notification_checker(aquarium_id, "ph")
-    temperature_notification = notification_checker(aquarium_id, "temperature")
-    turbidity_notification = notification_checker(aquarium_id, "turbidity")
+def read_ingest_config(aquarium_id):
+    """Fetch the compact config an ingest needs in a single round trip.
 
+    Children of an aquarium are ordered by key, so the range
+    "notification".."threshold" returns only `notification`, `sensors` and
+    `threshold` without touching the hourly logs, averages or schedules.
+    An empty result means the aquarium has not been initialized yet.
+    """
     ref = FirebaseReference(aquarium_id)
-    threshold = ref.get_ref("threshold").get()
-    state_flag_ref = ref.get_ref("notification/state_flag")
-    state_flag = state_flag_ref.get()
-
-    ph_flag = state_flag["ph"]
-    turbidity_flag = state_flag["turbidity"]
-    temperature_flag = state_flag["temperature"]
-
-    # Check pH
-    if ph_notification:
-        ph = data["ph"]
-        ph_min = threshold["ph"]["min"]
-        ph_max = threshold["ph"]["max"]
-
-        if ph < ph_min or ph > ph_max:
-            if not ph_flag:
-                send_fcm_notification(aquarium_id, "pH")
-                state_flag_ref.child("ph").set(True)
-        else:
-            if ph_flag:
-                state_flag_ref.child("ph").set(False)
-
-    # Check temperature
-    if temperature_notification:
-        temperature = data["temperature"]
-        temperature_min = threshold["temperature"]["min"]
-        temperature_max = threshold["temperature"]["max"]
-
-        if temperature < temperature_min or temperature > temperature_max:
-            if not temperature_flag:
-                send_fcm_notification(aquarium_id, "Temperature")
-                state_flag_ref.child("temperature").set(True)
-        else:
-            if temperature_flag:
-                state_flag_ref.child("temperature").set(False)
-
-    # Check turbidity
-    if turbidity_notification:
-        turbidity = data["turbidity"]
-        turbidity_min = threshold["turbidity"]["min"]
-        turbidity_max = threshold["turbidity"]["max"]
-
-        if turbidity < turbidity_min or turbidity > turbidity_max:
-            if not turbidity_flag:
-                send_fcm_notification(aquarium_id, "Turbidity")
-                state_flag_ref.child("turbidity").set(True)
+    query = ref.get_ref().order_by_key().start_at("notification").end_at("threshold")
+    return query.get() or {}
+
+
+def listen_ingest_config(aquarium_id, on_change):
+    """Keep a cached config fresh through RTDB listeners."""
+    ref = FirebaseReference(aquarium_id)
+    return [
+        ref.get_ref(node).listen(lambda event, node=node: on_change(node, event))
+        for node in ("notification", "threshold")
+    ]
+
+
+_settings = cache_settings()
+def load_and_index_config(aquarium_id):
+    config = read_ingest_config(aquarium_id)
+    sync_threshold_index(aquarium_id, config)
+    return config
+
+
+config_cache = AquariumConfigCache(
+    loader=load_and_index_config,
+    maxsize=_settings["maxsize"],
+    ttl=_settings["ttl"],
+    subscribe=listen_ingest_config if _settings["listen"] else None,
+    on_update=lambda aquarium_id, config: sync_threshold_index(aquarium_id, config)
+)
+
+
+def write_aquariums(updates):
+    db.reference("aquariums").update(updates)
+
+
+_write_behind = write_behind_settings()
+sensor_buffer = None
+if _write_behind["enabled"]:
+    sensor_buffer = SensorWriteBuffer(
+        writer=write_aquariums,
+        flush_interval_ms=_write_behind["flush_interval_ms"],
+        max_size=_write_behind["max_size"],
+        max_staleness_ms=_write_behind["max_staleness_ms"]
+    )
+    atexit.register(sensor_buffer.stop)
+
+
+def load_ingest_config(aquarium_id):
+    """Return the ingest config of an aquarium, served from config_cache."""
+    return config_cache.get(aquarium_id)
+
+
+def evaluate_thresholds(config, data):
+    """Compare a reading against the thresholds in an ingest config.
+
+    This is a pure in-memory check, it does not talk to Firebase.
+
+    Args:
+        config (dict): Contains "notification" and "threshold" nodes.
+        data (dict): Sensor reading with "ph", "temperature" and "turbidity".
+
+    Returns:
+        tuple: (alerts, flag_updates) where alerts is a list of sensor labels
+        to notify about and flag_updates maps sensor keys to their new
+        state_flag value. Only flags that actually change are included.
+    """
+    notification = config.get("notification") or {}
+    threshold = config.get("threshold") or {}
+    state_flag = notification.get("state_flag") or {}
+
+    alerts = []
+    flag_updates = {}
+
+    for sensor, label in SENSOR_LABELS.items():
+        if not notification.get(sensor) or sensor not in data:
+            continue
+
+        value = data[sensor]
+        sensor_min = threshold[sensor]["min"]
+        sensor_max = threshold[sensor]["max"]
+        flag = state_flag.get(sensor, False)
+
+        if value < sensor_min or value > sensor_max:
+            if not flag:
+                alerts.append(label)
+                flag_updates[sensor] = True
         else:
-            if turbidity_flag:
-                state_flag_ref.child("turbidity").set(False)
+            if flag:
+                flag_updates[sensor] = False
+
+    return alerts, flag_updates
+
+
+def prepare_ingest(aquarium_id, data):
+    """Build the RTDB updates for one reading without writing anything.
+
+    Args:
+        aquarium_id (int): The ID of the aquarium.
+        data (dict): Sensor reading with "ph", "temperature" and "turbidity".
+
+    Returns:
+        tuple: (updates, alerts, flag_updates) where updates holds paths
+        relative to `aquariums/{id}`.
+    """
+    config = load_ingest_config(aquarium_id)
+
+    updates = {}
+
+    if not config:
+        # First reading for this aquarium, the defaults ride along with the
+        # sensor write when this request wins the claim
+        config = default_aquarium(aquarium_id)
+        if claim_aquarium(aquarium_id):
+            updates = initial_updates(aquarium_id)
+            config_cache.put(aquarium_id, config)
+
+    mark_initialized(aquarium_id)
+
+    alerts, flag_updates = evaluate_thresholds(config, data)
+
+    updates["sensors"] = data
+    for sensor, flag in flag_updates.items():
+        updates[f"notification/state_flag/{sensor}"] = flag
+
+    return updates, alerts, flag_updates
+
+
+def ingest_sensors(aquarium_id, data):
+    """Initialize, save and threshold-check a sensor reading.
+
+    Replaces the initialize_data_firebase -> save_sensors -> check_threshold
+    chain with one read of the ingest config and one multi-location update
+    that carries the reading together with any state_flag changes.
+
+    Args:
+        aquarium_id (int): The ID of the aquarium.
+        data (dict): Sensor reading with "ph", "temperature" and "turbidity".
+
+    Returns:
+        list: Sensor labels that triggered an alert.
+    """
+    ref = FirebaseReference(aquarium_id)
+    updates, alerts, flag_updates = prepare_ingest(aquarium_id, data)
+
+    if sensor_buffer:
+        # Alerts above were already evaluated against this reading
+        sensor_buffer.put(aquarium_id, updates)
+    else:
+        ref.get_ref().update(updates)
+    config_cache.update_flags(aquarium_id, flag_updates)
+
+    for label in alerts:
+        send_fcm_notification(aquarium_id, label)
+
+    return alerts
+
+
+def validate_reading(data):
+    """Return an error message for a malformed reading, or None."""
+    if not isinstance(data, dict):
+        return "Reading must be an object"
+    for sensor in SENSOR_LABELS:
+        value = data.get(sensor)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"Missing or invalid '{sensor}'"
+    return None
+
+
+def ingest_sensors_batch(readings):
+    """Ingest readings for many aquariums with a single RTDB write.
+
+    Every reading is threshold-checked in one pass against the cached
+    configs, then all sensor and state_flag writes go out as one
+    multi-location update on `aquariums`. When an aquarium appears more
+    than once only its last reading is stored.
+
+    Args:
+        readings (list): Items shaped like {"aquarium_id": 1, "ph": 7.2,
+            "temperature": 27.5, "turbidity": 120}.
+
+    Returns:
+        list: One result per input item, in order, with "aquarium_id",
+        "status" ("ok", "superseded" or "error") and "alerts" or "error".
+    """
+    results = [None] * len(readings)
+    latest = {}
+
+    for position, item in enumerate(readings):
+        aquarium_id = item.get("aquarium_id") if isinstance(item, dict) else None
+        if isinstance(aquarium_id, bool) or not isinstance(aquarium_id, int):
+            results[position] = {"aquarium_id": aquarium_id, "status": "error", "error": "Missing or invalid 'aquarium_id'"}
+            continue
+
+        error = validate_reading(item)
+        if error:
+            results[position] = {"aquarium_id": aquarium_id, "status": "error", "error": error}
+            continue
+
+        if aquarium_id in latest:
+            results[latest[aquarium_id]] = {"aquarium_id": aquarium_id, "status": "superseded"}
+        latest[aquarium_id] = position
+
+    updates = {}
+    pending = []
+
+    for aquarium_id, position in latest.items():
+        data = {sensor: readings[position][sensor] for sensor in SENSOR_LABELS}
+        try:
+            item_updates, alerts, flag_updates = prepare_ingest(aquarium_id, data)
+        except Exception as e:
+            results[position] = {"aquarium_id": aquarium_id, "status": "error", "error": str(e)}
+            continue
+
+        for path, value in item_updates.items():
+            updates[f"{aquarium_id}/{path}"] = value
+        pending.append((aquarium_id, position, alerts, flag_updates))
+
+    if updates:
+        try:
+            write_aquariums(updates)
+        except Exception as e:
+            for aquarium_id, position, _, _ in pending:
+                results[position] = {"aquarium_id": aquarium_id, "status": "error", "error": str(e)}
+            return results
+
+    for aquarium_id, position, alerts, flag_updates in pending:
+        config_cache.update_flags(aquarium_id, flag_updates)
+        for label in alerts:
+            try:
+                send_fcm_notification(aquarium_id, label)
+            except Exception as e:
+                print(f"Failed to send {label} alert for aquarium {aquarium_id}: {e}")
+        results[position] = {"aquarium_id": aquarium_id, "status": "ok", "alerts": alerts}
+
+    return results
+
+
+def check_threshold(aquarium_id, data):
+    ref = FirebaseReference(aquarium_id)
+    config = load_ingest_config(aquarium_id)
+
+    alerts, flag_updates = evaluate_thresholds(config, data)
+
+    if flag_updates:
+        ref.get_ref("notification/state_flag").update(flag_updates)
+        config_cache.update_flags(aquarium_id, flag_updates)
+
+    for label in alerts:
+        send_fcm_notification(aquarium_id, label)
 
 def get_schedule_firebase(aquarium_id: int) -> dict:
     '''Get the active (enabled) feeding schedules of the auto feeder.
@@ -239,12 +558,123 @@ def get_schedule_firebase(aquarium_id: int) -> dict:
 
 
 
+SCHEDULE_TIME_PATTERN = re.compile(r"^(\d{1,2}):(\d{2})$")
+SCHEDULE_KEY_PATTERN = re.compile(r"^\d{2}:\d{2}$")
+
+# Aquariums whose schedules this process has checked for push-id keys
+_migrated_schedules = set()
+_migrated_schedules_lock = threading.Lock()
+
+
+def normalize_schedule_time(time: str) -> str:
+    """Return a feeding time as zero-padded HH:MM, e.g. "8:05" -> "08:05".
+
+    Raises:
+        ValueError: If `time` is not a valid 24-hour HH:MM time.
+    """
+    match = SCHEDULE_TIME_PATTERN.match(str(time).strip())
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f"Invalid feeding time '{time}', expected HH:MM")
+    return f"{int(match.group(1)):02d}:{match.group(2)}"
+
+
+def rekey_schedules(schedules: dict) -> dict:
+    """Key schedule entries by their normalized time.
+
+    Push ids sort by creation time, so when two entries share a time the
+    oldest one is kept. Entries without a valid time keep their old key.
+    """
+    rekeyed = {}
+    for key, value in sorted(children(schedules).items()):
+        if SCHEDULE_KEY_PATTERN.match(key):
+            rekeyed[key] = value
+            continue
+        try:
+            time_key = normalize_schedule_time((value or {}).get("time"))
+        except ValueError:
+            rekeyed[key] = value
+            continue
+        if time_key in rekeyed:
+            print(f"Dropping duplicate feeding schedule {key} at {time_key}")
+            continue
+        rekeyed[time_key] = {**value, "time": time_key}
+    return rekeyed
+
+
+def migrate_schedule_keys(aquarium_id) -> int:
+    """Re-key an aquarium's push-id schedules by time, atomically.
+
+    Returns:
+        int: Number of entries that moved to a time key.
+    """
+    schedule_ref = FirebaseReference(aquarium_id).get_ref("auto_feeder/schedule")
+    state = {"moved": 0}
+
+    def rekey(current):
+        rekeyed = rekey_schedules(current)
+        state["moved"] = len(set(rekeyed) - set(children(current)))
+        return rekeyed
+
+    schedule_ref.transaction(rekey)
+    with _migrated_schedules_lock:
+        _migrated_schedules.add(str(aquarium_id))
+    return state["moved"]
+
+
+def migrate_all_schedule_keys() -> dict:
+    """Run `migrate_schedule_keys` for every aquarium. Returns moved entries per aquarium."""
+    return {aquarium_id: migrate_schedule_keys(aquarium_id) for aquarium_id in list_aquarium_ids()}
+
+
+def ensure_schedule_keys(aquarium_id):
+    """Migrate push-id schedules of an aquarium the first time this process touches it.
+
+    Costs one shallow read per aquarium per process, so time-keyed lookups
+    stay correct for data written before the migration.
+    """
+    key = str(aquarium_id)
+    if key in _migrated_schedules:
+        return
+
+    schedule_ref = FirebaseReference(aquarium_id).get_ref("auto_feeder/schedule")
+    keys = children(schedule_ref.get(shallow=True))
+    if any(not SCHEDULE_KEY_PATTERN.match(k) for k in keys):
+        migrate_schedule_keys(aquarium_id)
+
+    with _migrated_schedules_lock:
+        _migrated_schedules.add(key)
+
+
+def schedule_entry_ref(aquarium_id, time: str):
+    """Return the normalized time and the reference of its schedule entry."""
+    time_key = normalize_schedule_time(time)
+    ensure_schedule_keys(aquarium_id)
+    return time_key, FirebaseReference(aquarium_id).get_ref(f"auto_feeder/schedule/{time_key}")
+
+
+def update_schedule_entry(aquarium_id, time: str, changes: dict) -> bool:
+    """Apply `changes` to the schedule at `time` in one transaction.
+
+    Returns:
+        bool: False if there is no schedule at that time.
+    """
+    _, entry_ref = schedule_entry_ref(aquarium_id, time)
+    state = {"found": False}
+
+    def apply(current):
+        state["found"] = current is not None
+        # An empty object leaves a missing entry missing, None would make transaction() raise
+        return {**current, **changes} if current is not None else {}
+
+    entry_ref.transaction(apply)
+    return state["found"]
+
+
 def add_schedule_firebase(aquarium_id: int, schedule: dict) -> dict:
     """Add a new feeding schedule to Firebase if it does not already exist.
 
-    This function checks for duplicate feeding times in the aquarium's
-    auto-feeder schedule. If the time does not exist, it adds a new schedule
-    entry. If it already exists, it skips insertion.
+    Schedules are keyed by their normalized HH:MM time, so the duplicate
+    check and the insert are one transaction on that single key.
 
     Args:
         aquarium_id (int): The unique identifier of the aquarium.
@@ -261,25 +691,21 @@ def add_schedule_firebase(aquarium_id: int, schedule: dict) -> dict:
             - "cycle" (int, optional): Returned only if added.
             - "switch" (bool): Tell if it's on or off
     """
-    ref = FirebaseReference(aquarium_id)
-    ref_schedule = ref.get_ref("auto_feeder")
-    schedule_ref = ref_schedule.child("schedule")
-    current_schedules = schedule_ref.get() or {}
-
-    new_time = schedule["time"]
+    new_time, entry_ref = schedule_entry_ref(aquarium_id, schedule["time"])
     cycle = schedule["cycle"]
     switch = schedule["switch"]
     food = schedule["food"]
-    duplicate = False
+    state = {"added": False}
 
+    def add_if_absent(current):
+        state["added"] = current is None
+        if current is None:
+            return {"time": new_time, "cycle" : cycle, "switch" : switch, "food" : food}
+        return current
 
-    for key, value in current_schedules.items():
-        if value["time"] == new_time:
-            duplicate = True
-            break
+    entry_ref.transaction(add_if_absent)
 
-    if not duplicate:
-        schedule_ref.push({"time": new_time, "cycle" : cycle, "switch" : switch, "food" : food})
+    if state["added"]:
         return {"status": "added", "time": new_time, "cycle": cycle, "switch" : switch}
     else:
         return {"status": "duplicate", "time": new_time, "switch" : switch}
@@ -288,7 +714,7 @@ def add_schedule_firebase(aquarium_id: int, schedule: dict) -> dict:
 def set_on_off_schedule_firebase(aquarium_id : int, switch : bool, time: str) -> dict:
     """Update the on/off switch of a feeding schedule in Firebase.
 
-    This function finds a schedule by its feeding time and updates its
+    This function looks up a schedule by its feeding time and updates its
     switch value (enabled/disabled).
 
     Args:
@@ -302,16 +728,8 @@ def set_on_off_schedule_firebase(aquarium_id : int, switch : bool, time: str) ->
             - "time" (str): The feeding time requested.
             - "enabled" (bool, optional): The new switch value if updated.
     """
-    ref = FirebaseReference(aquarium_id)
-    switch_ref = ref.get_ref("auto_feeder/schedule")
-    switch_value = switch_ref.get() 
-
-    for key, value in switch_value.items():
-        if value["time"] == time:
-            key_ref = ref.get_ref(f"auto_feeder/schedule/{key}")
-            key_ref.update({"switch" : switch})
-
-            return {"status": "updated", "time": time, "enabled": switch}
+    if update_schedule_entry(aquarium_id, time, {"switch" : switch}):
+        return {"status": "updated", "time": time, "enabled": switch}
         
     return {"status": "not_found", "time": time}
 
@@ -319,7 +737,7 @@ def set_on_off_schedule_firebase(aquarium_id : int, switch : bool, time: str) ->
 def change_cycle_schedule_firebase(aquarium_id : int, time: str, cycle : int) -> dict:
     """Update the feeding cycle of a schedule in Firebase.
 
-    This function finds a schedule by its feeding time and updates its
+    This function looks up a schedule by its feeding time and updates its
     cycle value (amount or cycle number).
 
     Args:
@@ -333,16 +751,8 @@ def change_cycle_schedule_firebase(aquarium_id : int, time: str, cycle : int) ->
             - "time" (str): The feeding time requested.
             - "cycle" (int, optional): The new cycle value if updated.
     """
-    ref = FirebaseReference(aquarium_id)
-    cycle_ref = ref.get_ref("auto_feeder/schedule")
-    cycle_value = cycle_ref.get()
-
-    for key, value in cycle_value.items():
-        if value["time"] == time:
-            key_ref = cycle_ref.child(key)
-            key_ref.update({"cycle" : cycle})
-
-            return {"status": "updated", "time": time, "cycle": cycle}
+    if update_schedule_entry(aquarium_id, time, {"cycle" : cycle}):
+        return {"status": "updated", "time": time, "cycle": cycle}
     return {"status" : "not found", "time" : time}
 
 
@@ -358,38 +768,127 @@ def delete_schedule_firebase(aquarium_id: int, time: str) -> dict:
             - "status" (str): Either "deleted" or "not_found".
             - "time" (str): The feeding time requested for deletion.
     """
-    ref = FirebaseReference(aquarium_id)
-    schedule_ref = ref.get_ref("auto_feeder/schedule")
-    schedules = schedule_ref.get() or {}
+    _, entry_ref = schedule_entry_ref(aquarium_id, time)
+    state = {"found": False}
 
-    for key, value in schedules.items():
-        if value.get("time") == time:  
-            schedule_ref.child(key).delete()
-            return {"status": "deleted", "time": time}
+    def delete_if_present(current):
+        state["found"] = current is not None
+        # RTDB stores an empty object as no data, which deletes the entry
+        return {}
+
+    entry_ref.transaction(delete_if_present)
+
+    if state["found"]:
+        return {"status": "deleted", "time": time}
 
     return {"status": "not_found", "time": time}
 
 
 
 
+def children(value) -> dict:
+    """Normalize an RTDB node to a dict.
+
+    RTDB returns nodes whose keys are dense integers as lists with None holes.
+    """
+    if isinstance(value, list):
+        return {str(i): v for i, v in enumerate(value) if v is not None}
+    return value or {}
+
+
+def list_aquarium_ids() -> list:
+    """Return every aquarium id with a shallow read of `aquariums`."""
+    keys = children(db.reference("aquariums").get(shallow=True))
+    return sorted(int(k) for k in keys if str(k).isdigit())
+
+
+def threshold_index_entry(aquarium_id, config) -> dict:
+    """Project an ingest config onto its `threshold_index` entry."""
+    notification = config.get("notification") or {}
+    return {
+        "aquarium_id": int(aquarium_id),
+        "notification": {sensor: bool(notification.get(sensor, False)) for sensor in SENSOR_LABELS},
+        "threshold": config.get("threshold") or {}
+    }
+
+
+# Last entry this process wrote to threshold_index per aquarium
+_synced_index = {}
+_synced_index_lock = threading.Lock()
+
+
+def sync_threshold_index(aquarium_id, config):
+    """Write the `threshold_index` entry of an aquarium if it changed.
+
+    Called whenever this process loads a fresh config, and by the config
+    cache listeners when CONFIG_CACHE_LISTEN is on. Edits made by the app
+    directly in RTDB reach the index on the next config load after one
+    config cache TTL, or right away with listeners. An aquarium that stops
+    posting sensor data is not loaded again, so its entry stays as it was
+    until `rebuild_threshold_index`. Each process writes an entry at most
+    once per change.
+    """
+    if not config:
+        return
+    entry = threshold_index_entry(aquarium_id, config)
+    key = str(aquarium_id)
+
+    with _synced_index_lock:
+        if _synced_index.get(key) == entry:
+            return
+        _synced_index[key] = entry
+
+    try:
+        db.reference(f"threshold_index/{key}").set(entry)
+    except Exception as e:
+        with _synced_index_lock:
+            _synced_index.pop(key, None)
+        print(f"Failed to update threshold index for aquarium {key}: {e}")
+
+
+def rebuild_threshold_index() -> dict:
+    """Rebuild `threshold_index` from every aquarium's config.
+
+    Reads each aquarium with the compact range query instead of downloading
+    the whole `aquariums` tree, then replaces the index in one write.
+    """
+    index = {}
+    for aquarium_id in list_aquarium_ids():
+        config = read_ingest_config(aquarium_id)
+        if config:
+            index[str(aquarium_id)] = threshold_index_entry(aquarium_id, config)
+
+    db.reference("threshold_index").set(index)
+    with _synced_index_lock:
+        _synced_index.clear()
+        _synced_index.update(index)
+    return index
+
+
 def get_firebase_thresholds() -> list:
-    """This function checks all the aquarium and returns a list of active thresholds"""
-    ref_aquarium = db.reference("aquariums")
-    aquarium_value = ref_aquarium.get()
+    """This function checks all the aquarium and returns a list of active thresholds
+
+    Only `threshold_index` is read. When the index does not exist yet it is
+    rebuilt first.
+    """
+    index = children(db.reference("threshold_index").get())
 
-    if not aquarium_value:
+    if not index:
+        index = rebuild_threshold_index()
+
+    if not index:
         print("No aquarium data")
         return []
     
     active_thresholds = []
 
-    for aquarium in aquarium_value:
-        if not aquarium:
+    for entry in index.values():
+        if not entry:
             # Skip if the item is None
             continue
         
-        notification = aquarium.get("notification", {})
-        thresholds = aquarium.get("threshold", {})
+        notification = entry.get("notification", {})
+        thresholds = entry.get("threshold", {})
 
         ph_active = notification.get("ph", False)
         temperature_active = notification.get("temperature", False)
@@ -397,7 +896,7 @@ def get_firebase_thresholds() -> list:
 
         if ph_active or temperature_active or turbidity_active:
             active_thresholds.append({
-                "aquarium_id": aquarium.get("aquarium_id"),
+                "aquarium_id": entry.get("aquarium_id"),
                 "ph_notification": ph_active,
                 "temperature_notification": temperature_active,
                 "turbidity_notification": turbidity_active,
@@ -408,71 +907,168 @@ def get_firebase_thresholds() -> list:
 
 
 
-def compare_ml_firebase(mlPredictions, firebaseThresholds):
-    """Compare ML predictions against Firebase thresholds and request suggestions if out of range."""
+# Unit suffix used when describing a sensor range to Gemini
+SENSOR_UNITS = {"ph": "", "temperature": "°C", "turbidity": ""}
+
+# Shared by every /ml request so Gemini concurrency is bounded process-wide
+ml_suggestion_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ML_SUGGESTION_WORKERS", "8")),
+    thread_name_prefix="ml-suggestions"
+)
+
+
+# AquaNotifier texts keyed by how far each sensor is predicted out of range
+suggestion_cache = TextCache(
+    maxsize=int(os.getenv("ML_SUGGESTION_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("ML_SUGGESTION_CACHE_TTL", "21600")),
+    path=os.getenv("ML_SUGGESTION_CACHE_PATH") or None
+)
+SUGGESTION_CACHE_ENABLED = os.getenv("ML_SUGGESTION_CACHE", "true").lower() in ["true", "1", "yes"]
+
+# Width of a prediction bucket as a fraction of the safe range
+SUGGESTION_BUCKET = float(os.getenv("ML_SUGGESTION_BUCKET", "0.1"))
+
+
+def suggestion_key(out_of_range) -> str:
+    """Cache key for a set of out-of-range predictions.
+
+    Each sensor contributes its threshold range, the direction it is out of
+    range and how far, quantized to SUGGESTION_BUCKET of the range width.
+    """
+    parts = []
+    for item in sorted(out_of_range, key=lambda i: i["sensor"]):
+        width = (item["max"] - item["min"]) or 1
+        if item["predicted"] > item["max"]:
+            direction, distance = "above", item["predicted"] - item["max"]
+        else:
+            direction, distance = "below", item["min"] - item["predicted"]
+        bucket = math.ceil(distance / (width * SUGGESTION_BUCKET))
+        parts.append(f"{item['sensor']}:{item['min']}-{item['max']}:{direction}:{bucket}")
+    return "|".join(parts)
+
+
+def out_of_range_predictions(aquarium, prediction) -> list:
+    """Return the predicted sensors of an aquarium that fall outside its thresholds."""
+    thresholds = aquarium["thresholds"]
+    out_of_range = []
+
+    for sensor, label in SENSOR_LABELS.items():
+        if not aquarium.get(f"{sensor}_notification"):
+            continue
+
+        predicted = prediction.get(f"predicted_{sensor}")
+        if predicted is None:
+            continue
+
+        sensor_min = thresholds[sensor]["min"]
+        sensor_max = thresholds[sensor]["max"]
+        if predicted < sensor_min or predicted > sensor_max:
+            out_of_range.append({
+                "sensor": sensor,
+                "label": label,
+                "min": sensor_min,
+                "max": sensor_max,
+                "predicted": predicted
+            })
+
+    return out_of_range
+
+
+def describe_predictions(out_of_range) -> str:
+    """Build one Gemini prompt covering every out-of-range sensor of an aquarium."""
+    sentences = []
+    for item in out_of_range:
+        unit = SENSOR_UNITS[item["sensor"]]
+        name = "pH" if item["sensor"] == "ph" else item["sensor"]
+        sentences.append(
+            f"The safe range for {name} is {item['min']}-{item['max']}{unit}, "
+            f"and the ML predicted value for the next hour is {item['predicted']}{unit}."
+        )
+    return " ".join(sentences)
+
+
+def suggest_for_predictions(out_of_range, use_cache=True) -> str:
+    """Return an AquaNotifier text, served from suggestion_cache when possible."""
+    use_cache = use_cache and SUGGESTION_CACHE_ENABLED
+    key = suggestion_key(out_of_range)
+
+    if use_cache:
+        cached = suggestion_cache.get(key)
+        if cached:
+            return cached
+
+    start = time.perf_counter()
+    response_txt = ask_gemini_suggestions_ml(describe_predictions(out_of_range))
+    if use_cache and response_txt:
+        suggestion_cache.put(key, response_txt, cost_ms=(time.perf_counter() - start) * 1000)
+    return response_txt
+
+
+def notify_aquarium_predictions(aquarium_id, out_of_range, use_cache=True):
+    """Ask Gemini once for an aquarium and queue its AquaNotifier alert.
+
+    Returns:
+        bool: False if the dispatcher dropped the alert because its queue was full.
+    """
+    response_txt = suggest_for_predictions(out_of_range, use_cache)
+    sensor = ", ".join(item["label"] for item in out_of_range)
+    return send_aquanotifier_notification(aquarium_id, response_txt, sensor)
+
+
+def compare_ml_firebase(mlPredictions, firebaseThresholds, use_cache=True):
+    """Compare ML predictions against Firebase thresholds and request suggestions if out of range.
+
+    Each aquarium with out-of-range predictions gets a single Gemini request
+    covering all of its sensors. Requests run on the shared
+    ml_suggestion_pool and a failing aquarium does not stop the others.
+    Suggestion texts come from suggestion_cache unless `use_cache` is False.
+
+    Returns:
+        dict: Contains:
+            - "notified" (list): Aquarium ids whose suggestion was queued.
+            - "failed" (dict): Aquarium id mapped to the error message,
+              including alerts dropped by a full notification queue.
+    """
     
     # Convert both lists to dictionaries for quick lookup by aquarium_id
     ml_dict = {str(pred["tank_id"]): pred for pred in mlPredictions}
     firebase_dict = {str(aquarium["aquarium_id"]): aquarium for aquarium in firebaseThresholds}
 
-    
+    result = {"notified": [], "failed": {}}
+    futures = {}
+
     for aquarium_id, aquarium in firebase_dict.items():
-        thresholds = aquarium["thresholds"]
         ml_value = ml_dict.get(aquarium_id)
 
         if not ml_value:
             continue 
 
+        try:
+            out_of_range = out_of_range_predictions(aquarium, ml_value)
+        except Exception as e:
+            result["failed"][aquarium_id] = str(e)
+            continue
+
+        if out_of_range:
+            futures[aquarium_id] = ml_suggestion_pool.submit(notify_aquarium_predictions, aquarium_id, out_of_range, use_cache)
 
-        if aquarium["ph_notification"]:
-            predicted_ph = ml_value["predicted_ph"]
-            ph_min = thresholds["ph"]["min"]
-            ph_max = thresholds["ph"]["max"]
-
-            if predicted_ph < ph_min or predicted_ph > ph_max:
-                text = (
-                    f"The safe range for pH is {ph_min}-{ph_max}, "
-                    f"and the ML predicted value for the next hour is {predicted_ph}."
-                )
-                response_txt = ask_gemini_suggestions_ml(text)
-                sensor = "PH"
-                send_aquanotifier_notification(aquarium_id, response_txt, sensor)
-
-
-        if aquarium["temperature_notification"]:
-            predicted_temp = ml_value["predicted_temperature"]
-            temp_min = thresholds["temperature"]["min"]
-            temp_max = thresholds["temperature"]["max"]
-
-            if predicted_temp < temp_min or predicted_temp > temp_max:
-                text = (
-                    f"The safe range for temperature is {temp_min}-{temp_max}°C, "
-                    f"and the ML predicted value for the next hour is {predicted_temp}°C."
-                )
-                response_txt = ask_gemini_suggestions_ml(text)
-                sensor = "Temperature"
-                send_aquanotifier_notification(aquarium_id, response_txt, sensor)
-
-
-        if aquarium["turbidity_notification"]:
-            predicted_turbidity = ml_value["predicted_turbidity"]
-            turb_min = thresholds["turbidity"]["min"]
-            turb_max = thresholds["turbidity"]["max"]
-
-            if predicted_turbidity < turb_min or predicted_turbidity > turb_max:
-                text = (
-                    f"The safe range for turbidity is {turb_min}-{turb_max}, "
-                    f"and the ML predicted value for the next hour is {predicted_turbidity}."
-                )
-                response_txt = ask_gemini_suggestions_ml(text)
-                sensor = "Turbidity"
-                send_aquanotifier_notification(aquarium_id, response_txt, sensor)
+    for aquarium_id, future in futures.items():
+        try:
+            if future.result() is False:
+                result["failed"][aquarium_id] = "Notification queue is full, alert dropped"
+                continue
+            result["notified"].append(aquarium_id)
+        except Exception as e:
+            print(f"ML suggestion failed for aquarium {aquarium_id}: {e}")
+            result["failed"][aquarium_id] = str(e)
+
+    return result
 
 def set_daily_schedule_firebase(aquarium_id: int, daily: bool, time: str) -> dict:
     """
     Update the 'daily' flag of a feeding schedule in Firebase.
 
-    This function searches for a feeding schedule based on the given time
+    This function looks up a feeding schedule by the given time
     and updates its 'daily' value (True for daily feeding, False for one-time feeding).
 
     Args:
@@ -486,17 +1082,8 @@ def set_daily_schedule_firebase(aquarium_id: int, daily: bool, time: str) -> dic
             - "time" (str): The feeding time requested.
             - "daily_enabled" (bool, optional): The new daily value if updated.
     """
-    ref = FirebaseReference(aquarium_id)
-    schedule_ref = ref.get_ref("auto_feeder/schedule")
-    schedules = schedule_ref.get()
-
-
-    for key, value in schedules.items():
-        if value.get("time") == time:
-            key_ref = schedule_ref.child(key)
-            key_ref.update({"daily": daily})
-
-            return {"status": "updated", "time": time, "daily_enabled": daily}
+    if update_schedule_entry(aquarium_id, time, {"daily": daily}):
+        return {"status": "updated", "time": time, "daily_enabled": daily}
 
     return {"status": "not_found", "time": time}
 
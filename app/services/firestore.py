@@ -1,13 +1,17 @@
 import os
 import json
+import atexit
 import base64
 from datetime import datetime, timedelta, timezone
-import requests
 from flask import jsonify
 import firebase_admin
 from firebase_admin import credentials, firestore
 from dotenv import load_dotenv
 import logging
+from google.api_core import exceptions as api_exceptions
+from .tank_pi import tank_pi
+from .outbox import TankPiOutbox, outbox_settings
+from .due_tasks import DueTaskScheduler
 
 logger = logging.getLogger(__name__)
 if not logging.getLogger().hasHandlers():  # Only configure if root logger has no handlers
@@ -59,26 +63,92 @@ if not firebase_admin._apps:
 
 db = firestore.client()
 
+# Tank-Pi commands are committed with their task and delivered in the background
+outbox = TankPiOutbox(db, tank_pi.send_commands, **outbox_settings())
+atexit.register(outbox.stop)
+
+
+def pending_tasks_query():
+  """Every pending one-time task, across all aquariums."""
+  return db.collection("Schedules").where("status", "==", "pending")
+
+
+def handle_due_task(document_id: str, data: dict, superseded=()):
+  """Runs when a pending task reaches its schedule_time.
+
+  A task the Pi received is left pending, because the Pi runs it and reports
+  back through /task_complete. A task that never reached the Pi cannot run
+  on time, so it is marked "missed" and drops out of the pending list, and
+  its queued outbox add is cancelled in the same batch. That decision is made
+  on the task's delivery state re-read while no delivery is in flight.
+
+  `superseded` holds older overdue tasks of the same aquarium that were
+  coalesced into this one. They are marked "coalesced" and a delete is
+  queued for the Pi, which also cancels any add that was not delivered yet.
+  """
+  now = datetime.now(timezone.utc).isoformat()
+  superseded = list(superseded)
+  # Two writes per task, within the 500-write WriteBatch limit
+  for start in range(0, len(superseded), 250):
+    batch = db.batch()
+    for task_id, task in superseded[start:start + 250]:
+      aquarium_id = task.get("aquarium_id")
+      batch.update(db.collection("Schedules").document(task_id), {"status": "coalesced", "coalesced_into": document_id, "coalesced_at": now})
+      outbox.stage(batch, "delete", aquarium_id, {"aquarium_id": aquarium_id, "document_id": task_id}, task_id=task_id)
+    batch.commit()
+  if superseded:
+    outbox.notify()
+    logger.warning(f"Coalesced {len(superseded)} overdue task(s) into {document_id}")
+
+  if data.get("delivery") == "delivered":
+    logger.info(f"Task {document_id} is due, the Tank-Pi has it")
+    return
+
+  # Its queued add is dropped with it, so the Pi never gets a written-off feeding.
+  # The outbox re-reads delivery first, the add may have gone out since the snapshot
+  if not outbox.write_off_task(document_id, {"status": "missed", "missed_at": now}):
+    logger.info(f"Task {document_id} is due, it reached the Tank-Pi after the snapshot")
+    return
+  logger.warning(f"Task {document_id} was due but never delivered to the Tank-Pi (delivery={data.get('delivery')}), marked missed")
+
+
+# Fires each pending task at its due time, kept current by a snapshot listener
+due_tasks = DueTaskScheduler(
+  handle_due_task,
+  timezone=os.getenv("TASK_TIMEZONE", "Asia/Manila"),
+  grace=float(os.getenv("DUE_TASK_GRACE_SECONDS", "60"))
+)
+atexit.register(due_tasks.stop)
+
 
 
 
 def create_schedule(aquarium_id: int, cycle: int, schedule_time: str, food: str, job_id: str):
-  """Create a Firestore schedule and register an APScheduler job.
+  """Create a Firestore schedule and queue its dispatch to the Tank-Pi.
 
   schedule_time is expected as 'YYYY-%m-%d %H:%M:%S' in Asia/Manila local time.
+  The schedule and its outbox command are committed in one batch, and the
+  outbox worker delivers the command with `job_id` to the Pi.
 
   """
   try:
     trim_time = schedule_time.replace(" ","_")
-    job_id = f"schedule_at_{trim_time}"
-    db.collection("Schedules").document(job_id).set({
+    document_id = f"schedule_at_{trim_time}"
+    batch = db.batch()
+    batch.set(db.collection("Schedules").document(document_id), {
         "aquarium_id": aquarium_id,
         "cycle": cycle,
         "schedule_time": schedule_time,
         "food" : food, 
-        "status": "pending"        
+        "status": "pending",
+        "delivery": "pending"
       })
-    logger.info(f"Schedule {job_id} added in the firestore")
+    payload = {"aquarium_id": aquarium_id, "cycle": cycle, "job_id": job_id, "food" : food, "schedule_time" : schedule_time}
+    outbox.stage(batch, "add", aquarium_id, payload, task_id=document_id)
+    batch.commit()
+    outbox.notify()
+
+    logger.info(f"Schedule {document_id} added in the firestore")
     return "Sucesfully added in the firestore"
     
   except Exception as e:
@@ -86,25 +156,131 @@ def create_schedule(aquarium_id: int, cycle: int, schedule_time: str, food: str,
       return e
       
 
+TASK_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Each WriteBatch holds the tasks plus one outbox command, 500 writes in total
+BULK_TASKS_PER_BATCH = 499
+# Times a batch is re-read and retried when a concurrent request created some of its tasks
+BULK_CREATE_ATTEMPTS = 3
+
+
+def create_schedules_bulk(aquarium_id: int, tasks: list):
+  """Create many one-time schedules and queue them for the Tank-Pi in one command per batch.
+
+  Tasks are committed in WriteBatches of up to BULK_TASKS_PER_BATCH
+  documents. Each batch also stores one "add_many" outbox command. It goes
+  out in a single delivery, which is one POST with TANK_PI_BATCH_ENDPOINT
+  and one add_task POST per task otherwise. Document ids come from
+  schedule_time like in `create_schedule`, so retrying a request does not
+  create tasks twice. A task that already exists with the same cycle and
+  food is reported as "exists" and is not sent again. Tasks are written
+  with `create`, so when an overlapping retry commits some of them first
+  the batch fails as a whole, and is re-read and retried without them.
+
+  Returns:
+    list: One result per input task, in order, with `status` "created",
+    "exists", "conflict", "duplicate", "invalid" or "failed".
+  """
+  results = [None] * len(tasks)
+  accepted = []
+  seen = set()
+
+  for index, task in enumerate(tasks):
+    try:
+      schedule_time = task["schedule_time"]
+      datetime.strptime(schedule_time, TASK_TIME_FORMAT)
+      cycle = int(task["cycle"])
+    except (TypeError, KeyError, ValueError):
+      results[index] = {"index": index, "status": "invalid", "error": "Expected schedule_time 'YYYY-MM-DD HH:MM:SS' and an integer cycle"}
+      continue
+
+    document_id = f"schedule_at_{schedule_time.replace(' ', '_')}"
+    if document_id in seen:
+      results[index] = {"index": index, "document_id": document_id, "status": "duplicate"}
+      continue
+    seen.add(document_id)
+    accepted.append((index, document_id, {"cycle": cycle, "schedule_time": schedule_time, "food": task.get("food")}))
+
+  for start in range(0, len(accepted), BULK_TASKS_PER_BATCH):
+    chunk = accepted[start:start + BULK_TASKS_PER_BATCH]
+    refs = {document_id: db.collection("Schedules").document(document_id) for _, document_id, _ in chunk}
+
+    for attempt in range(1, BULK_CREATE_ATTEMPTS + 1):
+      existing = {snap.id: snap.to_dict() for snap in db.get_all(list(refs.values())) if snap.exists}
+
+      batch = db.batch()
+      created = []
+      for index, document_id, task in chunk:
+        current = existing.get(document_id)
+        if current is not None:
+          same = current.get("aquarium_id") == aquarium_id and current.get("cycle") == task["cycle"] and current.get("food") == task["food"]
+          results[index] = {"index": index, "document_id": document_id, "status": "exists" if same else "conflict"}
+          continue
+
+        batch.create(refs[document_id], {"aquarium_id": aquarium_id, **task, "status": "pending", "delivery": "pending"})
+        created.append((index, document_id, task))
+
+      if not created:
+        break
+
+      payload = {
+        "aquarium_id": aquarium_id,
+        "tasks": [
+          {"aquarium_id": aquarium_id, "job_id": f"{aquarium_id}_schedule_at_{task['schedule_time']}", **task}
+          for _, _, task in created
+        ]
+      }
+      outbox.stage(batch, "add_many", aquarium_id, payload, task_id=None, task_ids=[document_id for _, document_id, _ in created])
+
+      try:
+        batch.commit()
+        status = {"status": "created"}
+      except api_exceptions.Conflict as e:
+        if attempt < BULK_CREATE_ATTEMPTS:
+          logger.warning(f"Bulk schedule batch for aquarium {aquarium_id} raced another request, retrying: {e}")
+          continue
+        logger.error(f"Bulk schedule batch for aquarium {aquarium_id} failed: {e}")
+        status = {"status": "failed", "error": str(e)}
+      except Exception as e:
+        logger.error(f"Bulk schedule batch for aquarium {aquarium_id} failed: {e}")
+        status = {"status": "failed", "error": str(e)}
+      for index, document_id, _ in created:
+        results[index] = {"index": index, "document_id": document_id, **status}
+      break
+
+  outbox.notify()
+  logger.info(f"Bulk schedules for aquarium {aquarium_id}: {sum(r['status'] == 'created' for r in results)} of {len(tasks)} created")
+  return results
+
+
 def send_schedule_raspi(aquarium_id: int, cycle: int, schedule_time: str, food: str, job_id: str):
     """Send scheduled task to Raspberry Pi"""
-    target_url = f"https://pi-cam.alfreds.dev/{aquarium_id}/add_task"
     payload = {"aquarium_id": aquarium_id, "cycle": cycle, "job_id": job_id, "food" : food, "schedule_time" : schedule_time}
 
     try: 
-        response = requests.post(target_url, json=payload)
+        response = tank_pi.add_task(aquarium_id, payload)
         print(f"Sucessfully send to raspi | {response.status_code}")
     except Exception as e:
         print(e)
 
 def delete_schedule_by_id(aquarium_id: int, document_id: str):
-    """Delete a schedule in Firestore using document_id."""
+    """Delete a schedule in Firestore using document_id.
+
+    A delete command for the Tank-Pi is queued in the outbox either way, in
+    the same batch as the deletion.
+    """
     try:
         get_ref = db.collection("Schedules").document(document_id)
         doc = get_ref.get()
 
+        batch = db.batch()
+        if doc.exists:
+            batch.delete(get_ref)
+        payload = {"aquarium_id": aquarium_id, "document_id": document_id}
+        outbox.stage(batch, "delete", aquarium_id, payload, task_id=document_id)
+        batch.commit()
+        outbox.notify()
+
         if doc.exists:
-            get_ref.delete()
             logger.info(f" Schedule {document_id} deleted successfully for aquarium {aquarium_id}.")
             return f"Schedule {document_id} deleted successfully."
         else:
@@ -135,11 +311,10 @@ def set_complete_task(document_id: str):
 
 def send_deletion_raspi(aquarium_id: int, document_id: str):
     try:
-        url = f"https://pi-cam.alfreds.dev/{aquarium_id}/delete_task"
         payload = {"aquarium_id": aquarium_id, "document_id": document_id}
 
         try:
-            requests.post(url, json=payload)
+            tank_pi.delete_task(aquarium_id, payload)
             logger.info("Sucessfuly Delete the Task in Raspi")
             return "Sucessfuly Delete the Task in Raspi"
         
@@ -150,25 +325,72 @@ def send_deletion_raspi(aquarium_id: int, document_id: str):
         logger.error(f"ERROR {e}")
         return e
     
-def get_scheduler_aquarium(aquarium_id: int):
-   try:
-      docs = db.collection("Schedules").where("aquarium_id", "==", aquarium_id).where("status", "==", "pending").stream()
-      pending_schedule = [
-            {**doc.to_dict(), "document_id": doc.id} for doc in docs
-        ]
+# Columns of a pending task the Pi needs, and the ones a caller may ask for
+PENDING_FIELDS = ["cycle", "food", "schedule_time"]
+PENDING_ALLOWED_FIELDS = {"aquarium_id", "cycle", "food", "schedule_time", "status", "delivery"}
+PENDING_PAGE_SIZE = 50
+PENDING_MAX_PAGE_SIZE = 500
 
-      if not pending_schedule:
-        logger.info(f"No Pending Schedule is return for aquarium {aquarium_id}")
-        return f"No Pending Schedule is return for aquarium {aquarium_id}"
-       
-      logger.info("Pending schedules are extracted")
-      return pending_schedule
-   
-   except Exception as e:
-      logger.error(f"ERROR Something went wrong, {e}")
-      return e
-   
-   
 
+def encode_cursor(schedule_time: str, document_id: str) -> str:
+    raw = json.dumps([schedule_time, document_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
 
-    
+
+def decode_cursor(cursor: str):
+    """Return (schedule_time, document_id) of a cursor from `encode_cursor`."""
+    try:
+        schedule_time, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return schedule_time, document_id
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def get_scheduler_aquarium(aquarium_id: int, page_size: int = PENDING_PAGE_SIZE, start_after: str = None, fields=None):
+   """Return one page of an aquarium's pending schedules, oldest schedule_time first.
+
+   Only `fields` (default PENDING_FIELDS) are read, plus `document_id`.
+   Pages are keyed on (schedule_time, document id), so each page costs the
+   same however many tasks are pending.
+
+   Returns:
+      dict: {"tasks": [...], "next_cursor": str or None}. Pass `next_cursor`
+      back as `start_after` to get the following page.
+
+   Raises:
+      ValueError: If `start_after` is not a valid cursor or a field is unknown.
+   """
+   fields = list(fields or PENDING_FIELDS)
+   unknown = set(fields) - PENDING_ALLOWED_FIELDS
+   if unknown:
+      raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+   page_size = max(1, min(page_size, PENDING_MAX_PAGE_SIZE))
+
+   query = (
+      db.collection("Schedules")
+      .where("aquarium_id", "==", aquarium_id)
+      .where("status", "==", "pending")
+      .order_by("schedule_time")
+      .order_by("__name__")
+      # schedule_time is always read since the cursor is built from it
+      .select(sorted(set(fields) | {"schedule_time"}))
+   )
+   if start_after:
+      schedule_time, document_id = decode_cursor(start_after)
+      query = query.start_after({"schedule_time": schedule_time, "__name__": document_id})
+
+   # One extra document tells whether another page follows
+   docs = list(query.limit(page_size + 1).stream())
+   page = docs[:page_size]
+
+   tasks = [
+      {**{k: v for k, v in doc.to_dict().items() if k in fields}, "document_id": doc.id}
+      for doc in page
+   ]
+   next_cursor = None
+   if len(docs) > page_size:
+      last = page[-1]
+      next_cursor = encode_cursor(last.to_dict()["schedule_time"], last.id)
+
+   logger.info(f"Read {len(tasks)} pending schedules for aquarium {aquarium_id}")
+   return {"tasks": tasks, "next_cursor": next_cursor}
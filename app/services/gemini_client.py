@@ -0,0 +1,240 @@
+import os
+import time
+import logging
+import threading
+from google.api_core import exceptions as api_exceptions
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean Gemini itself is degraded, as opposed to a bad request
+UPSTREAM_ERRORS = (
+    api_exceptions.ServerError,
+    api_exceptions.TooManyRequests,
+    api_exceptions.RetryError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+class GeminiUnavailable(Exception):
+    """Raised instead of calling Gemini when the call is shed.
+
+    `reason` is "busy" when the concurrency budget is used up and
+    "circuit_open" while the circuit breaker fails fast.
+    """
+
+    def __init__(self, reason):
+        super().__init__(f"Gemini is unavailable ({reason}), try again shortly")
+        self.reason = reason
+
+
+class GeminiClient:
+    """Deadline, concurrency budget and circuit breaker around `generate_content`.
+
+    At most `max_concurrent` calls run at once. Callers wait up to
+    `queue_wait_ms` for a slot and are rejected after that, so slow Gemini
+    calls cannot tie up every server thread. Each call gets a `timeout`
+    second deadline. After `failure_threshold` upstream failures in a row the
+    circuit opens and calls fail fast for `reset_after` seconds. One trial
+    call is then let through, and it closes the circuit again if it succeeds.
+    """
+
+    def __init__(self, max_concurrent=4, timeout=30.0, queue_wait_ms=200, failure_threshold=5, reset_after=30.0):
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.queue_wait = queue_wait_ms / 1000
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+        self.in_flight = 0
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.rejected_busy = 0
+        self.rejected_open = 0
+        self.circuit_opens = 0
+        self.latency_ms_total = 0.0
+        self.max_latency_ms = 0.0
+        self.last_latency_ms = 0.0
+
+    def generate(self, model, contents, stream=False, wait=None):
+        """Call `model.generate_content` within the budget and deadline.
+
+        `wait` overrides `queue_wait_ms` (in seconds), e.g. for background
+        callers that may queue longer than a request thread should.
+
+        Raises:
+            GeminiUnavailable: If the circuit is open or no slot frees up in time.
+        """
+        trial = self._admit()
+
+        wait = self.queue_wait if wait is None else wait
+        if not self._slots.acquire(timeout=wait):
+            with self._lock:
+                self.rejected_busy += 1
+                if trial:
+                    self._trial_running = False
+            raise GeminiUnavailable("busy")
+
+        with self._lock:
+            self.in_flight += 1
+            self.calls += 1
+
+        start = time.perf_counter()
+        try:
+            response = model.generate_content(contents, stream=stream, request_options={"timeout": self.timeout})
+        except Exception as e:
+            self._finish(start, e, trial)
+            raise
+
+        if stream:
+            # The slot stays taken until the stream is read to the end or closed
+            try:
+                return GuardedStream(self, response, start, trial)
+            except Exception as e:
+                self._finish(start, e, trial)
+                raise
+
+        self._finish(start, None, trial)
+        return response
+
+    def stats(self):
+        with self._lock:
+            finished = self.successes + self.failures + self.cancelled
+            return {
+                "circuit": self._state(),
+                "in_flight": self.in_flight,
+                "max_concurrent": self.max_concurrent,
+                "calls": self.calls,
+                "successes": self.successes,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+                "rejected_busy": self.rejected_busy,
+                "rejected_open": self.rejected_open,
+                "circuit_opens": self.circuit_opens,
+                "avg_latency_ms": round(self.latency_ms_total / finished, 2) if finished else 0.0,
+                "max_latency_ms": self.max_latency_ms,
+                "last_latency_ms": self.last_latency_ms,
+            }
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_after:
+            return "open"
+        return "half_open"
+
+    def _admit(self):
+        """Check the breaker. Returns True if this call is the half-open trial."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return False
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected_open += 1
+        raise GeminiUnavailable("circuit_open")
+
+    def _finish(self, start, error, trial, cancelled=False):
+        elapsed = round((time.perf_counter() - start) * 1000, 2)
+        self._slots.release()
+
+        with self._lock:
+            self.in_flight -= 1
+            self.latency_ms_total += elapsed
+            self.max_latency_ms = max(self.max_latency_ms, elapsed)
+            self.last_latency_ms = elapsed
+            if trial:
+                self._trial_running = False
+
+            if cancelled:
+                # Says nothing about the upstream, so the breaker is left alone
+                self.cancelled += 1
+                return
+
+            if error is None:
+                self.successes += 1
+                self._consecutive_failures = 0
+                self._opened_at = None
+                return
+
+            self.failures += 1
+            if isinstance(error, (api_exceptions.DeadlineExceeded, TimeoutError)):
+                self.timeouts += 1
+            if not isinstance(error, UPSTREAM_ERRORS):
+                return
+
+            self._consecutive_failures += 1
+            if trial or self._consecutive_failures >= self.failure_threshold:
+                if self._opened_at is None or trial:
+                    self.circuit_opens += 1
+                    logger.error(f"Gemini circuit opened after {self._consecutive_failures} failures: {error}")
+                self._opened_at = time.monotonic()
+
+
+class GuardedStream:
+    """Iterator over a streamed response that gives back its slot when done.
+
+    The slot is released when the stream ends, fails or is closed. If the
+    caller drops it without doing any of these, it is released when the
+    stream is garbage collected, so an abandoned stream cannot hold a slot
+    until restart.
+    """
+
+    def __init__(self, client, response, start, trial):
+        self._client = client
+        self._iterator = iter(response)
+        self._start = start
+        self._trial = trial
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self._complete(None)
+            raise
+        except Exception as e:
+            self._complete(e)
+            raise
+
+    def close(self):
+        """Stop reading early, e.g. when the client disconnected."""
+        self._complete(None, cancelled=True)
+
+    def __del__(self):
+        if not getattr(self, "_done", True):
+            logger.warning("Gemini stream was dropped without being closed, releasing its slot")
+            self.close()
+
+    def _complete(self, error, cancelled=False):
+        if self._done:
+            return
+        self._done = True
+        self._client._finish(self._start, error, self._trial, cancelled)
+
+
+def gemini_settings():
+    """Read Gemini client settings from the environment."""
+    return {
+        "max_concurrent": int(os.getenv("GEMINI_MAX_CONCURRENT", "4")),
+        "timeout": float(os.getenv("GEMINI_TIMEOUT", "30")),
+        "queue_wait_ms": int(os.getenv("GEMINI_QUEUE_WAIT_MS", "200")),
+        "failure_threshold": int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+        "reset_after": float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+    }
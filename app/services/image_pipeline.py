@@ -0,0 +1,79 @@
+import io
+import os
+import base64
+import binascii
+from PIL import Image, ImageOps
+
+# Limits are checked before any pixel data is decoded
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(12 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(50_000_000)))
+
+# Longest side sent to the model and the format it is re-encoded to
+TARGET_SIZE = int(os.getenv("IMAGE_TARGET_SIZE", "1024"))
+OUTPUT_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+OUTPUT_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class ImageRejected(ValueError):
+    """The upload is not a usable image or exceeds the configured limits."""
+
+
+def decode_base64_payload(base64_str: str) -> bytes:
+    """Decode a (data URL or bare) base64 string after checking its size."""
+    if "," in base64_str:
+        base64_str = base64_str.split(",", 1)[1]
+
+    # Every 4 base64 characters hold 3 bytes, so the cap is checked up front
+    if len(base64_str) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise ImageRejected(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+
+    try:
+        return base64.b64decode(base64_str, validate=False)
+    except (binascii.Error, ValueError) as e:
+        raise ImageRejected(f"Invalid base64 image: {e}")
+
+
+def prepare_image(image_bytes: bytes, target_size: int = None) -> dict:
+    """Downscale, orient and re-encode an uploaded image for Gemini.
+
+    The header is read first to enforce MAX_IMAGE_PIXELS. JPEGs are then
+    decoded straight at a reduced scale with `draft()`, so a 12 MP photo never
+    materializes at full resolution.
+
+    Returns:
+        dict: A Gemini blob part, {"mime_type": ..., "data": bytes}.
+    """
+    target_size = target_size or TARGET_SIZE
+
+    if len(image_bytes) > MAX_IMAGE_BYTES:
+        raise ImageRejected(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+    except Exception as e:
+        raise ImageRejected(f"Unsupported image: {e}")
+
+    width, height = img.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageRejected(f"Image has {width * height} pixels, limit is {MAX_IMAGE_PIXELS}")
+
+    try:
+        # Draft to the size thumbnail() will produce; a square box would stop
+        # the JPEG scale-down short on the shorter side of a 4:3 photo
+        scale = min(1.0, target_size / max(width, height))
+        img.draft("RGB", (max(1, int(width * scale)), max(1, int(height * scale))))
+        img.thumbnail((target_size, target_size))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        output = io.BytesIO()
+        img.save(output, format=OUTPUT_FORMAT, quality=OUTPUT_QUALITY)
+    except Exception as e:
+        raise ImageRejected(f"Failed to process image: {e}")
+    finally:
+        img.close()
+
+    return {"mime_type": MIME_TYPES.get(OUTPUT_FORMAT, "image/jpeg"), "data": output.getvalue()}
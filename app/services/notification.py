@@ -1,5 +1,170 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
 from firebase_admin import messaging
 
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """Bounded queue of FCM messages drained by background workers.
+
+    Workers pull up to `batch_size` queued messages at a time and send them
+    with one `messaging.send_each` call. Failed messages are retried with
+    exponential backoff up to `max_retries` times. When the queue is full new
+    messages are dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, workers=1, max_queue=1000, batch_size=100, max_retries=3, backoff=0.5, linger_ms=20):
+        self.workers = workers
+        self.batch_size = min(batch_size, 500)  # send_each accepts at most 500
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.linger = linger_ms / 1000
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.batches = 0
+        self.send_ms_total = 0.0
+        self.last_send_ms = 0.0
+
+    def submit(self, message) -> bool:
+        """Queue a message for sending. Returns False if it was dropped."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.error("Notification queue is full, dropping message")
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "workers": len(self._threads),
+                "sent": self.sent,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "retries": self.retries,
+                "batches": self.batches,
+                "avg_send_ms": round(self.send_ms_total / self.batches, 2) if self.batches else 0.0,
+                "last_send_ms": self.last_send_ms,
+            }
+
+    def stop(self, timeout=5):
+        """Send what is still queued, then stop the workers."""
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self.drain()
+
+    def drain(self):
+        """Send every queued message from the calling thread."""
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return
+            self._send(batch)
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"fcm-dispatcher-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _take(self, block=True):
+        try:
+            first = self._queue.get(timeout=0.5) if block else self._queue.get_nowait()
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._take()
+            if batch:
+                self._send(batch)
+
+    def _send(self, batch):
+        pending = batch
+        attempt = 0
+
+        while pending:
+            start = time.perf_counter()
+            try:
+                response = messaging.send_each(pending)
+                failures = [m for m, r in zip(pending, response.responses) if not r.success]
+            except Exception as e:
+                logger.error(f"FCM batch of {len(pending)} failed: {e}")
+                failures = pending
+            elapsed = (time.perf_counter() - start) * 1000
+
+            with self._lock:
+                self.batches += 1
+                self.sent += len(pending) - len(failures)
+                self.send_ms_total += elapsed
+                self.last_send_ms = round(elapsed, 2)
+
+            if not failures:
+                break
+
+            if attempt >= self.max_retries:
+                with self._lock:
+                    self.failed += len(failures)
+                logger.error(f"Giving up on {len(failures)} FCM messages after {attempt} retries")
+                break
+
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+            with self._lock:
+                self.retries += len(failures)
+            pending = failures
+
+        for _ in batch:
+            self._queue.task_done()
+
+
+def dispatcher_settings():
+    """Read dispatcher settings from the environment."""
+    return {
+        "workers": int(os.getenv("NOTIFICATION_WORKERS", "1")),
+        "max_queue": int(os.getenv("NOTIFICATION_QUEUE_SIZE", "1000")),
+        "batch_size": int(os.getenv("NOTIFICATION_BATCH_SIZE", "100")),
+        "max_retries": int(os.getenv("NOTIFICATION_MAX_RETRIES", "3")),
+    }
+
+
+dispatcher = NotificationDispatcher(**dispatcher_settings())
+atexit.register(dispatcher.stop)
+
+
 def send_fcm_notification(aquarium_id, sensor_type):
     title = f"AquaCare Alert: Aquarium {aquarium_id}"
     body = f"{sensor_type.capitalize()} is out of range!"
@@ -10,8 +175,7 @@ def send_fcm_notification(aquarium_id, sensor_type):
         topic=topic
     )
 
-    response = messaging.send(message)
-    print("FCM sent:", response)
+    return dispatcher.submit(message)
 
 
 def send_aquanotifier_notification(aquarium_id, message_ai, sensor):
@@ -24,5 +188,4 @@ def send_aquanotifier_notification(aquarium_id, message_ai, sensor):
         topic=topic
     )
 
-    response = messaging.send(message)
-    print("FCM sent: ", response)
\ No newline at end of file
+    return dispatcher.submit(message)
@@ -0,0 +1,369 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from google.api_core import exceptions as api_exceptions
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "Outbox"
+SCHEDULES_COLLECTION = "Schedules"
+
+
+class TankPiOutbox:
+    """Durable Firestore outbox of Tank-Pi commands, drained in the background.
+
+    Callers stage an "add" or "delete" command in the same WriteBatch as
+    their `Schedules` change, so the command is stored exactly when the task
+    is. A worker thread reads due commands and groups them per aquarium.
+    Commands of one aquarium go out in `created_at` order, and one that is
+    still backing off holds back every later command, so a delete never
+    overtakes the add of its task. An add that was never attempted and a
+    delete of the same task cancel out. Each aquarium's commands go out in
+    one `sender(aquarium_id, commands)` call, which returns one success flag
+    per command. Failed commands are retried with exponential backoff, up to
+    `max_attempts` times. Between drains the worker sleeps until the earliest
+    retry is due, or until `notify()` when nothing is pending, so an idle
+    outbox issues no queries.
+
+    Delivery state is written to the task document as `delivery`:
+    "pending", "delivered", "retrying" or "failed". An "add_many" command
+    carries a bulk task list and keeps only its undelivered tasks on retry.
+    """
+
+    def __init__(self, db, sender, batch_size=200, max_attempts=8, backoff=2.0, max_backoff=300.0):
+        self.db = db
+        self.sender = sender
+        self.batch_size = min(batch_size, 500)  # one WriteBatch per aquarium holds at most 500 writes
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.enqueued = 0
+        self.delivered = 0
+        self.cancelled = 0
+        self.retried = 0
+        self.failed = 0
+        self.deliveries = 0
+        self.last_drain_ms = 0.0
+
+    def stage(self, batch, kind, aquarium_id, payload, task_id, task_ids=None):
+        """Add a command for `task_id` to `batch`. Call `notify()` after commit.
+
+        For kind "add_many", `payload["tasks"]` holds the task payloads and
+        `task_ids` their document ids, in the same order.
+        """
+        ref = self.db.collection(OUTBOX_COLLECTION).document(uuid.uuid4().hex)
+        now = time.time()
+        command = {
+            "kind": kind,
+            "aquarium_id": aquarium_id,
+            "task_id": task_id,
+            "payload": payload,
+            "state": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+        }
+        if task_ids is not None:
+            command["task_ids"] = list(task_ids)
+        batch.set(ref, command)
+        with self._lock:
+            self.enqueued += len(task_ids) if task_ids is not None else 1
+        return ref
+
+    def cancel_task(self, batch, task_id):
+        """Add to `batch` the removal of every pending command that adds `task_id`.
+
+        A plain "add" is deleted. An "add_many" keeps its other tasks, or is
+        deleted when this was its last one. Returns the number of commands
+        changed.
+        """
+        pending = self.db.collection(OUTBOX_COLLECTION).where("state", "==", "pending")
+        changed = 0
+        for doc in pending.where("task_id", "==", task_id).stream():
+            if doc.to_dict()["kind"] == "add":
+                batch.delete(doc.reference)
+                changed += 1
+
+        for doc in pending.where("task_ids", "array_contains", task_id).stream():
+            data = doc.to_dict()
+            keep = [n for n, other in enumerate(data["task_ids"]) if other != task_id]
+            if keep:
+                batch.update(doc.reference, {
+                    "task_ids": [data["task_ids"][n] for n in keep],
+                    "payload": {**data["payload"], "tasks": [data["payload"]["tasks"][n] for n in keep]},
+                })
+            else:
+                batch.delete(doc.reference)
+            changed += 1
+
+        with self._lock:
+            self.cancelled += changed
+        return changed
+
+    def write_off_task(self, task_id, changes):
+        """Apply `changes` to a task that never reached the Pi and cancel its adds.
+
+        Runs under the drain lock, so no delivery of the task is in flight,
+        and decides on the task's current `delivery` instead of a snapshot
+        that may predate it. Returns False, changing nothing, if the task was
+        delivered meanwhile or no longer exists.
+        """
+        with self._drain_lock:
+            ref = self.db.collection(SCHEDULES_COLLECTION).document(task_id)
+            snapshot = ref.get()
+            if not snapshot.exists or snapshot.to_dict().get("delivery") == "delivered":
+                return False
+            batch = self.db.batch()
+            batch.update(ref, changes)
+            self.cancel_task(batch, task_id)
+            batch.commit()
+            return True
+
+    def notify(self):
+        """Wake the worker so freshly committed commands go out right away."""
+        self._ensure_started()
+        self._wake.set()
+
+    def start(self):
+        """Start the worker, e.g. at boot to resume commands left from a previous run."""
+        self.notify()
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enqueued": self.enqueued,
+                "delivered": self.delivered,
+                "cancelled": self.cancelled,
+                "retried": self.retried,
+                "failed": self.failed,
+                "deliveries": self.deliveries,
+                "last_drain_ms": self.last_drain_ms,
+            }
+
+    def drain(self, now=None):
+        """Deliver every due command once. Returns the number of commands handled."""
+        with self._drain_lock:
+            start = time.perf_counter()
+            now = now or time.time()
+            docs = (
+                self.db.collection(OUTBOX_COLLECTION)
+                .where("state", "==", "pending")
+                .where("next_attempt_at", "<=", now)
+                .order_by("next_attempt_at")
+                .limit(self.batch_size)
+                .stream()
+            )
+
+            by_aquarium = OrderedDict()
+            for doc in docs:
+                by_aquarium.setdefault(doc.to_dict()["aquarium_id"], []).append(doc)
+
+            handled = 0
+            for aquarium_id, due in by_aquarium.items():
+                ready, held = self._in_order(aquarium_id, due, now)
+                if ready:
+                    handled += self._deliver(aquarium_id, ready, now)
+                handled += len(held)
+
+            with self._lock:
+                self.last_drain_ms = round((time.perf_counter() - start) * 1000, 2)
+            return handled
+
+    def next_attempt_at(self):
+        """Return when the earliest pending command is due, or None if there is none."""
+        docs = (
+            self.db.collection(OUTBOX_COLLECTION)
+            .where("state", "==", "pending")
+            .order_by("next_attempt_at")
+            .limit(1)
+            .stream()
+        )
+        for doc in docs:
+            return doc.to_dict()["next_attempt_at"]
+        return None
+
+    def _in_order(self, aquarium_id, due, now):
+        """Split an aquarium's commands into those that may go out now and held ones.
+
+        Ready commands are the oldest pending ones up to the first that is
+        still backing off. Due commands queued after that one are held, and
+        get its `next_attempt_at` so they come due together with it.
+        """
+        queued = (
+            self.db.collection(OUTBOX_COLLECTION)
+            .where("state", "==", "pending")
+            .where("aquarium_id", "==", aquarium_id)
+            .order_by("created_at")
+            .limit(self.batch_size)
+            .stream()
+        )
+
+        ready, blocker = [], None
+        for doc in queued:
+            data = doc.to_dict()
+            if data["next_attempt_at"] > now:
+                blocker = data
+                break
+            ready.append(doc)
+        if blocker is None:
+            return ready, []
+
+        held = [doc for doc in due if doc.to_dict()["created_at"] > blocker["created_at"]]
+        if held:
+            batch = self.db.batch()
+            for doc in held:
+                batch.update(doc.reference, {"next_attempt_at": blocker["next_attempt_at"]})
+            batch.commit()
+        return ready, held
+
+    def _deliver(self, aquarium_id, pending, now):
+        pending = sorted(pending, key=lambda doc: doc.to_dict()["created_at"])
+        # An add that was attempted may have reached the Pi, so its delete still goes out
+        adds = {doc.to_dict()["task_id"]: doc for doc in pending if doc.to_dict()["kind"] == "add" and doc.to_dict()["attempts"] == 0}
+        deletes = {doc.to_dict()["task_id"] for doc in pending if doc.to_dict()["kind"] == "delete"}
+
+        # The Pi never saw these tasks, so neither the add nor the delete is sent
+        cancelled = [doc for doc in pending if doc.to_dict()["task_id"] in deletes and doc.to_dict()["task_id"] in adds]
+        outgoing = [doc for doc in pending if doc not in cancelled]
+
+        batch = self.db.batch()
+        for doc in cancelled:
+            batch.delete(doc.reference)
+
+        # An "add_many" command (a bulk task list) expands to one add per task
+        commands, spans = [], []
+        for doc in outgoing:
+            data = doc.to_dict()
+            if data["kind"] == "add_many":
+                expanded = [{"type": "add", **task} for task in data["payload"]["tasks"]]
+            else:
+                expanded = [{"type": data["kind"], **data["payload"]}]
+            spans.append((len(commands), len(commands) + len(expanded)))
+            commands += expanded
+
+        results = []
+        if commands:
+            try:
+                results = self.sender(aquarium_id, commands)
+            except Exception as e:
+                logger.error(f"Outbox delivery to aquarium {aquarium_id} failed: {e}")
+                results = [False] * len(commands)
+            with self._lock:
+                self.deliveries += 1
+
+        task_updates = {}
+        for doc, (first, last) in zip(outgoing, spans):
+            data = doc.to_dict()
+            task_ids = data["task_ids"] if data["kind"] == "add_many" else [data["task_id"]]
+            flags = results[first:last]
+            attempts = data["attempts"] + 1
+
+            delivered = [task_id for task_id, ok in zip(task_ids, flags) if ok]
+            remaining = [n for n, ok in enumerate(flags) if not ok]
+            with self._lock:
+                self.delivered += len(delivered)
+            if data["kind"] != "delete":
+                for task_id in delivered:
+                    task_updates[task_id] = {"delivery": "delivered", "delivered_at": now}
+
+            if not remaining:
+                batch.delete(doc.reference)
+                continue
+
+            changes = {"attempts": attempts}
+            if delivered:
+                # Only the tasks the Pi has not acknowledged are sent again
+                changes["payload"] = {**data["payload"], "tasks": [data["payload"]["tasks"][n] for n in remaining]}
+                changes["task_ids"] = [task_ids[n] for n in remaining]
+
+            if attempts >= self.max_attempts:
+                batch.update(doc.reference, {**changes, "state": "failed", "failed_at": now})
+                state = {"delivery": "failed", "delivery_attempts": attempts}
+                with self._lock:
+                    self.failed += 1
+                logger.error(f"Giving up on {data['kind']} of {len(remaining)} task(s) after {attempts} attempts")
+            else:
+                delay = min(self.backoff * (2 ** (attempts - 1)), self.max_backoff)
+                batch.update(doc.reference, {**changes, "next_attempt_at": now + delay})
+                state = {"delivery": "retrying", "delivery_attempts": attempts}
+                with self._lock:
+                    self.retried += 1
+            if data["kind"] != "delete":
+                for n in remaining:
+                    task_updates[task_ids[n]] = state
+
+        batch.commit()
+        with self._lock:
+            self.cancelled += len(cancelled)
+
+        self._mark_tasks(task_updates)
+        return len(pending)
+
+    def _mark_tasks(self, task_updates):
+        """Write delivery state to the task documents."""
+        if len(task_updates) > 1:
+            batch = self.db.batch()
+            for task_id, state in task_updates.items():
+                batch.update(self.db.collection(SCHEDULES_COLLECTION).document(task_id), state)
+            try:
+                batch.commit()
+                return
+            except api_exceptions.NotFound:
+                pass
+
+        for task_id, state in task_updates.items():
+            try:
+                self.db.collection(SCHEDULES_COLLECTION).document(task_id).update(state)
+            except api_exceptions.NotFound:
+                # Deleted while the command was in flight, its delete is queued
+                pass
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="tank-pi-outbox", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                # Keep going while full pages come back
+                while self.drain() >= self.batch_size:
+                    pass
+                wake_at = self.next_attempt_at()
+                timeout = None if wake_at is None else max(wake_at - time.time(), 0)
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                timeout = self.backoff
+            # A notify() during the drain leaves the event set, so it is not lost
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+
+def outbox_settings():
+    """Read outbox settings from the environment."""
+    return {
+        "batch_size": int(os.getenv("OUTBOX_BATCH_SIZE", "200")),
+        "max_attempts": int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8")),
+        "backoff": float(os.getenv("OUTBOX_BACKOFF_SECONDS", "2")),
+        "max_backoff": float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", "300")),
+    }
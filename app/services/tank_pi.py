@@ -0,0 +1,157 @@
+import os
+import ssl
+import time
+import atexit
+import logging
+import threading
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class TankPiClient:
+    """Shared, pooled HTTP client for Tank-Pi dispatches.
+
+    One `httpx.Client` is reused by every thread, so connections to the Pi
+    stay open between dispatches (keep-alive) instead of paying a TCP and TLS
+    handshake each time. Every request has strict connect/read timeouts, so a
+    hung Pi raises `httpx.TimeoutException` instead of blocking the caller.
+    """
+
+    def __init__(self, base_url, connect_timeout=3.0, read_timeout=10.0, max_connections=20,
+                 max_keepalive=10, keepalive_expiry=30.0, http2=False, verify=True, batch_endpoint=False):
+        self.base_url = base_url.rstrip("/")
+        self.batch_endpoint = batch_endpoint
+        # httpx wants an SSLContext rather than a CA bundle path
+        self.verify = ssl.create_default_context(cafile=verify) if isinstance(verify, str) else verify
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("TANK_PI_HTTP2 is set but the h2 package is missing, using HTTP/1.1")
+        self.http2 = http2 and HTTP2_AVAILABLE
+
+        self._client = None
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latency_ms_total = 0.0
+        self.last_latency_ms = 0.0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        base_url=self.base_url,
+                        http2=self.http2,
+                        verify=self.verify,
+                        timeout=self.timeout,
+                        limits=self.limits
+                    )
+        return self._client
+
+    def post(self, path, payload):
+        """POST `payload` as JSON to `path` on the Pi and return the response."""
+        start = time.perf_counter()
+        try:
+            return self.client.post(path, json=payload)
+        except httpx.TimeoutException:
+            with self._lock:
+                self.timeouts += 1
+            raise
+        except httpx.HTTPError:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.requests += 1
+                self.latency_ms_total += elapsed
+                self.last_latency_ms = round(elapsed, 2)
+
+    def add_task(self, aquarium_id, payload):
+        return self.post(f"/{aquarium_id}/add_task", payload)
+
+    def delete_task(self, aquarium_id, payload):
+        return self.post(f"/{aquarium_id}/delete_task", payload)
+
+    def send_commands(self, aquarium_id, commands):
+        """Deliver add/delete commands for one aquarium, in order.
+
+        With `batch_endpoint` all commands go out in one POST to
+        `/{aquarium_id}/tasks/batch`. Otherwise they are posted one by one to
+        add_task/delete_task over the pooled connection, stopping at the first
+        failure so later commands in the call never overtake it. Across
+        calls, the outbox holds back commands queued after a failed one.
+
+        Returns:
+            list: One success flag per command.
+        """
+        if self.batch_endpoint:
+            response = self.post(f"/{aquarium_id}/tasks/batch", {"aquarium_id": aquarium_id, "commands": commands})
+            response.raise_for_status()
+            return [True] * len(commands)
+
+        results = []
+        for command in commands:
+            payload = {k: v for k, v in command.items() if k != "type"}
+            try:
+                send = self.add_task if command["type"] == "add" else self.delete_task
+                send(aquarium_id, payload).raise_for_status()
+            except httpx.HTTPError as e:
+                logger.error(f"Tank-Pi {command['type']} for aquarium {aquarium_id} failed: {e}")
+                break
+            results.append(True)
+        return results + [False] * (len(commands) - len(results))
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "base_url": self.base_url,
+                "http2": self.http2,
+                "requests": self.requests,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "avg_latency_ms": round(self.latency_ms_total / self.requests, 2) if self.requests else 0.0,
+                "last_latency_ms": self.last_latency_ms,
+            }
+
+
+def tank_pi_settings():
+    """Read Tank-Pi client settings from the environment."""
+    return {
+        "base_url": os.getenv("TANK_PI_URL", "https://pi-cam.alfreds.dev"),
+        "connect_timeout": float(os.getenv("TANK_PI_CONNECT_TIMEOUT", "3")),
+        "read_timeout": float(os.getenv("TANK_PI_READ_TIMEOUT", "10")),
+        "max_connections": int(os.getenv("TANK_PI_MAX_CONNECTIONS", "20")),
+        "max_keepalive": int(os.getenv("TANK_PI_MAX_KEEPALIVE", "10")),
+        "http2": os.getenv("TANK_PI_HTTP2", "false").lower() in ["true", "1", "yes"],
+        # CA bundle for a Pi with a self-signed certificate
+        "verify": os.getenv("TANK_PI_CA_BUNDLE") or True,
+        # Only enable once the Pi firmware serves /{aquarium_id}/tasks/batch
+        "batch_endpoint": os.getenv("TANK_PI_BATCH_ENDPOINT", "false").lower() in ["true", "1", "yes"],
+    }
+
+
+tank_pi = TankPiClient(**tank_pi_settings())
+atexit.register(tank_pi.close)
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import tempfile
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TextCache:
+    """Thread-safe LRU cache of generated texts with a TTL.
+
+    Keys are strings so the cache can optionally be persisted as JSON at
+    `path`. The file is rewritten after every insert (inserts follow an LLM
+    call, so they are rare) and expired entries are skipped when loading.
+    """
+
+    def __init__(self, maxsize=512, ttl=3600.0, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_ms = 0.0
+
+        if path:
+            self.load()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry["created_at"] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_ms += entry.get("cost_ms", 0.0)
+                return entry["value"]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, cost_ms=0.0):
+        """Store `value`. `cost_ms` is what producing it took, reported as saved on hits."""
+        with self._lock:
+            self._entries[key] = {"value": value, "created_at": time.time(), "cost_ms": round(cost_ms, 2)}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        if self.path:
+            self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "latency_saved_ms": round(self.saved_ms, 2),
+            }
+
+    def save(self):
+        """Write the cache to `path` atomically.
+
+        Saves from concurrent `put` calls are serialized, and each one writes
+        its own temp file, so writers in other processes never collide either.
+        """
+        with self._save_lock:
+            with self._lock:
+                snapshot = dict(self._entries)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            tmp_path = None
+            try:
+                with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as f:
+                    tmp_path = f.name
+                    json.dump(snapshot, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not persist text cache to {self.path}: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                stored = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable text cache {self.path}: {e}")
+            return
+
+        now = time.time()
+        fresh = sorted(
+            ((k, v) for k, v in stored.items() if now - v.get("created_at", 0) < self.ttl),
+            key=lambda kv: kv[1]["created_at"]
+        )
+        with self._lock:
+            for key, entry in fresh[-self.maxsize:]:
+                self._entries[key] = entry
@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SensorWriteBuffer:
+    """Latest-wins write-behind buffer for per-aquarium RTDB updates.
+
+    `put()` merges path updates into an in-memory map keyed by aquarium_id and
+    returns immediately. A background thread pushes every dirty aquarium with
+    one multi-location `writer(updates)` call each `flush_interval_ms`.
+
+    Bounds:
+        - max_size: dirty aquariums allowed before `put()` flushes inline.
+        - max_staleness_ms: age of the oldest unflushed update after which
+          `put()` flushes inline, e.g. while the writer keeps failing.
+    """
+
+    def __init__(self, writer, flush_interval_ms=500, max_size=1000, max_staleness_ms=5000):
+        self.writer = writer
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_size = max_size
+        self.max_staleness = max_staleness_ms / 1000
+
+        self._dirty = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.puts = 0
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+
+    def put(self, aquarium_id, updates):
+        """Queue `updates` (paths relative to the aquarium) for the next flush."""
+        self._ensure_started()
+
+        with self._lock:
+            self._dirty.setdefault(str(aquarium_id), {}).update(updates)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self.puts += 1
+            overflow = len(self._dirty) >= self.max_size
+            stale = time.monotonic() - self._oldest >= self.max_staleness
+
+        if overflow or stale or self._stopped.is_set():
+            self.flush()
+
+    def latest(self, aquarium_id, path):
+        """Return a buffered value that has not been flushed yet, or None."""
+        with self._lock:
+            return self._dirty.get(str(aquarium_id), {}).get(path)
+
+    def flush(self):
+        """Write every dirty aquarium with one update. Returns paths written."""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                oldest, self._oldest = self._oldest, None
+
+            if not dirty:
+                return 0
+
+            updates = {
+                f"{aquarium_id}/{path}": value
+                for aquarium_id, paths in dirty.items()
+                for path, value in paths.items()
+            }
+
+            start = time.perf_counter()
+            try:
+                self.writer(updates)
+            except Exception as e:
+                logger.error(f"Sensor write-behind flush failed, will retry: {e}")
+                with self._lock:
+                    self.failures += 1
+                    # Keep anything newer that arrived while we were writing
+                    for aquarium_id, paths in dirty.items():
+                        self._dirty[aquarium_id] = {**paths, **self._dirty.get(aquarium_id, {})}
+                    self._oldest = oldest if self._oldest is None else min(oldest, self._oldest)
+                return 0
+
+            with self._lock:
+                self.flushes += 1
+                self.written += len(dirty)
+                self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+            return len(updates)
+
+    def stop(self):
+        """Stop the flusher and write whatever is still buffered."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "dirty": len(self._dirty),
+                "puts": self.puts,
+                "flushes": self.flushes,
+                "written": self.written,
+                "coalesced": max(self.puts - self.written - len(self._dirty), 0),
+                "failures": self.failures,
+                "last_flush_ms": self.last_flush_ms,
+            }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="sensor-write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Sensor write-behind flusher error: {e}")
+
+
+def write_behind_settings():
+    """Read write-behind settings from the environment."""
+    return {
+        "enabled": os.getenv("SENSOR_WRITE_BEHIND", "false").lower() in ["true", "1", "yes"],
+        "flush_interval_ms": int(os.getenv("SENSOR_FLUSH_INTERVAL_MS", "500")),
+        "max_size": int(os.getenv("SENSOR_BUFFER_MAX", "1000")),
+        "max_staleness_ms": int(os.getenv("SENSOR_MAX_STALENESS_MS", "5000")),
+    }
@@ -0,0 +1,152 @@
+"""Benchmark: peak RSS of one /ask image decode, legacy path vs pipeline.
+
+Each mode runs in a fresh interpreter. On Linux the peak is reset right
+before the call (`clear_refs`), so VmHWM - VmRSS is the peak of that call
+alone. Elsewhere a thread samples RSS during the call. The photo is a
+synthetic 12 MP JPEG.
+
+    python -m benchmarks.bench_image_rss --megapixels 12
+"""
+import argparse
+import base64
+import gc
+import io
+import json
+import subprocess
+import sys
+import threading
+import time
+
+MODES = ("legacy", "pipeline_base64", "pipeline_multipart")
+
+
+def make_photo(megapixels: float) -> bytes:
+    from PIL import Image
+
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    img = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def proc_status_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def reset_peak_rss() -> bool:
+    """Reset VmHWM to the current RSS. Returns False where that is unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class RssSampler:
+    """Fallback peak tracker that polls RSS from a thread."""
+
+    def __init__(self, interval=0.001):
+        import psutil
+
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak = self.process.memory_info().rss
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(self.interval)
+
+
+def run_mode(mode: str, path: str):
+    from PIL import Image
+    from app.services.image_pipeline import decode_base64_payload, prepare_image
+
+    with open(path, "rb") as f:
+        photo = f.read()
+    payload = base64.b64encode(photo).decode() if mode != "pipeline_multipart" else None
+    del photo
+    # Warm up both paths on a small image, so one-time library setup that a
+    # running server pays once is not counted as per-request memory
+    warmup = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(warmup, format="JPEG")
+    Image.open(io.BytesIO(warmup.getvalue())).load()
+    prepare_image(warmup.getvalue())
+    gc.collect()
+
+    def call():
+        if mode == "legacy":
+            # What decode_base64_image did: full decode handed to the SDK
+            img = Image.open(io.BytesIO(base64.b64decode(payload)))
+            img.load()
+            return img.width * img.height * 3
+        if mode == "pipeline_base64":
+            return len(prepare_image(decode_base64_payload(payload))["data"])
+        with open(path, "rb") as f:
+            return len(prepare_image(f.read())["data"])
+
+    if reset_peak_rss():
+        before = proc_status_kb("VmRSS")
+        start = time.perf_counter()
+        sent = call()
+        elapsed = (time.perf_counter() - start) * 1000
+        delta_kb = proc_status_kb("VmHWM") - before
+        method = "vmhwm"
+    else:
+        with RssSampler() as sampler:
+            before = sampler.peak
+            start = time.perf_counter()
+            sent = call()
+            elapsed = (time.perf_counter() - start) * 1000
+        delta_kb = (sampler.peak - before) / 1024
+        method = "sampled"
+
+    print(json.dumps({"mode": mode, "rss_delta_mb": delta_kb / 1024, "ms": elapsed, "bytes_to_model": sent, "method": method}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--mode", choices=MODES)
+    parser.add_argument("--path", default="/tmp/aquacare_bench_photo.jpg")
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.path)
+        return
+
+    photo = make_photo(args.megapixels)
+    with open(args.path, "wb") as f:
+        f.write(photo)
+    print(f"photo: {args.megapixels} MP, {len(photo) / 1e6:.1f} MB JPEG")
+
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_image_rss", "--mode", mode, "--path", args.path],
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(out)
+        print(f"{mode:>18} | peak RSS +{result['rss_delta_mb']:7.1f} MB ({result['method']}) | {result['ms']:7.1f} ms | {result['bytes_to_model'] / 1e6:6.2f} MB to model")
+
+
+if __name__ == "__main__":
+    main()
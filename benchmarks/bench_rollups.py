@@ -0,0 +1,82 @@
+"""Micro-benchmark: per-aquarium Python loop vs vectorized NumPy rollups.
+
+Runs on synthetic `average` windows, no Firebase traffic. The app package
+still loads its Firebase credentials on import, same as run.py.
+
+    python -m benchmarks.bench_rollups --aquariums 2000
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+from app.services.analytics import SENSORS, DAILY_SLOTS, PERIODS, compute_rollups
+
+
+def synthetic_windows(aquariums: int) -> list:
+    rng = random.Random(42)
+    windows = []
+    for _ in range(aquariums):
+        days = rng.randint(1, DAILY_SLOTS)
+        windows.append([
+            {"ph": rng.uniform(6, 8.5), "temperature": rng.uniform(22, 30), "turbidity": rng.uniform(0, 300)}
+            for _ in range(days)
+        ])
+    return windows
+
+
+def loop_rollups(windows: list, days: int) -> list:
+    """The current style: Python lists and sum/len per aquarium."""
+    results = []
+    for window in windows:
+        recent = window[-days:]
+        summary = {}
+        for sensor in SENSORS:
+            values = [day[sensor] for day in recent]
+            summary[sensor] = (sum(values) / len(values), min(values), max(values))
+        results.append(summary)
+
+    fleet = {}
+    for sensor in SENSORS:
+        means = sorted(r[sensor][0] for r in results)
+        fleet[sensor] = statistics.quantiles(means, n=20, method="inclusive")
+    return results
+
+
+def to_array(windows: list) -> np.ndarray:
+    values = np.full((len(windows), len(SENSORS), DAILY_SLOTS), np.nan)
+    for row, window in enumerate(windows):
+        start = DAILY_SLOTS - len(window)
+        for column, day in enumerate(window):
+            values[row, :, start + column] = [day[sensor] for sensor in SENSORS]
+    return values
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--aquariums", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    windows = synthetic_windows(args.aquariums)
+    values = to_array(windows)
+
+    for period, days in PERIODS.items():
+        loop = timed(lambda: loop_rollups(windows, days), args.repeat)
+        vectorized = timed(lambda: compute_rollups(values, days), args.repeat)
+        print(f"{period:>5} | {args.aquariums} aquariums | loop {loop * 1000:8.2f} ms | numpy {vectorized * 1000:8.2f} ms | x{loop / vectorized:.1f}")
+
+
+if __name__ == "__main__":
+    main()
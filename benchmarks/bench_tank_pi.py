@@ -0,0 +1,131 @@
+"""Benchmark: Tank-Pi dispatch with bare requests.post vs the pooled client.
+
+Dispatches go to a local stub of the Pi's add_task endpoint. With --tls the
+stub serves HTTPS with a throwaway self-signed certificate, so the cost of a
+fresh TLS handshake per dispatch shows up like it does against the real Pi.
+
+    python -m benchmarks.bench_tank_pi --dispatches 500 --concurrency 8 --tls
+"""
+import argparse
+import datetime
+import ipaddress
+import json
+import os
+import ssl
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.services.tank_pi import TankPiClient
+
+
+class StubPi(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, avoid Nagle stalls on reused connections
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        body = json.dumps({"status": "queued"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def self_signed_cert(directory):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+def start_stub(tls_dir, delay_ms):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubPi)
+    server.daemon_threads = True
+    server.delay = delay_ms / 1000
+    scheme, cert_path = "http", None
+    if tls_dir:
+        cert_path, key_path = self_signed_cert(tls_dir)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}", cert_path
+
+
+def run(dispatch, dispatches, concurrency):
+    payload = {"aquarium_id": 1, "cycle": 2, "job_id": "schedule_at_2025-01-01_08:00:00", "food": "pellet", "schedule_time": "2025-01-01 08:00:00"}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(lambda i: dispatch(i % 50, payload), range(dispatches)))
+    elapsed = time.perf_counter() - start
+    assert all(status == 200 for status in statuses)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dispatches", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--delay-ms", type=float, default=0, help="Simulated Pi processing time")
+    parser.add_argument("--tls", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tls_dir:
+        server, base_url, cert_path = start_stub(tls_dir if args.tls else None, args.delay_ms)
+        verify = cert_path or True
+
+        def bare(aquarium_id, payload):
+            # What send_schedule_raspi did: a new connection per dispatch
+            return requests.post(f"{base_url}/{aquarium_id}/add_task", json=payload, verify=verify).status_code
+
+        pooled_client = TankPiClient(base_url, verify=verify)
+
+        def pooled(aquarium_id, payload):
+            return pooled_client.add_task(aquarium_id, payload).status_code
+
+        print(f"{args.dispatches} dispatches, {args.concurrency} threads, {'HTTPS' if args.tls else 'HTTP'} stub")
+        for label, dispatch in (("requests.post", bare), ("TankPiClient", pooled)):
+            run(dispatch, min(20, args.dispatches), args.concurrency)  # warm-up
+            elapsed = run(dispatch, args.dispatches, args.concurrency)
+            print(f"{label:>14} | {elapsed * 1000:8.1f} ms | {args.dispatches / elapsed:8.1f} dispatches/s")
+
+        pooled_client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
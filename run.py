@@ -12,6 +12,8 @@ from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
 from app import create_app
 from app.services import firebase
 from app.services import firestore
+from app.services import analytics
+from app.services import chat_storage
 
 
 LOG_FORMAT = "[%(asctime)s] [%(levelname)s] %(message)s"
@@ -29,6 +31,41 @@ app = create_app()
 CORS(app)
 
 
+def job_listener(event):
+    if event.exception:
+        logger.error(f" Job {event.job_id} failed: {event.exception}")
+    else:
+        logger.info(f" Job {event.job_id} executed successfully at {datetime.now(ZoneInfo('Asia/Manila'))}")
+
+
+scheduler = BackgroundScheduler()
+scheduler.add_listener(job_listener, EVENT_JOB_ERROR | EVENT_JOB_EXECUTED)
+scheduler.add_job(
+    analytics.run_rollup_job,
+    "cron",
+    hour=0,
+    minute=15,
+    id="fleet_rollups",
+    replace_existing=True,
+    coalesce=True
+)
+scheduler.add_job(
+    chat_storage.compact_sessions,
+    "interval",
+    hours=1,
+    id="chat_session_compaction",
+    replace_existing=True,
+    coalesce=True
+)
+scheduler.start()
+atexit.register(lambda: scheduler.shutdown(wait=False))
+
+# Deliver Tank-Pi commands left in the outbox by a previous run
+firestore.outbox.start()
+
+# Load pending tasks with one query, then follow changes through the listener
+firestore.due_tasks.start(firestore.pending_tasks_query())
+
 
 
 
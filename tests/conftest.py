@@ -0,0 +1,347 @@
+import copy
+import itertools
+
+import pytest
+
+
+class FakeRealtimeDb:
+    """In-memory stand-in for firebase_admin.db that counts round trips."""
+
+    def __init__(self, data=None):
+        self.data = copy.deepcopy(data) if data else {}
+        self.calls = []
+        self._push_ids = itertools.count(1)
+
+    @property
+    def round_trips(self):
+        return len(self.calls)
+
+    def reference(self, path=""):
+        return FakeReference(self, path)
+
+    def _parts(self, path):
+        return [p for p in str(path).split("/") if p]
+
+    def _get(self, path):
+        node = self.data
+        for part in self._parts(path):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return copy.deepcopy(node)
+
+    def _set(self, path, value):
+        parts = self._parts(path)
+        if not parts:
+            self.data = copy.deepcopy(value) if value else {}
+            return
+        node = self.data
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if value is None or value == {}:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+        self._prune()
+
+    def _prune(self):
+        def prune(node):
+            for key in list(node):
+                if isinstance(node[key], dict):
+                    prune(node[key])
+                    if not node[key]:
+                        del node[key]
+        prune(self.data)
+
+
+class FakeQuery:
+    def __init__(self, ref, by_value=False):
+        self.ref = ref
+        self.by_value = by_value
+        self._start = None
+        self._end = None
+        self._last = None
+        self._first = None
+
+    def start_at(self, key):
+        self._start = key
+        return self
+
+    def end_at(self, key):
+        self._end = key
+        return self
+
+    def limit_to_last(self, n):
+        self._last = n
+        return self
+
+    def limit_to_first(self, n):
+        self._first = n
+        return self
+
+    def get(self):
+        self.ref.db.calls.append(("query", self.ref.path))
+        value = self.ref.db._get(self.ref.path)
+        if not isinstance(value, dict):
+            return {}
+        if self.by_value:
+            items = sorted(value.items(), key=lambda kv: (kv[1], str(kv[0])))
+            sort_key = lambda kv: kv[1]
+        else:
+            items = sorted(value.items(), key=lambda kv: str(kv[0]))
+            sort_key = lambda kv: str(kv[0])
+        if self._start is not None:
+            items = [kv for kv in items if sort_key(kv) >= (self._start if self.by_value else str(self._start))]
+        if self._end is not None:
+            items = [kv for kv in items if sort_key(kv) <= (self._end if self.by_value else str(self._end))]
+        if self._first is not None:
+            items = items[:self._first]
+        if self._last is not None:
+            items = items[-self._last:]
+        return dict(items)
+
+
+class FakeReference:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = "/".join(db._parts(path))
+
+    @property
+    def key(self):
+        return self.path.rsplit("/", 1)[-1] if self.path else None
+
+    def child(self, path):
+        return FakeReference(self.db, f"{self.path}/{path}")
+
+    def get(self, shallow=False):
+        self.db.calls.append(("shallow" if shallow else "get", self.path))
+        value = self.db._get(self.path)
+        if shallow and isinstance(value, dict):
+            return {k: True for k in value}
+        return value
+
+    def set(self, value):
+        self.db.calls.append(("set", self.path))
+        self.db._set(self.path, value)
+
+    def update(self, value):
+        self.db.calls.append(("update", self.path))
+        for key, item in value.items():
+            self.db._set(f"{self.path}/{key}", item)
+
+    def delete(self):
+        self.db.calls.append(("delete", self.path))
+        self.db._set(self.path, None)
+
+    def push(self, value=""):
+        self.db.calls.append(("push", self.path))
+        key = f"-push{next(self.db._push_ids):06d}"
+        self.db._set(f"{self.path}/{key}", value)
+        return self.child(key)
+
+    def transaction(self, transaction_update):
+        self.db.calls.append(("transaction", self.path))
+        result = transaction_update(self.db._get(self.path))
+        # Like firebase_admin's set_if_unchanged
+        if result is None:
+            raise ValueError("Value must not be none.")
+        # An empty object is stored as no data
+        self.db._set(self.path, result if result != {} else None)
+        return result
+
+    def order_by_key(self):
+        return FakeQuery(self)
+
+    def order_by_value(self):
+        return FakeQuery(self, by_value=True)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    from app.services import firebase
+
+    fake = FakeRealtimeDb()
+    monkeypatch.setattr(firebase, "db", fake)
+    firebase.config_cache.clear()
+    firebase._initialized.clear()
+    firebase._synced_index.clear()
+    firebase._migrated_schedules.clear()
+    yield fake
+    firebase.config_cache.clear()
+    firebase._initialized.clear()
+    firebase._synced_index.clear()
+    firebase._migrated_schedules.clear()
+
+
+class FakeFirestore:
+    """In-memory stand-in for a Firestore client: documents, queries and batches."""
+
+    def __init__(self):
+        self.collections = {}
+        self.commits = 0
+        self._ids = itertools.count(1)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, refs):
+        for ref in refs:
+            yield ref.get()
+
+    def docs(self, name):
+        return self.collections.setdefault(name, {})
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self):
+        return self._data
+
+
+class FakeDocument:
+    def __init__(self, store, collection, doc_id):
+        self.store = store
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self):
+        return FakeSnapshot(self, self.store.docs(self.collection).get(self.id))
+
+    def set(self, data, merge=False):
+        docs = self.store.docs(self.collection)
+        docs[self.id] = {**docs.get(self.id, {}), **copy.deepcopy(data)} if merge else copy.deepcopy(data)
+
+    def update(self, data):
+        from google.api_core.exceptions import NotFound
+
+        docs = self.store.docs(self.collection)
+        if self.id not in docs:
+            raise NotFound(f"{self.collection}/{self.id}")
+        docs[self.id].update(copy.deepcopy(data))
+
+    def delete(self):
+        self.store.docs(self.collection).pop(self.id, None)
+
+
+OPERATORS = {
+    "==": lambda a, b: a == b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: a is not None and b in a,
+}
+
+
+class FakeCollection:
+    def __init__(self, store, name, filters=(), order=(), limit=None, start_after=None, fields=None):
+        self.store = store
+        self.name = name
+        self.filters = list(filters)
+        self.order = list(order)
+        self._limit = limit
+        self._start_after = start_after
+        self.fields = fields
+
+    def _copy(self, **changes):
+        state = dict(filters=self.filters, order=self.order, limit=self._limit,
+                     start_after=self._start_after, fields=self.fields)
+        state.update(changes)
+        return FakeCollection(self.store, self.name, **state)
+
+    def document(self, doc_id=None):
+        return FakeDocument(self.store, self.name, doc_id or f"auto{next(self.store._ids)}")
+
+    def where(self, field, op, value):
+        return self._copy(filters=self.filters + [(field, op, value)])
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(order=self.order + [(field, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, values):
+        return self._copy(start_after=values)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def stream(self):
+        docs = self.store.docs(self.name)
+        matches = [
+            (doc_id, data) for doc_id, data in docs.items()
+            if all(OPERATORS[op](data.get(field), value) for field, op, value in self.filters)
+        ]
+        for field, direction in reversed(self.order):
+            key = (lambda item: item[0]) if field == "__name__" else (lambda item, f=field: item[1].get(f))
+            matches.sort(key=key, reverse=direction == "DESCENDING")
+        if self._start_after is not None:
+            keys = [(lambda d, i, f=f: i if f == "__name__" else d.get(f)) for f, _ in self.order]
+            values = list(self._start_after.values()) if isinstance(self._start_after, dict) else list(self._start_after)
+            index = next((n for n, (doc_id, data) in enumerate(matches)
+                          if [k(data, doc_id) for k in keys] == values), None)
+            matches = matches[index + 1:] if index is not None else matches
+        if self._limit is not None:
+            matches = matches[:self._limit]
+        for doc_id, data in matches:
+            if self.fields is not None:
+                data = {k: v for k, v in data.items() if k in self.fields}
+            yield FakeSnapshot(FakeDocument(self.store, self.name, doc_id), data)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self.store = store
+        self.writes = []
+        self.creates = []
+
+    def create(self, ref, data):
+        self.creates.append(ref)
+        self.writes.append(lambda: ref.set(data))
+
+    def set(self, ref, data, merge=False):
+        self.writes.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self.writes.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self.writes.append(ref.delete)
+
+    def commit(self):
+        from google.api_core.exceptions import AlreadyExists
+
+        if len(self.writes) > 500:
+            raise ValueError("A batch holds at most 500 writes")
+        # Like Firestore, one failed create precondition fails the whole batch
+        for ref in self.creates:
+            if ref.id in self.store.docs(ref.collection):
+                raise AlreadyExists(f"{ref.collection}/{ref.id}")
+        for write in self.writes:
+            write()
+        self.store.commits += 1
+        return self.writes
+
+
+@pytest.fixture
+def fake_firestore(monkeypatch):
+    from app.services import firestore
+
+    fake = FakeFirestore()
+    monkeypatch.setattr(firestore, "db", fake)
+    monkeypatch.setattr(firestore.outbox, "db", fake)
+    monkeypatch.setattr(firestore.outbox, "notify", lambda: None)
+    yield fake
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from app.routes.ai_route import ai_bp
+from app.services import ai, chat_storage
+from app.services.gemini_client import GeminiClient
+
+
+class FakeModel:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.calls = []
+
+    def generate_content(self, contents, stream=False, request_options=None):
+        self.calls.append((contents, stream))
+        return (SimpleNamespace(text=piece) for piece in self.pieces)
+
+
+@pytest.fixture(autouse=True)
+def empty_answer_cache():
+    ai.answer_cache.clear()
+    yield
+
+
+@pytest.fixture
+def chat_db(fake_db, monkeypatch):
+    monkeypatch.setattr(chat_storage, "db", fake_db)
+    chat_storage._tails.clear()
+    yield fake_db
+    chat_storage._tails.clear()
+
+
+def stored(chat_db, session_id):
+    messages = chat_db.data["chat_sessions"][session_id]["messages"]
+    return [(m["role"], m["message"]) for _, m in sorted(messages.items())]
+
+
+def test_stream_relays_chunks_and_stores_full_answer(chat_db, monkeypatch):
+    monkeypatch.setattr(ai, "model", FakeModel(["Hi, I'm Aquabot", ", keep pH ", "near 7."]))
+
+    response, status = ai.ask_gemini_stream(text="Best pH for guppies?", session_id="s1")
+
+    assert status == 200
+    assert list(response["chunks"]) == ["Hi, I'm Aquabot", ", keep pH ", "near 7."]
+    assert ai.model.calls[0][1] is True
+    assert stored(chat_db, "s1") == [
+        ("user", "Best pH for guppies?"),
+        ("ai", "Hi, I'm Aquabot, keep pH near 7."),
+    ]
+
+
+def test_cancelled_stream_stores_partial_answer(chat_db, monkeypatch):
+    monkeypatch.setattr(ai, "model", FakeModel(["First part.", " Second part."]))
+
+    response, _ = ai.ask_gemini_stream(text="Tell me about bettas", session_id="s2")
+    chunks = response["chunks"]
+    assert next(chunks) == "First part."
+    chunks.close()
+
+    assert stored(chat_db, "s2") == [("user", "Tell me about bettas"), ("ai", "First part.")]
+
+
+def test_stream_rejects_bad_input_before_streaming(monkeypatch):
+    monkeypatch.setattr(ai, "model", FakeModel([]))
+
+    assert ai.ask_gemini_stream()[1] == 400
+    assert ai.ask_gemini_stream(image="not base64 !!")[1] == 400
+
+
+@pytest.fixture
+def one_slot(monkeypatch):
+    monkeypatch.setattr(ai, "model", FakeModel(["First part.", " Second part."]))
+    monkeypatch.setattr(ai, "gemini", GeminiClient(max_concurrent=1, queue_wait_ms=0))
+    app = Flask(__name__)
+    app.register_blueprint(ai_bp)
+    return app.test_client()
+
+
+def test_disconnect_after_first_event_frees_the_slot(chat_db, one_slot):
+    response = one_slot.post("/ask/stream", json={"question": "Tell me about bettas", "session_id": "s3"}, buffered=False)
+    assert next(response.response).startswith(b"event: session")
+    response.close()
+
+    assert ai.gemini.stats()["in_flight"] == 0
+    assert stored(chat_db, "s3") == [("user", "Tell me about bettas")]
+    assert one_slot.post("/ask/stream", json={"question": "Again?"}).status_code == 200
+
+
+def test_disconnect_before_first_event_frees_the_slot(chat_db, one_slot):
+    response = one_slot.post("/ask/stream", json={"question": "Tell me about bettas", "session_id": "s4"}, buffered=False)
+    response.close()
+
+    assert ai.gemini.stats()["in_flight"] == 0
+    assert stored(chat_db, "s4") == [("user", "Tell me about bettas")]
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from app.services import analytics
+from app.services.firebase import local_today
+
+
+@pytest.fixture
+def fleet_db(fake_db, monkeypatch):
+    monkeypatch.setattr(analytics, "db", fake_db)
+    return fake_db
+
+
+def day(ph, age=0):
+    return {"ph": ph, "temperature": 26.0, "turbidity": 100.0, "date": (local_today() - timedelta(days=age)).isoformat()}
+
+
+def test_window_is_read_oldest_first_after_wrap(fleet_db):
+    fleet_db.data = {"aquariums": {"1": {"average": {"index": 2, **{str(i): day(i) for i in range(1, 31)}}}}}
+
+    window = analytics.read_average_window(1)
+
+    assert [d["ph"] for d in window][:3] == [3, 4, 5]
+    assert [d["ph"] for d in window][-2:] == [1, 2]
+
+
+def test_rollups_and_fleet_percentiles(fleet_db):
+    fleet_db.data = {"aquariums": {
+        "1": {"average": {"index": 8, **{str(i): day(7.0, age=8 - i) for i in range(1, 9)}}},
+        "2": {"average": {"index": 1, "1": day(8.0)}},
+        "3": {"name": "No history yet"},
+    }}
+
+    result = analytics.fleet_rollups("week")
+
+    assert set(result["aquariums"]) == {"1", "2", "3"}
+    assert result["aquariums"]["1"]["ph"] == {"mean": 7.0, "min": 7.0, "max": 7.0, "days": 7}
+    assert result["aquariums"]["2"]["ph"]["days"] == 1
+    assert result["aquariums"]["3"]["ph"]["mean"] is None
+    assert result["fleet"]["ph"]["p50"] == 7.5
+
+
+def test_compute_rollups_matches_python_loop():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(6, 8, size=(50, 3, 30))
+    values[::3, :, :10] = np.nan
+
+    rollups = analytics.compute_rollups(values, 30)
+
+    for row in range(50):
+        present = [v for v in values[row, 0] if not np.isnan(v)]
+        assert rollups["mean"][row, 0] == pytest.approx(np.mean(present))
+        assert rollups["min"][row, 0] == min(present)
+        assert rollups["count"][row, 0] == len(present)
+
+
+def test_rollups_use_record_dates_not_ring_position(fleet_db):
+    fleet_db.data = {"aquariums": {
+        # Stopped posting almost four weeks ago
+        "1": {"average": {"index": 7, **{str(i): day(6.0, age=25 + i) for i in range(1, 8)}}},
+        # Undated records from before records carried a date
+        "2": {"average": {"index": 1, "1": {"ph": 7.0}}},
+        "3": {"average": {"index": 2, "1": day(7.0), "2": day(8.0)}},
+    }}
+
+    week = analytics.fleet_rollups("week")
+    month = analytics.fleet_rollups("month")
+
+    assert week["aquariums"]["1"]["ph"]["days"] == 0
+    assert month["aquariums"]["1"]["ph"]["days"] == 4
+    assert week["aquariums"]["2"]["ph"]["days"] == 0
+    # Two records closed on the same date count as one day
+    assert week["aquariums"]["3"]["ph"] == {"mean": 7.5, "min": 7.5, "max": 7.5, "days": 1}
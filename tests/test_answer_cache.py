@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import ai, chat_storage
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False, request_options=None):
+        self.calls += 1
+        return SimpleNamespace(text=f"Answer {self.calls}")
+
+
+@pytest.fixture
+def chat_db(fake_db, monkeypatch):
+    monkeypatch.setattr(chat_storage, "db", fake_db)
+    monkeypatch.setattr(ai, "model", CountingModel())
+    chat_storage._tails.clear()
+    ai.answer_cache.clear()
+    yield fake_db
+    chat_storage._tails.clear()
+
+
+def test_normalization():
+    assert ai.normalize_question("  What pH for GUPPIES?? ") == ai.normalize_question("what ph for guppies")
+    assert ai.normalize_question("Why is my water cloudy!", stem=True) == ai.normalize_question("why is my water cloudy", stem=True)
+    assert ai.normalize_question("guppies", stem=True) == ai.normalize_question("guppy", stem=True)
+    assert ai.normalize_question("guppies", stem=False) != ai.normalize_question("guppy", stem=False)
+
+
+def test_repeated_opening_question_is_served_from_cache(chat_db):
+    hits_before = ai.answer_cache.stats()["hits"]
+
+    first, _ = ai.ask_gemini(text="What pH for guppies?", session_id="a")
+    second, _ = ai.ask_gemini(text="what ph for guppies", session_id="b")
+
+    assert first["AI_Response"] == second["AI_Response"] == "Answer 1"
+    assert ai.model.calls == 1
+    assert ai.answer_cache.stats()["hits"] - hits_before == 1
+    # The cached answer still becomes part of the second session
+    assert chat_storage.load_message("b")[-1] == {"role": "ai", "message": "Answer 1"}
+
+
+def test_history_dependent_questions_bypass_cache(chat_db):
+    ai.ask_gemini(text="Tell me about bettas", session_id="a")
+    ai.ask_gemini(text="Tell me about bettas", session_id="b")
+    ai.ask_gemini(text="What do they eat?", session_id="a")
+    ai.ask_gemini(text="What do they eat?", session_id="b")
+
+    assert ai.model.calls == 3
+    assert ai.answer_cache_key("What do they eat?", []) == "new:what do they eat"
+    assert ai.answer_cache_key("Why is my water cloudy?", [{"role": "user", "message": "hi"}]) == "followup:why is my water cloudy"
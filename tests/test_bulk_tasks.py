@@ -0,0 +1,71 @@
+from app.services import firestore
+from app.services.outbox import TankPiOutbox
+
+
+def week(count, cycle=2):
+    return [{"schedule_time": f"2025-11-{day:02d} 08:00:00", "cycle": cycle, "food": "pellets"} for day in range(1, count + 1)]
+
+
+def test_bulk_commits_in_batches_with_one_command_each(fake_firestore, monkeypatch):
+    monkeypatch.setattr(firestore, "BULK_TASKS_PER_BATCH", 4)
+
+    results = firestore.create_schedules_bulk(3, week(10))
+
+    assert [r["status"] for r in results] == ["created"] * 10
+    assert len(fake_firestore.docs("Schedules")) == 10
+    commands = list(fake_firestore.docs("Outbox").values())
+    assert [len(c["task_ids"]) for c in commands] == [4, 4, 2]
+    assert fake_firestore.commits == 3
+
+
+def test_retry_is_idempotent_and_reports_each_item(fake_firestore):
+    firestore.create_schedules_bulk(3, week(3))
+    commits = fake_firestore.commits
+
+    tasks = week(4) + [week(1)[0], {"schedule_time": "tomorrow", "cycle": 1}]
+    tasks[1] = {**tasks[1], "cycle": 5}
+    results = firestore.create_schedules_bulk(3, tasks)
+
+    assert [r["status"] for r in results] == ["exists", "conflict", "exists", "created", "duplicate", "invalid"]
+    assert len(fake_firestore.docs("Schedules")) == 4
+    assert fake_firestore.commits == commits + 1
+    assert sum(len(c["task_ids"]) for c in fake_firestore.docs("Outbox").values()) == 4
+
+
+def test_pi_receives_list_and_only_missing_tasks_are_resent(fake_firestore):
+    firestore.create_schedules_bulk(3, week(3))
+    deliveries = []
+
+    def flaky_pi(aquarium_id, commands):
+        deliveries.append([c["job_id"] for c in commands])
+        return [True] + [len(deliveries) > 1] * (len(commands) - 1)
+
+    outbox = TankPiOutbox(fake_firestore, flaky_pi, backoff=0)
+    outbox.drain()
+    outbox.drain()
+
+    assert deliveries[0] == [f"3_schedule_at_2025-11-0{day} 08:00:00" for day in (1, 2, 3)]
+    assert len(deliveries[1]) == 2
+    assert fake_firestore.docs("Outbox") == {}
+    assert {t["delivery"] for t in fake_firestore.docs("Schedules").values()} == {"delivered"}
+
+
+def test_overlapping_retries_send_each_task_once(fake_firestore, monkeypatch):
+    get_all = fake_firestore.get_all
+    raced = []
+
+    def stale_get_all(refs):
+        # The first read misses tasks that an overlapping request commits right after
+        snapshots = list(get_all(refs))
+        if not raced:
+            raced.append(True)
+            firestore.create_schedules_bulk(3, week(2))
+        return snapshots
+
+    monkeypatch.setattr(fake_firestore, "get_all", stale_get_all)
+    results = firestore.create_schedules_bulk(3, week(3))
+
+    assert [r["status"] for r in results] == ["exists", "exists", "created"]
+    assert sorted(task_id for c in fake_firestore.docs("Outbox").values() for task_id in c["task_ids"]) == [
+        f"schedule_at_2025-11-0{day}_08:00:00" for day in (1, 2, 3)
+    ]
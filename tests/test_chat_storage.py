@@ -0,0 +1,117 @@
+import pytest
+
+from app.services import chat_storage
+
+
+@pytest.fixture
+def chat_db(fake_db, monkeypatch):
+    monkeypatch.setattr(chat_storage, "db", fake_db)
+    chat_storage._tails.clear()
+    yield fake_db
+    chat_storage._tails.clear()
+
+
+def messages(count, start=1):
+    return {f"2025-10-{day:02d}T10-00-00": {"role": "user", "message": str(day)} for day in range(start, start + count)}
+
+
+def test_history_is_a_bounded_query_per_session(chat_db):
+    chat_db.data = {"chat_sessions": {"a": {"messages": messages(30)}, "b": {"messages": messages(2, 40)}}}
+
+    history = chat_storage.load_message("a", limit=10)
+
+    assert [m["message"] for m in history] == [str(day) for day in range(21, 31)]
+    assert chat_db.calls == [("query", "chat_sessions/a/messages")]
+    assert [m["message"] for m in chat_storage.load_message("b")] == ["40", "41"]
+
+
+def test_tail_serves_history_without_reads(chat_db):
+    chat_storage.load_message("a")
+    chat_storage.store_ai_chat("user", "What pH for guppies?", "a")
+    chat_storage.store_ai_chat("ai", "Between 6.8 and 7.8.", "a")
+    chat_storage.store_ai_chat("user", "Other conversation", "b")
+    chat_db.calls.clear()
+
+    history = chat_storage.load_message("a", limit=10)
+
+    assert history == [
+        {"role": "user", "message": "What pH for guppies?"},
+        {"role": "ai", "message": "Between 6.8 and 7.8."},
+    ]
+    assert chat_db.calls == []
+    assert set(chat_db.data["chat_session_index"]) == {"a", "b"}
+
+
+def test_compaction_trims_idle_and_deletes_expired_sessions(chat_db):
+    now = 10_000_000
+    idle = now - chat_storage.SESSION_IDLE_SECONDS - 60
+    chat_db.data = {
+        "chat_sessions": {
+            "old": {"messages": messages(3)},
+            "idle": {"messages": messages(30)},
+            "active": {"messages": messages(30)},
+        },
+        "chat_session_index": {
+            "old": now - chat_storage.SESSION_TTL_SECONDS - 1,
+            "idle": idle,
+            "active": now - 60,
+        },
+        "chat_compact_queue": {"idle": idle, "active": now - 60},
+    }
+
+    result = chat_storage.compact_sessions(now=now)
+
+    assert result == {"expired": 1, "compacted": 1}
+    assert "old" not in chat_db.data["chat_sessions"]
+    assert "old" not in chat_db.data["chat_session_index"]
+    assert len(chat_db.data["chat_sessions"]["idle"]["messages"]) == chat_storage.COMPACT_KEEP
+    assert len(chat_db.data["chat_sessions"]["active"]["messages"]) == 30
+    assert chat_db.data["chat_compact_queue"] == {"active": now - 60}
+
+
+def test_compaction_pages_through_a_backlog_once(chat_db):
+    now = 10_000_000
+    # Idle for days, e.g. after the job missed several runs
+    idle = now - chat_storage.SESSION_IDLE_SECONDS - 5 * 86400
+    chat_db.data = {
+        "chat_sessions": {f"s{n}": {"messages": messages(30)} for n in range(5)},
+        "chat_session_index": {f"s{n}": idle + n for n in range(5)},
+        "chat_compact_queue": {f"s{n}": idle + n for n in range(5)},
+    }
+
+    assert chat_storage.compact_sessions(now=now, batch=2) == {"expired": 0, "compacted": 5}
+    assert all(len(session["messages"]) == chat_storage.COMPACT_KEEP for session in chat_db.data["chat_sessions"].values())
+    assert "chat_compact_queue" not in chat_db.data
+
+    chat_db.calls.clear()
+    assert chat_storage.compact_sessions(now=now + 3600, batch=2) == {"expired": 0, "compacted": 0}
+    assert not any(path.startswith("chat_sessions/") for _, path in chat_db.calls)
+
+
+def test_message_during_compaction_keeps_the_marker(chat_db, monkeypatch):
+    now = 10_000_000
+    idle = now - chat_storage.SESSION_IDLE_SECONDS - 60
+    chat_db.data = {
+        "chat_sessions": {"a": {"messages": messages(30)}},
+        "chat_session_index": {"a": idle},
+        "chat_compact_queue": {"a": idle},
+    }
+    reference = type(chat_db.reference())
+    get = reference.get
+
+    def get_then_reply(self, shallow=False):
+        value = get(self, shallow)
+        if self.path == "chat_sessions/a/messages":
+            chat_storage.store_ai_chat("user", "Still there?", "a")
+        return value
+
+    monkeypatch.setattr(reference, "get", get_then_reply)
+
+    assert chat_storage.compact_sessions(now=now)["compacted"] == 1
+    assert "a" in chat_db.data["chat_compact_queue"]
+
+
+def test_session_ids_must_be_safe_keys():
+    assert chat_storage.is_valid_session_id(chat_storage.new_session_id())
+    assert not chat_storage.is_valid_session_id("a/b")
+    assert not chat_storage.is_valid_session_id("x" * 65)
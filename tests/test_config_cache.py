@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+from app.services.config_cache import AquariumConfigCache
+
+
+def make_cache(**kwargs):
+    loads = []
+
+    def loader(aquarium_id):
+        loads.append(aquarium_id)
+        return {"threshold": {"ph": {"min": 6, "max": 8}}, "notification": {"ph": True}}
+
+    return AquariumConfigCache(loader=loader, **kwargs), loads
+
+
+def test_lru_eviction():
+    cache, loads = make_cache(maxsize=2)
+    cache.get(1)
+    cache.get(2)
+    cache.get(1)
+    cache.get(3)
+
+    cache.get(1)
+    cache.get(2)
+
+    assert loads == [1, 2, 3, 2]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_ttl_expiry():
+    cache, loads = make_cache(ttl=0)
+    cache.get(1)
+    cache.get(1)
+
+    assert loads == [1, 1]
+    assert cache.stats()["hits"] == 0
+
+
+def test_listener_keeps_entry_fresh():
+    callbacks = {}
+
+    class Registration:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    registrations = []
+
+    def subscribe(aquarium_id, on_change):
+        callbacks[aquarium_id] = on_change
+        registrations.append(Registration())
+        return registrations[-1:]
+
+    cache, loads = make_cache(ttl=0, maxsize=1, subscribe=subscribe)
+    cache.get(1)
+    callbacks["1"]("threshold", SimpleNamespace(event_type="put", path="/", data={"ph": {"min": 7, "max": 9}}))
+
+    assert cache.get(1)["threshold"]["ph"]["min"] == 7
+    assert loads == [1]
+
+    callbacks["1"]("threshold", SimpleNamespace(event_type="patch", path="/ph", data={"min": 5}))
+    cache.get(1)
+    assert loads == [1, 1]
+
+    cache.get(2)
+    assert registrations[0].closed
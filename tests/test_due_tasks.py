@@ -0,0 +1,183 @@
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.services import firestore
+from app.services.due_tasks import DueTaskScheduler
+from app.services.outbox import TankPiOutbox
+
+
+def at(seconds):
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def change(kind, task_id, data=None):
+    document = SimpleNamespace(id=task_id, to_dict=lambda: data)
+    return SimpleNamespace(type=SimpleNamespace(name=kind), document=document)
+
+
+class Recorder:
+    def __init__(self, expected):
+        self.fired = []
+        self.superseded = {}
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, task_id, data, superseded):
+        self.fired.append(task_id)
+        self.superseded[task_id] = [other_id for other_id, _ in superseded]
+        if len(self.fired) >= self.expected:
+            self.done.set()
+
+
+class FakeQuery:
+    def __init__(self, changes):
+        self.changes = changes
+        self.unsubscribed = False
+
+    def on_snapshot(self, callback):
+        callback([], self.changes, None)
+        return SimpleNamespace(unsubscribe=lambda: setattr(self, "unsubscribed", True))
+
+
+def test_tasks_fire_in_due_order():
+    recorder = Recorder(expected=3)
+    scheduler = DueTaskScheduler(recorder, timezone="UTC")
+    query = FakeQuery([
+        change("ADDED", "later", {"schedule_time": at(1)}),
+        change("ADDED", "overdue", {"schedule_time": at(-60)}),
+        change("ADDED", "now", {"schedule_time": at(0)}),
+    ])
+    scheduler.start(query)
+
+    assert recorder.done.wait(5)
+    scheduler.stop()
+    assert recorder.fired == ["overdue", "now", "later"]
+    assert query.unsubscribed
+    stats = scheduler.stats()
+    assert stats["pending"] == 0 and stats["ready"]
+
+
+def test_removed_and_rescheduled_tasks_do_not_fire_stale_entries():
+    recorder = Recorder(expected=1)
+    scheduler = DueTaskScheduler(recorder, timezone="UTC")
+    scheduler.apply_changes([
+        change("ADDED", "cancelled", {"schedule_time": at(-1)}),
+        change("ADDED", "moved", {"schedule_time": at(-1)}),
+    ])
+    scheduler.apply_changes([
+        change("REMOVED", "cancelled"),
+        change("MODIFIED", "moved", {"schedule_time": at(3600)}),
+        change("ADDED", "kept", {"schedule_time": at(-1)}),
+    ])
+    scheduler.start(FakeQuery([]))
+
+    assert recorder.done.wait(5)
+    time.sleep(0.05)
+    scheduler.stop()
+    assert recorder.fired == ["kept"]
+    stats = scheduler.stats()
+    assert stats["pending"] == 1 and 3500 < stats["next_due_in_s"] <= 3600
+
+
+def test_invalid_schedule_time_is_skipped():
+    scheduler = DueTaskScheduler(lambda task_id, data, superseded: None, timezone="UTC")
+    scheduler.apply_changes([change("ADDED", "broken", {"schedule_time": "tomorrow"})])
+
+    assert scheduler.stats()["pending"] == 0
+
+
+def test_overdue_tasks_coalesce_per_aquarium():
+    recorder = Recorder(expected=3)
+    scheduler = DueTaskScheduler(recorder, timezone="UTC", grace=60)
+    changes = [change("ADDED", f"a{n}", {"aquarium_id": 1, "schedule_time": at(-3600 * n)}) for n in range(1, 4)]
+    changes += [
+        change("ADDED", "b1", {"aquarium_id": 2, "schedule_time": at(-7200)}),
+        change("ADDED", "a_recent", {"aquarium_id": 1, "schedule_time": at(-5)}),
+    ]
+    scheduler.start(FakeQuery(changes))
+
+    assert recorder.done.wait(5)
+    time.sleep(0.05)
+    scheduler.stop()
+    # Only the latest overdue task of aquarium 1 fires, one within the grace fires as usual
+    assert recorder.fired == ["a1", "b1", "a_recent"]
+    assert recorder.superseded == {"a1": ["a3", "a2"], "b1": [], "a_recent": []}
+    assert scheduler.stats()["coalesced"] == 2
+
+
+def test_large_snapshot_is_heapified_in_order():
+    scheduler = DueTaskScheduler(lambda task_id, data, superseded: None, timezone="UTC")
+    scheduler.apply_changes([change("ADDED", f"t{n}", {"schedule_time": at(3600 + n * 60)}) for n in range(500, 0, -1)])
+
+    assert scheduler.stats()["pending"] == 500
+    assert scheduler._heap[0][1] == "t1"
+
+
+def test_superseded_tasks_are_cancelled_on_the_pi(fake_firestore):
+    for task_id in ["a2", "a3"]:
+        fake_firestore.collection("Schedules").document(task_id).set({"status": "pending", "delivery": "delivered"})
+    fake_firestore.collection("Schedules").document("a1").set({"status": "pending", "delivery": "delivered"})
+
+    firestore.handle_due_task("a1", {"aquarium_id": 1, "delivery": "delivered"}, [("a3", {"aquarium_id": 1}), ("a2", {"aquarium_id": 1})])
+
+    docs = fake_firestore.docs("Schedules")
+    assert docs["a1"]["status"] == "pending"
+    assert docs["a2"]["status"] == docs["a3"]["status"] == "coalesced"
+    commands = fake_firestore.docs("Outbox").values()
+    assert sorted(c["task_id"] for c in commands if c["kind"] == "delete") == ["a2", "a3"]
+
+
+def test_undelivered_task_is_marked_missed(fake_firestore):
+    fake_firestore.collection("Schedules").document("a").set({"status": "pending", "delivery": "retrying"})
+    fake_firestore.collection("Schedules").document("b").set({"status": "pending", "delivery": "delivered"})
+
+    firestore.handle_due_task("a", {"delivery": "retrying"})
+    firestore.handle_due_task("b", {"delivery": "delivered"})
+
+    docs = fake_firestore.docs("Schedules")
+    assert docs["a"]["status"] == "missed"
+    assert docs["b"]["status"] == "pending"
+
+
+def test_missed_task_is_not_delivered_later(fake_firestore):
+    firestore.create_schedule(3, 2, "2025-10-20 08:00:00", "pellets", "3_a")
+    firestore.create_schedules_bulk(3, [
+        {"schedule_time": f"2025-10-2{day} 08:00:00", "cycle": 1, "food": "flakes"} for day in (1, 2)
+    ])
+    deliveries = []
+    outbox = TankPiOutbox(fake_firestore, lambda aquarium_id, commands: deliveries.append(commands) or [False] * len(commands), backoff=10)
+    outbox.drain(now=1e12)
+
+    for document_id in ["schedule_at_2025-10-20_08:00:00", "schedule_at_2025-10-21_08:00:00"]:
+        firestore.handle_due_task(document_id, fake_firestore.docs("Schedules")[document_id])
+    outbox.sender = lambda aquarium_id, commands: deliveries.append(commands) or [True] * len(commands)
+    outbox.drain(now=1e12 + 10)
+
+    assert [c["job_id"] for c in deliveries[-1]] == ["3_schedule_at_2025-10-22 08:00:00"]
+    docs = fake_firestore.docs("Schedules")
+    assert docs["schedule_at_2025-10-20_08:00:00"]["status"] == "missed"
+    assert docs["schedule_at_2025-10-20_08:00:00"]["delivery"] == "retrying"
+    assert fake_firestore.docs("Outbox") == {}
+
+
+def test_task_sent_at_its_due_time_is_not_marked_missed(fake_firestore, monkeypatch):
+    firestore.create_schedule(3, 2, "2025-10-20 08:00:00", "pellets", "3_a")
+    task_id = "schedule_at_2025-10-20_08:00:00"
+    snapshot = fake_firestore.docs("Schedules")[task_id]
+    due = threading.Thread(target=firestore.handle_due_task, args=(task_id, snapshot))
+
+    def send(aquarium_id, commands):
+        # The task comes due while its add is on the way to the Pi
+        due.start()
+        time.sleep(0.1)
+        return [True] * len(commands)
+
+    outbox = TankPiOutbox(fake_firestore, send)
+    monkeypatch.setattr(firestore, "outbox", outbox)
+    outbox.drain()
+    due.join(5)
+
+    task = fake_firestore.docs("Schedules")[task_id]
+    assert task["status"] == "pending" and task["delivery"] == "delivered"
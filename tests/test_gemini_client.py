@@ -0,0 +1,107 @@
+import gc
+import threading
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from app.services.gemini_client import GeminiClient, GeminiUnavailable
+
+
+class FakeModel:
+    def __init__(self, error=None, release=None):
+        self.error = error
+        self.release = release
+        self.options = []
+
+    def generate_content(self, contents, stream=False, request_options=None):
+        self.options.append(request_options)
+        if self.release:
+            self.release.wait(5)
+        if self.error:
+            raise self.error
+        if stream:
+            return iter([SimpleNamespace(text="a"), SimpleNamespace(text="b")])
+        return SimpleNamespace(text="ok")
+
+
+def test_calls_carry_deadline_and_are_counted():
+    client = GeminiClient(timeout=12)
+    model = FakeModel()
+
+    assert client.generate(model, ["hi"]).text == "ok"
+    assert model.options == [{"timeout": 12}]
+    assert client.stats()["successes"] == 1
+    assert client.stats()["in_flight"] == 0
+
+
+def test_rejects_when_budget_is_used_up():
+    client = GeminiClient(max_concurrent=1, queue_wait_ms=10)
+    release = threading.Event()
+    worker = threading.Thread(target=client.generate, args=(FakeModel(release=release), ["slow"]))
+    worker.start()
+    while client.stats()["in_flight"] == 0:
+        pass
+
+    with pytest.raises(GeminiUnavailable) as rejected:
+        client.generate(FakeModel(), ["hi"])
+
+    release.set()
+    worker.join()
+    assert rejected.value.reason == "busy"
+    assert client.stats()["rejected_busy"] == 1
+    assert client.generate(FakeModel(), ["hi"]).text == "ok"
+
+
+def test_circuit_opens_then_recovers_through_one_trial():
+    client = GeminiClient(failure_threshold=2, reset_after=60)
+    failing = FakeModel(error=api_exceptions.ServiceUnavailable("down"))
+
+    for _ in range(2):
+        with pytest.raises(api_exceptions.ServiceUnavailable):
+            client.generate(failing, ["hi"])
+
+    with pytest.raises(GeminiUnavailable) as rejected:
+        client.generate(FakeModel(), ["hi"])
+    assert rejected.value.reason == "circuit_open"
+    assert len(failing.options) == 2
+
+    client._opened_at -= 60
+    assert client.stats()["circuit"] == "half_open"
+    assert client.generate(FakeModel(), ["hi"]).text == "ok"
+    assert client.stats()["circuit"] == "closed"
+
+
+def test_bad_requests_do_not_open_the_circuit():
+    client = GeminiClient(failure_threshold=1)
+
+    with pytest.raises(api_exceptions.InvalidArgument):
+        client.generate(FakeModel(error=api_exceptions.InvalidArgument("bad")), ["hi"])
+
+    assert client.stats()["circuit"] == "closed"
+
+
+def test_stream_holds_its_slot_until_closed():
+    client = GeminiClient(max_concurrent=1, queue_wait_ms=0)
+
+    stream = client.generate(FakeModel(), ["hi"], stream=True)
+    assert next(stream).text == "a"
+    with pytest.raises(GeminiUnavailable):
+        client.generate(FakeModel(), ["hi"])
+
+    stream.close()
+    assert client.stats()["cancelled"] == 1
+    assert client.generate(FakeModel(), ["hi"]).text == "ok"
+
+
+def test_abandoned_stream_releases_its_slot():
+    client = GeminiClient(max_concurrent=1, queue_wait_ms=0)
+
+    stream = client.generate(FakeModel(), ["hi"], stream=True)
+    next(stream)
+    del stream
+    gc.collect()
+
+    assert client.stats()["in_flight"] == 0
+    assert client.stats()["cancelled"] == 1
+    assert client.generate(FakeModel(), ["hi"]).text == "ok"
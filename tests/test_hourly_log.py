@@ -0,0 +1,66 @@
+from app.services import firebase
+
+
+def reading(ph):
+    return {"ph": ph, "temperature": 27.0, "turbidity": 100}
+
+
+def seed(fake_db):
+    fake_db.data = {"aquariums": {"1": firebase.default_aquarium(1)}}
+
+
+def test_slots_wrap_in_place(fake_db):
+    seed(fake_db)
+
+    for hour in range(1, 26):
+        firebase.save_hourly(1, reading(hour))
+
+    hourly = fake_db.data["aquariums"]["1"]["hourly_log"]
+    assert hourly["index"] == 1
+    assert hourly["1"]["ph"] == 25
+    assert hourly["24"]["ph"] == 24
+    assert len([k for k in hourly if k.isdigit()]) == 24
+    assert not any(op == "delete" for op, _ in fake_db.calls)
+
+
+def test_rollover_writes_one_daily_average(fake_db):
+    seed(fake_db)
+
+    for hour in range(1, 25):
+        firebase.save_hourly(1, reading(7.0))
+
+    average = fake_db.data["aquariums"]["1"]["average"]
+    assert average["index"] == 1
+    assert average["1"]["ph"] == 7.0
+
+
+def test_daily_ring_keeps_thirty_days(fake_db):
+    seed(fake_db)
+    fake_db.data["aquariums"]["1"]["average"] = {"index": 30, **{str(i): reading(i) for i in range(1, 31)}}
+    fake_db.data["aquariums"]["1"]["hourly_log"] = {"index": 23, **{str(i): reading(6.0) for i in range(1, 24)}}
+    stats = None
+    for _ in range(23):
+        stats = firebase.fold_reading(stats, reading(6.0))
+    fake_db.data["aquariums"]["1"]["hourly_stats"] = stats
+    fake_db.calls.clear()
+
+    firebase.save_hourly(1, reading(6.0))
+
+    average = fake_db.data["aquariums"]["1"]["average"]
+    assert average["index"] == 1
+    assert average["1"]["ph"] == 6.0
+    assert average["30"]["ph"] == 30
+    assert "hourly_stats" not in fake_db.data["aquariums"]["1"]
+    assert [op for op, _ in fake_db.calls] == ["transaction", "update", "transaction", "transaction", "update"]
+
+
+def test_daily_record_has_min_max_and_std(fake_db):
+    seed(fake_db)
+
+    for hour in range(24):
+        firebase.save_hourly(1, reading(6.0 if hour % 2 else 8.0))
+
+    day = fake_db.data["aquariums"]["1"]["average"]["1"]
+    assert day["ph"] == 7.0
+    assert day["stats"]["ph"] == {"count": 24, "min": 6.0, "max": 8.0, "std": 1.0}
+    assert day["stats"]["temperature"]["std"] == 0
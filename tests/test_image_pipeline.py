@@ -0,0 +1,63 @@
+import io
+import base64
+import pytest
+from PIL import Image, JpegImagePlugin
+from app.services import image_pipeline
+from app.services.image_pipeline import ImageRejected, decode_base64_payload, prepare_image
+
+
+def jpeg(width, height, orientation=None):
+    img = Image.new("RGB", (width, height), (20, 120, 200))
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    output = io.BytesIO()
+    img.save(output, format="JPEG", exif=exif)
+    return output.getvalue()
+
+
+def test_downscales_and_applies_orientation():
+    part = prepare_image(jpeg(4000, 3000, orientation=6), target_size=1024)
+
+    assert part["mime_type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(part["data"])).size == (768, 1024)
+
+
+def test_rejects_oversized_payloads(monkeypatch):
+    monkeypatch.setattr(image_pipeline, "MAX_IMAGE_BYTES", 1000)
+    with pytest.raises(ImageRejected):
+        decode_base64_payload("A" * 2000)
+
+    monkeypatch.setattr(image_pipeline, "MAX_IMAGE_BYTES", 10_000_000)
+    monkeypatch.setattr(image_pipeline, "MAX_IMAGE_PIXELS", 1_000_000)
+    with pytest.raises(ImageRejected):
+        prepare_image(jpeg(2000, 1000))
+
+    with pytest.raises(ImageRejected):
+        prepare_image(b"not an image")
+
+
+def test_accepts_data_urls():
+    encoded = "data:image/jpeg;base64," + base64.b64encode(jpeg(64, 48)).decode()
+
+    part = prepare_image(decode_base64_payload(encoded))
+
+    assert Image.open(io.BytesIO(part["data"])).size == (64, 48)
+
+
+def test_jpeg_is_decoded_at_reduced_scale(monkeypatch):
+    requested = []
+    original = JpegImagePlugin.JpegImageFile.draft
+
+    def spy(self, mode, size):
+        requested.append(size)
+        return original(self, mode, size)
+
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", spy)
+    output = io.BytesIO()
+    Image.new("RGB", (2400, 1800)).save(output, format="JPEG")
+
+    prepare_image(output.getvalue(), target_size=1024)
+
+    # A square (1024, 1024) box would keep the 1800 px side at full scale
+    assert requested[0] == (1024, 768)
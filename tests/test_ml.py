@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+from app.services import firebase
+
+
+def aquarium(aquarium_id, **notifications):
+    return {
+        "aquarium_id": aquarium_id,
+        "ph_notification": notifications.get("ph", True),
+        "temperature_notification": notifications.get("temperature", True),
+        "turbidity_notification": notifications.get("turbidity", True),
+        "thresholds": {
+            "ph": {"min": 6.5, "max": 8.0},
+            "temperature": {"min": 24, "max": 30},
+            "turbidity": {"min": 0, "max": 200},
+        },
+    }
+
+
+def prediction(tank_id, ph=7.0, temperature=26.0, turbidity=100):
+    return {"tank_id": tank_id, "predicted_ph": ph, "predicted_temperature": temperature, "predicted_turbidity": turbidity}
+
+
+@pytest.fixture(autouse=True)
+def empty_suggestion_cache():
+    firebase.suggestion_cache.clear()
+    yield
+    firebase.suggestion_cache.clear()
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    monkeypatch.setattr(firebase, "send_aquanotifier_notification", lambda aquarium_id, text, sensor: sent.append((aquarium_id, sensor, text)))
+    return sent
+
+
+def test_one_gemini_call_per_aquarium(monkeypatch, sent):
+    prompts = []
+    monkeypatch.setattr(firebase, "ask_gemini_suggestions_ml", lambda text: prompts.append(text) or "Check the filter.")
+
+    result = firebase.compare_ml_firebase(
+        [prediction(1, ph=9.0, temperature=31.0), prediction(2)],
+        [aquarium(1), aquarium(2)]
+    )
+
+    assert result == {"notified": ["1"], "failed": {}}
+    assert len(prompts) == 1
+    assert "pH is 6.5-8.0" in prompts[0] and "temperature is 24-30°C" in prompts[0]
+    assert sent == [("1", "pH, Temperature", "Check the filter.")]
+
+
+def test_failures_are_collected_per_aquarium(monkeypatch, sent):
+    def ask(text):
+        if "9.9" in text:
+            raise RuntimeError("Gemini timeout")
+        return "ok"
+
+    monkeypatch.setattr(firebase, "ask_gemini_suggestions_ml", ask)
+
+    result = firebase.compare_ml_firebase(
+        [prediction(1, ph=9.9), prediction(2, ph=9.0)],
+        [aquarium(1), aquarium(2)]
+    )
+
+    assert result["notified"] == ["2"]
+    assert result["failed"] == {"1": "Gemini timeout"}
+
+
+def test_alert_dropped_by_a_full_queue_is_a_failure(monkeypatch):
+    monkeypatch.setattr(firebase, "ask_gemini_suggestions_ml", lambda text: "ok")
+    monkeypatch.setattr(firebase, "send_aquanotifier_notification", lambda aquarium_id, text, sensor: aquarium_id != "1")
+
+    result = firebase.compare_ml_firebase(
+        [prediction(1, ph=9.0), prediction(2, ph=9.0)],
+        [aquarium(1), aquarium(2)]
+    )
+
+    assert result["notified"] == ["2"]
+    assert list(result["failed"]) == ["1"]
+
+
+def test_requests_run_concurrently(monkeypatch, sent):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def ask(text):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return "ok"
+
+    monkeypatch.setattr(firebase, "ask_gemini_suggestions_ml", ask)
+    ids = range(1, 7)
+
+    result = firebase.compare_ml_firebase([prediction(i, ph=9.0) for i in ids], [aquarium(i) for i in ids])
+
+    assert len(result["notified"]) == 6
+    assert 1 < peak[0] <= firebase.ml_suggestion_pool._max_workers
+
+
+def test_similar_predictions_reuse_the_cached_text(monkeypatch, sent):
+    prompts = []
+    monkeypatch.setattr(firebase, "ask_gemini_suggestions_ml", lambda text: prompts.append(text) or "Check the heater.")
+
+    firebase.compare_ml_firebase([prediction(1, temperature=31.0)], [aquarium(1)])
+    firebase.compare_ml_firebase([prediction(1, temperature=31.1)], [aquarium(1)])
+    firebase.compare_ml_firebase([prediction(1, temperature=35.0)], [aquarium(1)])
+    firebase.compare_ml_firebase([prediction(1, temperature=31.0)], [aquarium(1)], use_cache=False)
+
+    assert len(prompts) == 3
+    assert [text for _, _, text in sent] == ["Check the heater."] * 4
+
+
+def test_suggestion_key_separates_direction_and_distance():
+    above = {"sensor": "ph", "min": 6.5, "max": 8.0, "predicted": 8.1}
+    below = {**above, "predicted": 6.4}
+    far = {**above, "predicted": 9.5}
+
+    keys = {firebase.suggestion_key([item]) for item in (above, below, far)}
+
+    assert len(keys) == 3
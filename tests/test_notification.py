@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import notification
+from app.services.notification import NotificationDispatcher
+
+
+class FakeSendEach:
+    def __init__(self, outcomes=()):
+        self.calls = []
+        self.outcomes = list(outcomes)
+
+    def __call__(self, messages):
+        self.calls.append(list(messages))
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        successes = outcome or [True] * len(messages)
+        return SimpleNamespace(responses=[SimpleNamespace(success=s) for s in successes])
+
+
+@pytest.fixture
+def send_each(monkeypatch):
+    fake = FakeSendEach()
+    monkeypatch.setattr(notification.messaging, "send_each", fake)
+    return fake
+
+
+def test_queued_messages_go_out_in_one_batch(send_each):
+    dispatcher = NotificationDispatcher(workers=0)
+    for sensor in ("pH", "Temperature", "Turbidity"):
+        dispatcher.submit(sensor)
+
+    assert dispatcher.stats()["queue_depth"] == 3
+    dispatcher.drain()
+
+    assert send_each.calls == [["pH", "Temperature", "Turbidity"]]
+    assert dispatcher.stats()["sent"] == 3
+
+
+def test_failed_messages_are_retried_with_backoff(send_each):
+    send_each.outcomes = [RuntimeError("unavailable"), [True, False], [True]]
+    dispatcher = NotificationDispatcher(workers=0, backoff=0)
+    dispatcher.submit("a")
+    dispatcher.submit("b")
+
+    dispatcher.drain()
+
+    assert send_each.calls == [["a", "b"], ["a", "b"], ["b"]]
+    stats = dispatcher.stats()
+    assert stats["sent"] == 2
+    assert stats["retries"] == 3
+    assert stats["failed"] == 0
+
+
+def test_full_queue_drops_instead_of_blocking(send_each):
+    dispatcher = NotificationDispatcher(workers=0, max_queue=1)
+
+    assert dispatcher.submit("a") is True
+    assert dispatcher.submit("b") is False
+    assert dispatcher.stats()["dropped"] == 1
+
+
+def test_worker_sends_off_the_calling_thread(send_each):
+    dispatcher = NotificationDispatcher(workers=1, linger_ms=0)
+    dispatcher.submit("a")
+    dispatcher._queue.join()
+
+    assert send_each.calls == [["a"]]
+    dispatcher.stop()
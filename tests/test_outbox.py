@@ -0,0 +1,120 @@
+import time
+
+from app.services import firestore
+from app.services.outbox import TankPiOutbox
+
+
+class FakePi:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.deliveries = []
+
+    def send(self, aquarium_id, commands):
+        self.deliveries.append((aquarium_id, [(c["type"], c.get("job_id") or c.get("document_id")) for c in commands]))
+        return [not self.fail] * len(commands)
+
+
+def outbox_for(store, pi, **settings):
+    return TankPiOutbox(store, pi.send, **settings)
+
+
+def test_task_is_committed_with_its_command(fake_firestore):
+    firestore.create_schedule(3, 2, "2025-10-20 15:30:00", "pellets", "3_schedule_at_2025-10-20 15:30:00")
+
+    task = fake_firestore.docs("Schedules")["schedule_at_2025-10-20_15:30:00"]
+    [command] = fake_firestore.docs("Outbox").values()
+    assert task["delivery"] == "pending"
+    assert command["kind"] == "add" and command["task_id"] == "schedule_at_2025-10-20_15:30:00"
+    assert fake_firestore.commits == 1
+
+
+def test_commands_are_coalesced_per_aquarium(fake_firestore):
+    firestore.create_schedule(3, 2, "2025-10-20 08:00:00", "pellets", "3_a")
+    firestore.create_schedule(3, 1, "2025-10-20 18:00:00", "flakes", "3_b")
+    firestore.create_schedule(4, 1, "2025-10-20 09:00:00", "flakes", "4_a")
+    firestore.delete_schedule_by_id(3, "schedule_at_2025-10-20_18:00:00")
+    pi = FakePi()
+
+    outbox_for(fake_firestore, pi).drain()
+
+    assert sorted(pi.deliveries) == [(3, [("add", "3_a")]), (4, [("add", "4_a")])]
+    assert fake_firestore.docs("Outbox") == {}
+    assert fake_firestore.docs("Schedules")["schedule_at_2025-10-20_08:00:00"]["delivery"] == "delivered"
+
+
+def test_failed_delivery_backs_off_then_gives_up(fake_firestore):
+    firestore.create_schedule(3, 2, "2025-10-20 08:00:00", "pellets", "3_a")
+    pi = FakePi(fail=True)
+    outbox = outbox_for(fake_firestore, pi, backoff=10, max_attempts=2)
+
+    outbox.drain(now=1e12)
+    [command] = fake_firestore.docs("Outbox").values()
+    assert command["attempts"] == 1 and command["next_attempt_at"] == 1e12 + 10
+    assert fake_firestore.docs("Schedules")["schedule_at_2025-10-20_08:00:00"]["delivery"] == "retrying"
+
+    assert outbox.drain(now=1e12 + 5) == 0
+    outbox.drain(now=1e12 + 10)
+
+    [command] = fake_firestore.docs("Outbox").values()
+    assert command["state"] == "failed"
+    assert fake_firestore.docs("Schedules")["schedule_at_2025-10-20_08:00:00"]["delivery"] == "failed"
+    assert len(pi.deliveries) == 2
+
+
+def test_delete_waits_for_its_backed_off_add(fake_firestore):
+    firestore.create_schedule(3, 2, "2025-10-20 08:00:00", "pellets", "3_a")
+    pi = FakePi(fail=True)
+    outbox = outbox_for(fake_firestore, pi, backoff=10)
+    outbox.drain(now=1e12)
+
+    firestore.delete_schedule_by_id(3, "schedule_at_2025-10-20_08:00:00")
+    pi.fail = False
+    outbox.drain(now=1e12 + 1)
+
+    # The delete must not reach the Pi while its add is still backing off
+    assert pi.deliveries == [(3, [("add", "3_a")])]
+
+    outbox.drain(now=1e12 + 10)
+
+    assert pi.deliveries[1:] == [(3, [("add", "3_a"), ("delete", "schedule_at_2025-10-20_08:00:00")])]
+    assert fake_firestore.docs("Outbox") == {}
+
+
+def test_held_commands_do_not_block_other_aquariums(fake_firestore):
+    firestore.create_schedule(3, 2, "2025-10-20 08:00:00", "pellets", "3_a")
+    pi = FakePi(fail=True)
+    outbox = outbox_for(fake_firestore, pi, backoff=10)
+    outbox.drain(now=1e12)
+
+    firestore.create_schedule(3, 1, "2025-10-20 18:00:00", "flakes", "3_b")
+    firestore.create_schedule(4, 1, "2025-10-20 09:00:00", "flakes", "4_a")
+    pi.fail = False
+    outbox.drain(now=1e12 + 1)
+
+    assert pi.deliveries[1:] == [(4, [("add", "4_a")])]
+    held = [c for c in fake_firestore.docs("Outbox").values() if c["task_id"] == "schedule_at_2025-10-20_18:00:00"]
+    assert held[0]["next_attempt_at"] == 1e12 + 10
+
+
+def test_worker_sleeps_until_the_next_retry(fake_firestore):
+    firestore.create_schedule(3, 2, "2025-10-20 08:00:00", "pellets", "3_a")
+    pi = FakePi(fail=True)
+    outbox = outbox_for(fake_firestore, pi, backoff=0.2, max_attempts=2)
+
+    outbox.start()
+    deadline = time.time() + 2
+    while len(pi.deliveries) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(pi.deliveries) == 2
+    assert outbox.next_attempt_at() is None
+
+    drains = []
+    drain = outbox.drain
+    outbox.drain = lambda now=None: drains.append(now) or drain(now)
+    time.sleep(0.3)
+    assert drains == []
+
+    outbox.notify()
+    time.sleep(0.1)
+    outbox.stop()
+    assert len(drains) == 1
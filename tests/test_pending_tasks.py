@@ -0,0 +1,45 @@
+import pytest
+
+from app.services import firestore
+
+
+def seed(store, count, aquarium_id=3):
+    tasks = store.docs("Schedules")
+    for n in range(count):
+        tasks[f"schedule_at_2025-10-{n % 28 + 1:02d}_{n:04d}"] = {
+            "aquarium_id": aquarium_id, "cycle": 1, "food": "pellets", "status": "pending",
+            "schedule_time": f"2025-10-{n % 28 + 1:02d} 08:00:00", "delivery": "delivered",
+        }
+    tasks["done"] = {"aquarium_id": aquarium_id, "status": "done", "schedule_time": "2025-10-01 00:00:00"}
+
+
+def test_pages_cover_every_pending_task_in_order(fake_firestore):
+    seed(fake_firestore, 45)
+
+    seen, cursor = [], None
+    while True:
+        page = firestore.get_scheduler_aquarium(3, page_size=20, start_after=cursor)
+        assert len(page["tasks"]) <= 20
+        seen += page["tasks"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(seen) == 45
+    assert len({task["document_id"] for task in seen}) == 45
+    assert [t["schedule_time"] for t in seen] == sorted(t["schedule_time"] for t in seen)
+
+
+def test_projection_and_empty_result(fake_firestore):
+    seed(fake_firestore, 2)
+
+    page = firestore.get_scheduler_aquarium(3, fields=["cycle"])
+    assert set(page["tasks"][0]) == {"cycle", "document_id"}
+    assert page["next_cursor"] is None
+
+    assert firestore.get_scheduler_aquarium(99) == {"tasks": [], "next_cursor": None}
+
+    with pytest.raises(ValueError):
+        firestore.get_scheduler_aquarium(3, fields=["secret"])
+    with pytest.raises(ValueError):
+        firestore.get_scheduler_aquarium(3, start_after="not-a-cursor")
@@ -0,0 +1,53 @@
+import pytest
+
+from app.services import firebase
+
+
+def feeding(time, cycle=2):
+    return {"time": time, "cycle": cycle, "switch": True, "food": "pellets"}
+
+
+def test_schedule_operations_touch_one_key(fake_db):
+    fake_db.data = {"aquariums": {"3": {"auto_feeder": {"schedule": {"07:00": feeding("07:00")}}}}}
+
+    assert firebase.add_schedule_firebase(3, feeding("8:30"))["status"] == "added"
+    assert firebase.add_schedule_firebase(3, feeding("08:30", cycle=5))["status"] == "duplicate"
+    assert firebase.change_cycle_schedule_firebase(3, "08:30", 4)["status"] == "updated"
+    assert firebase.set_on_off_schedule_firebase(3, False, "08:30")["status"] == "updated"
+    assert firebase.set_daily_schedule_firebase(3, True, "09:00")["status"] == "not_found"
+
+    schedule = fake_db.data["aquariums"]["3"]["auto_feeder"]["schedule"]
+    assert schedule["08:30"] == {"time": "08:30", "cycle": 4, "switch": False, "food": "pellets"}
+    assert "09:00" not in schedule
+    assert ("get", "aquariums/3/auto_feeder/schedule") not in fake_db.calls
+    assert fake_db.calls.count(("shallow", "aquariums/3/auto_feeder/schedule")) == 1
+
+    assert firebase.delete_schedule_firebase(3, "08:30")["status"] == "deleted"
+    assert firebase.delete_schedule_firebase(3, "08:30")["status"] == "not_found"
+    assert "08:30" not in fake_db.data["aquariums"]["3"]["auto_feeder"]["schedule"]
+    assert firebase.change_cycle_schedule_firebase(3, "08:30", 1)["status"] != "updated"
+
+    with pytest.raises(ValueError):
+        firebase.add_schedule_firebase(3, feeding("25:00"))
+
+
+def test_push_id_schedules_are_migrated_on_first_use(fake_db):
+    fake_db.data = {"aquariums": {"3": {"auto_feeder": {"schedule": {
+        "-push000001": feeding("8:00"),
+        "-push000002": feeding("18:00", cycle=3),
+        "-push000003": feeding("08:00", cycle=9),
+    }}}}}
+
+    assert firebase.change_cycle_schedule_firebase(3, "18:00", 1)["status"] == "updated"
+
+    schedule = fake_db.data["aquariums"]["3"]["auto_feeder"]["schedule"]
+    assert set(schedule) == {"08:00", "18:00"}
+    assert schedule["08:00"]["cycle"] == 2
+    assert schedule["18:00"]["cycle"] == 1
+    assert firebase.get_schedule_firebase(3)["status"] == "success"
+
+
+def test_migrating_an_aquarium_without_schedules(fake_db):
+    fake_db.data = {"aquariums": {"3": {"auto_feeder": {}}}}
+
+    assert firebase.migrate_schedule_keys(3) == 0
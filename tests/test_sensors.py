@@ -0,0 +1,122 @@
+import pytest
+
+from app.services import firebase
+
+
+READING = {"ph": 9.1, "temperature": 27.5, "turbidity": 120}
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    monkeypatch.setattr(firebase, "send_fcm_notification", lambda aquarium_id, sensor: sent.append((aquarium_id, sensor)))
+    return sent
+
+
+def seed_aquarium(fake_db, aquarium_id=1):
+    aquarium = firebase.default_aquarium(aquarium_id)
+    aquarium["notification"].update({"ph": True, "temperature": True, "turbidity": True})
+    aquarium["threshold"] = {
+        "ph": {"min": 6.5, "max": 8.0},
+        "temperature": {"min": 24, "max": 30},
+        "turbidity": {"min": 0, "max": 200},
+    }
+    aquarium["hourly_log"].update({str(i): READING for i in range(1, 24)})
+    fake_db.data = {"aquariums": {str(aquarium_id): aquarium}}
+
+
+def test_ingest_uses_one_read_and_one_write(fake_db, sent):
+    seed_aquarium(fake_db)
+
+    alerts = firebase.ingest_sensors(1, READING)
+
+    assert alerts == ["pH"]
+    assert sent == [(1, "pH")]
+    # The first config load of a process also seeds threshold_index
+    assert fake_db.calls == [("query", "aquariums/1"), ("set", "threshold_index/1"), ("update", "aquariums/1")]
+    assert fake_db.data["aquariums"]["1"]["sensors"] == READING
+    assert fake_db.data["aquariums"]["1"]["notification"]["state_flag"]["ph"] is True
+
+
+def test_ingest_initializes_new_aquarium(fake_db, sent):
+    firebase.ingest_sensors(7, READING)
+
+    aquarium = fake_db.data["aquariums"]["7"]
+    assert aquarium["sensors"] == READING
+    assert aquarium["name"] == "New Aquarium 7"
+    assert aquarium["aquarium_id"] == 7
+    assert sent == []
+    assert [op for op, _ in fake_db.calls] == ["query", "get", "transaction", "update"]
+
+
+def test_initialize_reads_only_the_marker(fake_db):
+    seed_aquarium(fake_db)
+
+    firebase.initialize_data_firebase(1)
+    firebase.initialize_data_firebase(1)
+
+    assert fake_db.calls == [("get", "aquariums/1/aquarium_id")]
+
+
+def test_initialize_does_not_clobber_a_concurrent_create(fake_db, monkeypatch):
+    seed_aquarium(fake_db)
+    fake_db.data["aquariums"]["1"]["name"] = "Reef"
+    original = firebase.FirebaseReference.get_ref
+
+    def stale_get_ref(self, sub_path=""):
+        ref = original(self, sub_path)
+        if sub_path == "aquarium_id":
+            # Another first post created the aquarium after our marker read
+            ref.get = lambda: None
+        return ref
+
+    monkeypatch.setattr(firebase.FirebaseReference, "get_ref", stale_get_ref)
+
+    firebase.initialize_data_firebase(1)
+
+    assert fake_db.data["aquariums"]["1"]["name"] == "Reef"
+    assert [op for op, _ in fake_db.calls] == ["transaction"]
+
+
+def test_flag_resets_when_back_in_range(fake_db, sent):
+    seed_aquarium(fake_db)
+    firebase.ingest_sensors(1, READING)
+    firebase.ingest_sensors(1, {**READING, "ph": 7.0})
+
+    assert sent == [(1, "pH")]
+    assert fake_db.data["aquariums"]["1"]["notification"]["state_flag"]["ph"] is False
+
+
+def test_cached_config_skips_the_read(fake_db, sent):
+    seed_aquarium(fake_db)
+    firebase.ingest_sensors(1, READING)
+    fake_db.calls.clear()
+    hits = firebase.config_cache.stats()["hits"]
+
+    firebase.ingest_sensors(1, READING)
+
+    assert [op for op, _ in fake_db.calls] == ["update"]
+    assert sent == [(1, "pH")]
+    assert firebase.config_cache.stats()["hits"] == hits + 1
+
+
+def test_batch_writes_all_aquariums_in_one_update(fake_db, sent):
+    seed_aquarium(fake_db, 1)
+    aquariums = fake_db.data["aquariums"]
+    seed_aquarium(fake_db, 2)
+    fake_db.data["aquariums"].update(aquariums)
+    firebase.ingest_sensors_batch([{"aquarium_id": 1, **READING}, {"aquarium_id": 2, **READING}])
+    fake_db.calls.clear()
+
+    results = firebase.ingest_sensors_batch([
+        {"aquarium_id": 1, **READING, "ph": 7.0},
+        {"aquarium_id": 2, **READING, "ph": 7.1},
+        {"aquarium_id": 2, **READING, "ph": 9.5},
+        {"aquarium_id": 3, "ph": "high"},
+    ])
+
+    assert fake_db.calls == [("update", "aquariums")]
+    assert [r["status"] for r in results] == ["ok", "superseded", "ok", "error"]
+    assert fake_db.data["aquariums"]["1"]["notification"]["state_flag"]["ph"] is False
+    assert fake_db.data["aquariums"]["2"]["sensors"]["ph"] == 9.5
+    assert sent == [(1, "pH"), (2, "pH")]
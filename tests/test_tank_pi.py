@@ -0,0 +1,53 @@
+import httpx
+import pytest
+
+from app.services.tank_pi import TankPiClient
+
+
+def mocked(handler):
+    pi = TankPiClient("https://pi.test", connect_timeout=1, read_timeout=2)
+    pi._client = httpx.Client(base_url=pi.base_url, timeout=pi.timeout, transport=httpx.MockTransport(handler))
+    return pi
+
+
+def test_dispatches_share_one_client():
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.path, request.extensions["timeout"]["read"]))
+        return httpx.Response(200, json={"status": "queued"})
+
+    pi = mocked(handler)
+    client = pi.client
+    pi.add_task(3, {"job_id": "a"})
+    pi.delete_task(3, {"document_id": "a"})
+
+    assert pi.client is client
+    assert seen == [("/3/add_task", 2), ("/3/delete_task", 2)]
+    assert pi.stats()["requests"] == 2
+
+
+def test_hung_pi_times_out_and_is_counted():
+    def handler(request):
+        raise httpx.ReadTimeout("Pi did not answer", request=request)
+
+    pi = mocked(handler)
+
+    with pytest.raises(httpx.TimeoutException):
+        pi.add_task(3, {"job_id": "a"})
+
+    assert pi.stats()["timeouts"] == 1
+
+
+def test_commands_stop_at_first_failure_without_batch_endpoint():
+    def handler(request):
+        return httpx.Response(503 if request.url.path == "/3/delete_task" else 200)
+
+    pi = mocked(handler)
+    commands = [{"type": "add", "job_id": "a"}, {"type": "delete", "document_id": "b"}, {"type": "add", "job_id": "c"}]
+
+    assert pi.send_commands(3, commands) == [True, False, False]
+
+    batched = mocked(lambda request: httpx.Response(200 if request.url.path == "/3/tasks/batch" else 404))
+    batched.batch_endpoint = True
+    assert batched.send_commands(3, commands) == [True, True, True]
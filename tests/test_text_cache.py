@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.text_cache import TextCache
+
+
+def test_lru_and_ttl():
+    cache = TextCache(maxsize=2, ttl=60)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats()["evictions"] == 1
+
+    expired = TextCache(ttl=0)
+    expired.put("a", "1")
+    assert expired.get("a") is None
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "suggestions.json")
+    TextCache(path=path).put("ph:6.5-8.0:above:1", "Check the water.", cost_ms=900)
+
+    restored = TextCache(path=path)
+
+    assert restored.get("ph:6.5-8.0:above:1") == "Check the water."
+    assert restored.stats()["latency_saved_ms"] == 900
+
+
+def test_concurrent_puts_keep_the_file_loadable(tmp_path):
+    path = str(tmp_path / "suggestions.json")
+    cache = TextCache(path=path)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda n: cache.put(f"key:{n}", "x" * 2000), range(200)))
+
+    restored = TextCache(path=path)
+
+    assert restored.stats()["size"] == 200
+    assert [p.name for p in tmp_path.iterdir()] == ["suggestions.json"]
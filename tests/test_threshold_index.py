@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+from app.services import firebase
+
+
+def seed(fake_db):
+    enabled = firebase.default_aquarium(1)
+    enabled["notification"]["ph"] = True
+    enabled["threshold"]["ph"] = {"min": 6.5, "max": 8.0}
+    enabled["hourly_log"].update({str(i): {"ph": 7} for i in range(1, 25)})
+    fake_db.data = {"aquariums": {"1": enabled, "2": firebase.default_aquarium(2)}}
+
+
+def test_rebuild_and_fleet_read_touch_only_compact_nodes(fake_db):
+    seed(fake_db)
+
+    firebase.rebuild_threshold_index()
+    fake_db.calls.clear()
+    active = firebase.get_firebase_thresholds()
+
+    assert fake_db.calls == [("get", "threshold_index")]
+    assert active == [{
+        "aquarium_id": 1,
+        "ph_notification": True,
+        "temperature_notification": False,
+        "turbidity_notification": False,
+        "thresholds": fake_db.data["aquariums"]["1"]["threshold"],
+    }]
+
+
+def test_missing_index_is_rebuilt_without_full_scan(fake_db):
+    seed(fake_db)
+
+    active = firebase.get_firebase_thresholds()
+
+    assert [a["aquarium_id"] for a in active] == [1]
+    assert set(fake_db.data["threshold_index"]) == {"1", "2"}
+    assert ("get", "aquariums") not in fake_db.calls
+
+
+def test_config_loads_keep_the_index_current(fake_db):
+    seed(fake_db)
+    firebase.load_ingest_config(1)
+    firebase.config_cache.clear()
+    firebase.load_ingest_config(1)
+
+    assert fake_db.calls.count(("set", "threshold_index/1")) == 1
+
+    fake_db.data["aquariums"]["1"]["threshold"]["ph"]["max"] = 7.5
+    firebase.config_cache.clear()
+    firebase.load_ingest_config(1)
+
+    assert fake_db.data["threshold_index"]["1"]["threshold"]["ph"]["max"] == 7.5
+
+
+def test_listener_changes_reach_the_index(fake_db):
+    seed(fake_db)
+    cache = firebase.AquariumConfigCache(
+        loader=firebase.load_and_index_config,
+        on_update=firebase.sync_threshold_index
+    )
+    cache.get(1)
+
+    cache._on_change("1", "threshold", SimpleNamespace(event_type="put", path="/", data={"ph": {"min": 6.0, "max": 7.0}}))
+    assert fake_db.data["threshold_index"]["1"]["threshold"]["ph"]["max"] == 7.0
+
+    fake_db.data["aquariums"]["1"]["notification"]["ph"] = False
+    cache._on_change("1", "notification", SimpleNamespace(event_type="put", path="/ph", data=False))
+    assert fake_db.data["threshold_index"]["1"]["notification"]["ph"] is False
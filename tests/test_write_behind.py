@@ -0,0 +1,91 @@
+import pytest
+
+from app.services import firebase
+from app.services.write_behind import SensorWriteBuffer
+
+
+class Writer:
+    def __init__(self, fail=0):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, updates):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("RTDB unavailable")
+        self.batches.append(updates)
+
+
+def test_latest_reading_wins_and_flushes_in_one_update():
+    writer = Writer()
+    buffer = SensorWriteBuffer(writer, flush_interval_ms=60_000)
+
+    buffer.put(1, {"sensors": {"ph": 7.0}})
+    buffer.put(1, {"sensors": {"ph": 7.2}, "notification/state_flag/ph": True})
+    buffer.put(2, {"sensors": {"ph": 6.8}})
+
+    assert buffer.latest(1, "sensors") == {"ph": 7.2}
+    assert buffer.flush() == 3
+    assert writer.batches == [{
+        "1/sensors": {"ph": 7.2},
+        "1/notification/state_flag/ph": True,
+        "2/sensors": {"ph": 6.8},
+    }]
+    assert buffer.stats()["coalesced"] == 1
+    buffer.stop()
+
+
+def test_failed_flush_keeps_newer_values():
+    writer = Writer(fail=1)
+    buffer = SensorWriteBuffer(writer, flush_interval_ms=60_000)
+
+    buffer.put(1, {"sensors": {"ph": 7.0}})
+    buffer.flush()
+    buffer.put(1, {"sensors": {"ph": 7.5}})
+    buffer.flush()
+
+    assert writer.batches == [{"1/sensors": {"ph": 7.5}}]
+    assert buffer.stats()["failures"] == 1
+    buffer.stop()
+
+
+def test_bounds_and_shutdown_flush():
+    writer = Writer()
+    buffer = SensorWriteBuffer(writer, flush_interval_ms=60_000, max_size=2)
+
+    buffer.put(1, {"sensors": {"ph": 7.0}})
+    assert writer.batches == []
+    buffer.put(2, {"sensors": {"ph": 7.0}})
+    assert len(writer.batches) == 1
+
+    buffer.put(3, {"sensors": {"ph": 7.0}})
+    buffer.stop()
+    assert writer.batches[-1] == {"3/sensors": {"ph": 7.0}}
+
+
+@pytest.fixture
+def buffered(fake_db, monkeypatch):
+    buffer = SensorWriteBuffer(firebase.write_aquariums, flush_interval_ms=60_000)
+    monkeypatch.setattr(firebase, "sensor_buffer", buffer)
+    yield buffer
+    buffer.stop()
+
+
+def test_alerts_fire_on_every_buffered_reading(fake_db, buffered, monkeypatch):
+    sent = []
+    monkeypatch.setattr(firebase, "send_fcm_notification", lambda aquarium_id, sensor: sent.append(sensor))
+    aquarium = firebase.default_aquarium(1)
+    aquarium["notification"]["ph"] = True
+    aquarium["threshold"]["ph"] = {"min": 6.5, "max": 8.0}
+    fake_db.data = {"aquariums": {"1": aquarium}}
+
+    firebase.ingest_sensors(1, {"ph": 9.0, "temperature": 0, "turbidity": 0})
+    firebase.ingest_sensors(1, {"ph": 7.0, "temperature": 0, "turbidity": 0})
+    firebase.ingest_sensors(1, {"ph": 9.5, "temperature": 0, "turbidity": 0})
+
+    assert sent == ["pH", "pH"]
+    assert fake_db.calls == [("query", "aquariums/1"), ("set", "threshold_index/1")]
+
+    buffered.flush()
+    assert fake_db.data["aquariums"]["1"]["sensors"]["ph"] == 9.5
+    assert fake_db.data["aquariums"]["1"]["notification"]["state_flag"]["ph"] is True